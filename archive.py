@@ -0,0 +1,137 @@
+import json
+import logging
+from datetime import date
+
+from db import HOURS_TABLES, archive_attached, refresh_rollups
+
+ARCHIVE_BATCH_ROWS = 5000
+VACUUM_PAGES = 2000
+
+IDS = "(SELECT value FROM json_each(?))"
+
+
+def archive_bounds(today, after_months):
+    # первый месяц, который ещё остаётся в основной базе, и ISO-неделя его первого дня:
+    # всё строго раньше — закрытые периоды, их можно переносить
+    index = today.year * 12 + today.month - 1 - after_months
+    first = date(index // 12, index % 12 + 1, 1)
+    return {"week": tuple(first.isocalendar()[:2]), "month": (first.year, first.month)}
+
+
+def copy_batch(conn, table, period, bound, limit):
+    # Шаг 1 — копия в архив. Удаление идёт отдельной транзакцией: в WAL коммит в две базы
+    # не атомарен, и сбой между шагами должен оставить дубль (его уберёт следующий проход), а не потерю.
+    ids = [row_id for (row_id,) in conn.execute(
+        f"SELECT id FROM main.{table} WHERE (year, {period}) < (?, ?) ORDER BY year, {period} LIMIT ?",
+        (*bound, limit))]
+    if ids:
+        conn.execute(f"""
+            INSERT OR REPLACE INTO archive.{table} (id, user_id, year, {period}, hours)
+            SELECT id, user_id, year, {period}, hours FROM main.{table} WHERE id IN {IDS}
+        """, (json.dumps(ids),))
+    return ids
+
+
+def drop_batch(conn, table, period, ids):
+    # Шаг 2 — удаление из основной базы строк, совпадающих с архивной копией. Строки, которые успели
+    # изменить между шагами, остаются на месте, а их устаревшая копия из архива удаляется.
+    ids = json.dumps(ids)
+    periods = conn.execute(f"SELECT DISTINCT year, {period} FROM main.{table} WHERE id IN {IDS}", (ids,)).fetchall()
+    moved = conn.execute(f"""
+        DELETE FROM main.{table} WHERE id IN {IDS}
+        AND hours IS (SELECT a.hours FROM archive.{table} a WHERE a.id = {table}.id)
+    """, (ids,)).rowcount
+    conn.execute(f"DELETE FROM archive.{table} WHERE id IN {IDS} AND id IN (SELECT id FROM main.{table})", (ids,))
+    # триггеры уже вычли перенесённые строки из сводок — пересчитываем эти периоды по обоим уровням
+    refresh_rollups(conn, periods if period == "week" else (), periods if period == "month" else ())
+    return moved
+
+
+def import_archived(conn, table, period, values):
+    # Строки /import за периоды, которые уже лежат в архиве, обновляются прямо там, иначе период
+    # оказался бы в обоих уровнях. Возвращает ключи, обработанные здесь, и число изменённых строк.
+    if not values or not archive_attached(conn) or not conn.execute(
+            f"SELECT 1 FROM archive.{table} LIMIT 1").fetchone():
+        return set(), 0
+    conn.execute("""CREATE TEMP TABLE IF NOT EXISTS import_keys (
+        user_id INTEGER, year INTEGER, period INTEGER, PRIMARY KEY (user_id, year, period)) WITHOUT ROWID""")
+    conn.execute("DELETE FROM import_keys")
+    conn.executemany("INSERT INTO import_keys (user_id, year, period) VALUES (?, ?, ?)", values.keys())
+    archived = set(conn.execute(f"""
+        SELECT k.user_id, k.year, k.period FROM import_keys k
+        JOIN archive.{table} a ON a.user_id = k.user_id AND a.year = k.year AND a.{period} = k.period
+    """))
+    if not archived:
+        return archived, 0
+    updated = conn.executemany(
+        f"UPDATE archive.{table} SET hours = ? WHERE user_id = ? AND year = ? AND {period} = ? AND hours IS NOT ?",
+        [(values[key], *key, values[key]) for key in archived]).rowcount
+    if updated:
+        periods = {(year, value) for _, year, value in archived}
+        refresh_rollups(conn, periods if period == "week" else (), periods if period == "month" else ())
+    return archived, updated
+
+
+def delete_archived(conn, user_id):
+    # часы удалённого пользователя удаляются и из архива
+    if not archive_attached(conn):
+        return
+    stale = {}
+    for table, period in HOURS_TABLES.items():
+        stale[period] = conn.execute(f"SELECT DISTINCT year, {period} FROM archive.{table} WHERE user_id = ?",
+                                     (user_id,)).fetchall()
+        conn.execute(f"DELETE FROM archive.{table} WHERE user_id = ?", (user_id,))
+    if stale["week"] or stale["month"]:
+        refresh_rollups(conn, stale["week"], stale["month"])
+
+
+def enable_incremental_vacuum(conn):
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    conn.execute("VACUUM")
+
+
+def vacuum_step(conn, pages):
+    conn.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+    return conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+
+class Archiver:
+    # Холодный уровень: закрытые периоды старше after_months месяцев переезжают из основной базы
+    # в архив (Database(archive_path=...)) порциями по batch_rows строк — между порциями писатель
+    # свободен для хендлеров. Освободившиеся страницы возвращаются incremental vacuum'ом, так что
+    # основной файл остаётся маленьким и целиком в кэше. Историю читают представления *_all.
+
+    def __init__(self, db, after_months, batch_rows=ARCHIVE_BATCH_ROWS, metrics=None):
+        self.db = db
+        self.after_months = after_months
+        self.batch_rows = batch_rows
+        self.metrics = metrics
+        if metrics is not None:
+            metrics.describe("archive_rows_total", "Строки часов, перенесённые в архив")
+
+    async def run(self, today=None):
+        if not self.after_months or not self.db.archive_path:
+            return 0
+        bounds = archive_bounds(today or date.today(), self.after_months)
+        moved = 0
+        for table, period in HOURS_TABLES.items():
+            while True:
+                ids = await self.db.run_write(copy_batch, table, period, bounds[period], self.batch_rows)
+                if not ids:
+                    break
+                count = await self.db.run_write(drop_batch, table, period, ids)
+                moved += count
+                if self.metrics is not None:
+                    self.metrics.inc("archive_rows_total", count, table=table)
+        if moved:
+            logging.info("Archived %d rows older than %d months", moved, self.after_months)
+            await self.vacuum()
+        return moved
+
+    async def vacuum(self):
+        if (await self.db.fetchone("PRAGMA auto_vacuum"))[0] != 2:
+            # база создана до архива: один полный VACUUM переводит её в incremental-режим
+            await self.db.run_write(enable_incremental_vacuum)
+            return
+        while await self.db.run_write(vacuum_step, VACUUM_PAGES):
+            pass
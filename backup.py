@@ -0,0 +1,189 @@
+import argparse
+import asyncio
+import glob
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+BACKUP_PAGES = 256
+BACKUP_SLEEP = 0.005
+MAX_RESTARTS = 3
+# больше Bot API не принимает документом
+MAX_DOCUMENT_BYTES = 50 * 1024 * 1024
+COUNTED_TABLES = ("users", "weekly_hours", "monthly_hours")
+
+
+class Restarted(Exception):
+    pass
+
+
+def copy_database(source, target, pages=BACKUP_PAGES, sleep=BACKUP_SLEEP):
+    # Копия через backup API из отдельного read-only соединения, по pages страниц с паузой между шагами.
+    # Запись в базу из другого соединения перезапускает такую копию с начала, поэтому при частых
+    # записях после MAX_RESTARTS перезапусков база копируется за один шаг: в WAL это одна читающая
+    # транзакция, писатели её не ждут.
+    src = sqlite3.connect(Path(source).resolve().as_uri() + "?mode=ro", uri=True)
+    dst = sqlite3.connect(target)
+    remaining = [None, 0]
+
+    def progress(status, left, total):
+        if remaining[0] is not None and left > remaining[0]:
+            remaining[1] += 1
+            if remaining[1] > MAX_RESTARTS:
+                raise Restarted()
+        remaining[0] = left
+
+    try:
+        try:
+            src.backup(dst, pages=pages, progress=progress, sleep=sleep)
+        except Restarted:
+            src.backup(dst, pages=-1)
+        # снимок должен открываться без -wal рядом
+        dst.execute("PRAGMA journal_mode=DELETE")
+        return remaining[1]
+    finally:
+        dst.close()
+        src.close()
+
+
+def compress(path, target):
+    with open(path, "rb") as src, gzip.open(target, "wb", compresslevel=6) as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+
+
+def verify_snapshot(path):
+    # Проверка восстановления: распаковываем во временный файл, открываем как обычную базу,
+    # прогоняем integrity_check и считаем строки. Возвращает {таблица: строк}.
+    with tempfile.TemporaryDirectory() as tmp:
+        restored = os.path.join(tmp, "restored.db")
+        with gzip.open(path, "rb") as src, open(restored, "wb") as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        conn = sqlite3.connect(restored)
+        try:
+            check = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+            if check != ["ok"]:
+                raise ValueError(f"{os.path.basename(path)}: {'; '.join(check[:5])}")
+            tables = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            if not tables & set(COUNTED_TABLES):
+                raise ValueError(f"{os.path.basename(path)}: нет таблиц бота")
+            return {table: conn.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+                    for table in COUNTED_TABLES if table in tables}
+        finally:
+            conn.close()
+
+
+def snapshot_prefix(db_path):
+    return Path(db_path).stem + "-"
+
+
+def list_snapshots(directory, db_path):
+    # новые в конце: в имени метка времени
+    return sorted(glob.glob(os.path.join(glob.escape(directory), glob.escape(snapshot_prefix(db_path)) + "*.db.gz")))
+
+
+def make_snapshot(db_path, directory, stamp, pages=BACKUP_PAGES):
+    os.makedirs(directory, exist_ok=True)
+    target = os.path.join(directory, f"{snapshot_prefix(db_path)}{stamp}.db.gz")
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        copy, packed = os.path.join(tmp, "copy.db"), os.path.join(tmp, "copy.db.gz")
+        restarts = copy_database(db_path, copy, pages)
+        compress(copy, packed)
+        counts = verify_snapshot(packed)
+        # снимок, не прошедший проверку, не виден ни ротации, ни /backup
+        os.replace(packed, target)
+    return target, restarts, counts
+
+
+class Backups:
+    # Снимки основной базы и архива: раз в сутки по расписанию и по /backup now. Копия и сжатие идут
+    # в отдельном потоке, event loop и писатель БД не блокируются. Хранится keep последних снимков
+    # каждой базы, каждый свежий снимок сразу проверяется восстановлением (verify_snapshot).
+
+    def __init__(self, db, directory, keep=7, pages=BACKUP_PAGES, metrics=None):
+        self.db = db
+        self.directory = directory
+        self.keep = keep
+        self.pages = pages
+        self.metrics = metrics
+        self._lock = asyncio.Lock()
+        if metrics is not None:
+            metrics.describe("backups_total", "Снимки базы по результату")
+            metrics.describe("backup_seconds", "Время создания и проверки снимка")
+
+    def sources(self):
+        paths = [self.db.path]
+        if self.db.archive_path and os.path.exists(self.db.archive_path):
+            paths.append(self.db.archive_path)
+        return paths
+
+    def latest(self):
+        snapshots = [list_snapshots(self.directory, path) for path in self.sources()]
+        return [items[-1] for items in snapshots if items]
+
+    async def run(self):
+        async with self._lock:
+            stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+            created = []
+            for path in self.sources():
+                started = time.perf_counter()
+                try:
+                    snapshot, restarts, counts = await asyncio.to_thread(make_snapshot, path, self.directory,
+                                                                         stamp, self.pages)
+                except Exception:
+                    self._count("failed")
+                    logging.exception("Backup of %s failed", path)
+                    raise
+                self._count("ok")
+                if self.metrics is not None:
+                    self.metrics.observe("backup_seconds", time.perf_counter() - started)
+                logging.info("Backup %s: %s (restarts: %d)", snapshot, counts, restarts)
+                created.append(snapshot)
+                for old in list_snapshots(self.directory, path)[:-self.keep]:
+                    os.remove(old)
+            return created
+
+    def _count(self, result):
+        if self.metrics is not None:
+            self.metrics.inc("backups_total", result=result)
+
+
+def main():
+    # python backup.py verify [снимок ...] — проверить, что снимки восстанавливаются (по умолчанию все в --dir)
+    # python backup.py restore <снимок> <файл> — распаковать снимок в файл базы (бот должен быть остановлен)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=("verify", "restore"))
+    parser.add_argument("paths", nargs="*")
+    parser.add_argument("--dir", default=os.getenv("BACKUP_DIR", "backups"))
+    args = parser.parse_args()
+
+    if args.command == "restore":
+        if len(args.paths) != 2:
+            parser.error("restore <снимок> <файл базы>")
+        snapshot, target = args.paths
+        counts = verify_snapshot(snapshot)
+        if os.path.exists(target):
+            parser.error(f"{target} уже существует")
+        with gzip.open(snapshot, "rb") as src, open(target, "wb") as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        print(f"restored {snapshot} -> {target}: {counts}")
+        return
+
+    failed = 0
+    for path in args.paths or sorted(glob.glob(os.path.join(glob.escape(args.dir), "*.db.gz"))):
+        try:
+            print(f"ok     {path}: {verify_snapshot(path)}")
+        except (ValueError, OSError, EOFError, sqlite3.Error) as e:
+            failed += 1
+            print(f"FAILED {path}: {e}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
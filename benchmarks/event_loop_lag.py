@@ -0,0 +1,87 @@
+# Проверка, что работа с БД не блокирует event loop:
+# N виртуальных пользователей одновременно вводят часы за неделю,
+# параллельно измеряется максимальная задержка срабатывания таймера в loop.
+#
+# Обновления приходят пачками по --batch штук с интервалом --interval-ms, как при getUpdates в aiogram.
+#
+#   python benchmarks/event_loop_lag.py --users 1000 --budget-ms 50
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import Database, INSERT_WEEK_HOURS
+
+TICK = 0.001
+
+
+async def monitor_lag(stop, samples):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(TICK)
+        samples.append(loop.time() - started - TICK)
+
+
+async def submit_week_hours(db, user_id, year, week_num):
+    await db.submit("INSERT OR REPLACE INTO users (user_id, first_name, last_name) VALUES (?, ?, ?)",
+                     (user_id, f"Имя{user_id}", f"Фамилия{user_id}"))
+    existing_data = await db.fetchone("""
+        SELECT hours FROM weekly_hours 
+        WHERE user_id = ? AND year = ? AND week = ?
+    """, (user_id, year, week_num))
+    if existing_data:
+        return
+    await db.submit(INSERT_WEEK_HOURS, (user_id, year, week_num, 40.0))
+
+
+async def run(users, batch, interval, budget_ms):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, "bench.db"))
+        await db.connect()
+        year, week_num, _ = datetime.now().isocalendar()
+
+        stop = asyncio.Event()
+        samples = []
+        monitor = asyncio.create_task(monitor_lag(stop, samples))
+        started = time.perf_counter()
+        tasks = []
+        for offset in range(0, users, batch):
+            tasks.extend(asyncio.create_task(submit_week_hours(db, 1000 + i, year, week_num))
+                         for i in range(offset, min(offset + batch, users)))
+            await asyncio.sleep(interval)
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await monitor
+
+        count = await db.fetchone("SELECT COUNT(*) FROM weekly_hours")
+        commits = db.commits
+        await db.close()
+
+    samples.sort()
+    worst_ms = samples[-1] * 1000 if samples else 0.0
+    p99_ms = samples[int(len(samples) * 0.99)] * 1000 if samples else 0.0
+    print(f"users={users} rows={count[0]} commits={commits} elapsed={elapsed:.2f}s")
+    print(f"loop lag: p99={p99_ms:.2f}ms max={worst_ms:.2f}ms budget={budget_ms}ms")
+    return worst_ms <= budget_ms
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--batch", type=int, default=100)
+    parser.add_argument("--interval-ms", type=float, default=20.0)
+    parser.add_argument("--budget-ms", type=float, default=50.0)
+    args = parser.parse_args()
+    ok = asyncio.run(run(args.users, args.batch, args.interval_ms / 1000, args.budget_ms))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# Скорость /import на файле в формате /export и задержка event loop во время разбора.
+# Файл строится из временной базы с --rows записями часов, затем разбирается так же, как в боте
+# (parse_upload в отдельном процессе), и применяется одной транзакцией на чистой копии схемы.
+#
+#   python benchmarks/import_speed.py --rows 100000 --format xlsx
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bulk_import import IMPORT_FORMATS, apply_import, parse_upload
+from db import Database
+from export import ExportQuery, build_export
+from registry import UserRegistry
+from repository import SQLiteRepository
+
+
+async def fill(db, rows, users):
+    await db.executemany("INSERT INTO users (user_id, first_name, last_name) VALUES (?, ?, ?)",
+                         [(uid, f"Имя{uid}", f"Фамилия{uid}") for uid in range(1, users + 1)])
+    weeks = [(uid, 2000 + i // 52, i % 52 + 1, 40.0)
+             for i in range(rows // users // 2 + 1) for uid in range(1, users + 1)][:rows // 2]
+    months = [(uid, 2000 + i // 12, i % 12 + 1, 160.0)
+              for i in range(rows // users // 2 + 1) for uid in range(1, users + 1)][:rows - len(weeks)]
+    await db.executemany("INSERT INTO weekly_hours (user_id, year, week, hours) VALUES (?, ?, ?, ?)", weeks)
+    await db.executemany("INSERT INTO monthly_hours (user_id, year, month, hours) VALUES (?, ?, ?, ?)", months)
+
+
+async def main(args):
+    tmp = tempfile.mkdtemp()
+    source = Database(os.path.join(tmp, "source.db"))
+    await source.connect()
+    await fill(source, args.rows, args.users)
+    await source.close()
+    _, data = build_export(source.path, ExportQuery(fmt=args.format))
+    path = os.path.join(tmp, f"import.{args.format}")
+    with open(path, "wb") as f:
+        f.write(data)
+
+    # импортируем в базу с теми же пользователями, но без часов: все строки — вставки
+    target = Database(os.path.join(tmp, "target.db"))
+    await target.connect()
+    await target.executemany("INSERT INTO users (user_id, first_name, last_name) VALUES (?, ?, ?)",
+                             [(uid, f"Имя{uid}", f"Фамилия{uid}") for uid in range(1, args.users + 1)])
+    registry = UserRegistry()
+    await registry.load(SQLiteRepository(target))
+
+    lags = []
+
+    async def ticker():
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(0.01)
+            lags.append(time.perf_counter() - started - 0.01)
+
+    tick = asyncio.create_task(ticker())
+    started = time.perf_counter()
+    parsed = await parse_upload(path, args.format, registry.items())
+    parsed_at = time.perf_counter()
+    result = await target.run_write(apply_import, parsed)
+    applied_at = time.perf_counter()
+    tick.cancel()
+    await target.close()
+
+    lags.sort()
+    print(f"format={args.format} rows={parsed.rows} file={len(data) // 1024} KB")
+    print(f"parse+validate {parsed_at - started:.2f}s, apply {applied_at - parsed_at:.2f}s, "
+          f"total {applied_at - started:.2f}s")
+    print(f"inserted={result.inserted} updated={result.updated} rejected={parsed.rejected}")
+    print(f"loop lag p99={lags[int(len(lags) * 0.99)] * 1000:.1f} ms max={lags[-1] * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--format", choices=IMPORT_FORMATS, default="xlsx")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,244 @@
+# Нагрузочный тест бота целиком: локальная заглушка Bot API (getUpdates/sendMessage/sendDocument и др.),
+# бот работает в режиме long polling против неё, N виртуальных пользователей проходят сценарий
+# /start -> имя -> фамилия -> /week N -> /month N -> /weekchange -> часы -> /history, админ периодически
+# вызывает /users, /export и /stats. Задержка — от выдачи обновления в getUpdates до ответа бота.
+#
+#   python benchmarks/loadtest.py --users 1000
+#
+# С --storage memory пользователи, часы и состояния FSM хранятся в памяти (MemoryRepository):
+# разница с прогоном на sqlite — стоимость хранилища, остаток — накладные расходы хендлеров и aiogram.
+#
+# Результаты дописываются в --results (jsonl) и сравниваются с предыдущим запуском того же хранилища.
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict, deque
+from datetime import datetime
+
+from aiohttp import web
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+TOKEN = "123456:loadtest"
+ADMIN_ID = 1
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "TimeBot", "username": "timebot"}
+
+
+class FakeBotAPI:
+    def __init__(self):
+        self.updates = deque()
+        self.new_updates = asyncio.Event()
+        self.update_id = 0
+        self.message_id = 0
+        self.delivered_at = {}
+        self.inboxes = defaultdict(asyncio.Queue)
+        self.calls = defaultdict(int)
+
+    def push(self, chat_id, text):
+        self.update_id += 1
+        self.message_id += 1
+        user = {"id": chat_id, "is_bot": False, "first_name": f"user{chat_id}"}
+        self.updates.append({"update_id": self.update_id, "message": {
+            "message_id": self.message_id, "date": int(time.time()), "text": text,
+            "chat": {"id": chat_id, "type": "private"}, "from": user,
+        }})
+        self.new_updates.set()
+
+    def _message(self, chat_id, **extra):
+        self.message_id += 1
+        return {"message_id": self.message_id, "date": int(time.time()),
+                "chat": {"id": int(chat_id), "type": "private"}, **extra}
+
+    async def handle(self, request):
+        method = request.match_info["method"].lower()
+        self.calls[method] += 1
+        data = await request.post()
+        if method == "getupdates":
+            timeout = min(float(data.get("timeout", 0) or 0), 1.0)
+            if not self.updates:
+                self.new_updates.clear()
+                try:
+                    await asyncio.wait_for(self.new_updates.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            batch = []
+            now = time.perf_counter()
+            limit = int(data.get("limit", 100) or 100)
+            while self.updates and len(batch) < limit:
+                update = self.updates.popleft()
+                self.delivered_at[update["update_id"]] = now
+                batch.append(update)
+            result = batch
+        elif method == "getme":
+            result = BOT_USER
+        elif method in ("sendmessage", "editmessagetext"):
+            chat_id = int(data["chat_id"])
+            self.inboxes[chat_id].put_nowait((time.perf_counter(), method, data.get("text", "")))
+            result = self._message(chat_id, text=data.get("text", ""))
+        elif method == "senddocument":
+            chat_id = int(data["chat_id"])
+            self.inboxes[chat_id].put_nowait((time.perf_counter(), method, ""))
+            result = self._message(chat_id, document={"file_id": "doc", "file_unique_id": "doc"})
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+
+async def say(api, stats, chat_id, command, text, timeout):
+    api.push(chat_id, text)
+    update_id = api.update_id
+    try:
+        replied_at, _, _ = await asyncio.wait_for(api.inboxes[chat_id].get(), timeout)
+    except asyncio.TimeoutError:
+        stats["timeouts"][command] += 1
+        return
+    stats["latency"][command].append(replied_at - api.delivered_at[update_id])
+
+
+async def virtual_user(api, stats, chat_id, ramp, timeout):
+    await asyncio.sleep(random.uniform(0, ramp))
+    script = [
+        ("/start", "/start"),
+        ("name", f"Имя{chat_id}"),
+        ("surname", f"Фамилия{chat_id}"),
+        ("/week", "/week 40"),
+        ("/month", "/month 160"),
+        ("/weekchange", "/weekchange"),
+        ("hours_edit", "38"),
+        ("/history", "/history"),
+    ]
+    for command, text in script:
+        await say(api, stats, chat_id, command, text, timeout)
+
+
+async def admin(api, stats, rounds, interval, timeout):
+    for _ in range(rounds):
+        await asyncio.sleep(interval)
+        await say(api, stats, ADMIN_ID, "/users", "/users", timeout)
+        await say(api, stats, ADMIN_ID, "/export", "/export", timeout)
+        await say(api, stats, ADMIN_ID, "/stats", "/stats", timeout)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] * 1000 if values else None
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args):
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    tmp = tempfile.mkdtemp()
+    os.environ.update(API_TOKEN=TOKEN, ADMIN_IDS=str(ADMIN_ID))
+
+    api = FakeBotAPI()
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", api.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+
+    import logging
+    logging.disable(logging.WARNING)
+    import bot as timebot
+
+    # планировщик и outbox не запускаются: меряем только обработку апдейтов
+    app = timebot.create_app(db_path=os.path.join(tmp, "loadtest.db"), api_url=f"http://127.0.0.1:{port}",
+                             storage=args.storage)
+    await app.start()
+    polling = asyncio.create_task(app.run_polling())
+
+    stats = {"latency": defaultdict(list), "timeouts": defaultdict(int)}
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(virtual_user(api, stats, 10_000 + i, args.ramp, args.timeout) for i in range(args.users)),
+        admin(api, stats, args.admin_rounds, args.ramp / max(args.admin_rounds, 1), args.timeout),
+    )
+    elapsed = time.perf_counter() - started
+
+    polling.cancel()
+    await asyncio.gather(polling, return_exceptions=True)
+    await app.stop()
+    commits = app.db.commits
+    await runner.cleanup()
+
+    handled = sum(len(v) for v in stats["latency"].values())
+    result = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "users": args.users,
+        "storage": args.storage,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_ups": round(handled / elapsed, 1),
+        "db_commits": commits,
+        "timeouts": dict(stats["timeouts"]),
+        "commands": {
+            command: {
+                "count": len(values),
+                "p50_ms": round(percentile(values, 0.50), 2),
+                "p95_ms": round(percentile(values, 0.95), 2),
+                "p99_ms": round(percentile(values, 0.99), 2),
+            }
+            for command, values in stats["latency"].items()
+        },
+    }
+    return result
+
+
+def report(result, previous):
+    print(f"revision={result['revision']} storage={result['storage']} users={result['users']} "
+          f"elapsed={result['elapsed_s']}s "
+          f"throughput={result['throughput_ups']} updates/s db_commits={result['db_commits']}")
+    if result["timeouts"]:
+        print(f"timeouts: {result['timeouts']}")
+    print(f"{'command':<12} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}  {'Δp95 vs prev':>12}")
+    for command, row in result["commands"].items():
+        delta = ""
+        if previous and command in previous["commands"]:
+            delta = f"{row['p95_ms'] - previous['commands'][command]['p95_ms']:+.2f}"
+        print(f"{command:<12} {row['count']:>6} {row['p50_ms']:>9} {row['p95_ms']:>9} {row['p99_ms']:>9}  {delta:>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--ramp", type=float, default=5.0, help="секунд на подключение всех пользователей")
+    parser.add_argument("--admin-rounds", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--storage", choices=("sqlite", "memory"), default="sqlite")
+    parser.add_argument("--results", default=os.path.join(ROOT, "benchmarks", "results", "loadtest.jsonl"))
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    previous = None
+    if os.path.exists(args.results):
+        with open(args.results, encoding="utf-8") as f:
+            lines = [line for line in f if line.strip()]
+        # сравниваем с прошлым прогоном на том же хранилище (старые записи — sqlite)
+        runs = [json.loads(line) for line in lines]
+        runs = [entry for entry in runs if entry.get("storage", "sqlite") == args.storage]
+        if runs:
+            previous = runs[-1]
+    report(result, previous)
+    os.makedirs(os.path.dirname(args.results), exist_ok=True)
+    with open(args.results, "a", encoding="utf-8") as f:
+        f.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# Время импорта bot.py и create_app() и занятая память (max RSS) в свежем процессе.
+# Каждый замер — отдельный интерпретатор, чтобы не мешали кэши уже загруженных модулей.
+#
+#   python benchmarks/startup.py --runs 5
+#
+# Результаты дописываются в --results (jsonl) и сравниваются с предыдущим запуском.
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, resource, sys, time
+started = time.perf_counter()
+import bot
+imported = time.perf_counter()
+app = bot.create_app(db_path=sys.argv[1])
+created = time.perf_counter()
+heavy = [name for name in ("pandas", "numpy", "openpyxl", "apscheduler") if name in sys.modules]
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "create_app_ms": (created - imported) * 1000,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "modules": len(sys.modules),
+    "heavy_modules": heavy,
+}))
+"""
+
+
+def probe():
+    env = dict(os.environ, API_TOKEN="123456:startup", ADMIN_IDS="1")
+    # create_app() не должен создавать файл БД — проверяем это несуществующим путём
+    db_path = os.path.join(ROOT, "benchmarks", "startup-probe.db")
+    output = subprocess.check_output([sys.executable, "-c", PROBE, db_path], cwd=ROOT, env=env, text=True)
+    result = json.loads(output.strip().splitlines()[-1])
+    result["db_created"] = os.path.exists(db_path)
+    if result["db_created"]:
+        os.remove(db_path)
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--results", default=os.path.join(ROOT, "benchmarks", "results", "startup.jsonl"))
+    args = parser.parse_args()
+
+    runs = [probe() for _ in range(args.runs)]
+    result = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "runs": args.runs,
+        "import_ms": round(statistics.median(r["import_ms"] for r in runs), 1),
+        "create_app_ms": round(statistics.median(r["create_app_ms"] for r in runs), 1),
+        "max_rss_mb": round(statistics.median(r["max_rss_mb"] for r in runs), 1),
+        "modules": runs[-1]["modules"],
+        "heavy_modules": runs[-1]["heavy_modules"],
+        "db_created": any(r["db_created"] for r in runs),
+    }
+
+    previous = None
+    if os.path.exists(args.results):
+        with open(args.results, encoding="utf-8") as f:
+            lines = [line for line in f if line.strip()]
+        if lines:
+            previous = json.loads(lines[-1])
+    for key in ("import_ms", "create_app_ms", "max_rss_mb", "modules"):
+        delta = f"  ({result[key] - previous[key]:+.1f} vs {previous['revision']})" if previous else ""
+        print(f"{key:<14} {result[key]}{delta}")
+    print(f"heavy modules loaded at startup: {', '.join(result['heavy_modules']) or 'none'}")
+    print(f"database touched by create_app(): {'yes' if result['db_created'] else 'no'}")
+
+    os.makedirs(os.path.dirname(args.results), exist_ok=True)
+    with open(args.results, "a", encoding="utf-8") as f:
+        f.write(json.dumps(result, ensure_ascii=False) + "\n")
+    if result["heavy_modules"] or result["db_created"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,57 +1,101 @@
 import asyncio
 import logging
+import tempfile
+import time
 from aiogram import types
 
-import sqlite3
-import pandas as pd
-from datetime import datetime, timedelta
-from aiogram import Bot, Dispatcher
+from datetime import datetime, timedelta, timezone
+from aiogram import Bot, Dispatcher, Router
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
+from aiogram.fsm.storage.base import StorageKey
 from aiogram.fsm.storage.memory import MemoryStorage
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.triggers.cron import CronTrigger
-from aiogram.types import Message
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram import F
 import os
 from aiogram.filters import Command
-from aiogram.types import FSInputFile
+from aiogram.types import BufferedInputFile, FSInputFile
 from aiogram.types import BotCommand
+from aiogram.utils.backoff import Backoff, BackoffConfig
 from dotenv import load_dotenv
+from db import Database
+from broadcast import Broadcaster
+from fsm_storage import SQLiteStorage
+from export import ExportCache, EXPORT_USAGE, parse_export_args
+from report import REPORT_USAGE, build_report, parse_report_args, render_report
+from archive import Archiver
+from backup import Backups, MAX_DOCUMENT_BYTES
+from bulk_import import IMPORT_USAGE, import_format, parse_upload, apply_import, render_import
+from registry import UserRegistry
+from history import (HISTORY_MONTHS, HISTORY_WEEKS, NEWEST, WEEKCHANGE_USAGE, HistoryCache, parse_cursor,
+                     parse_week, render_month_page, render_week_page, weeks_ago)
+from repository import Repository, SQLiteRepository, MemoryRepository
+from outbox import Outbox
+from webhook import WebhookServer
+from lanes import POLLING_BATCH, UpdateLanes
+from leader import LeaderElection, SQLiteLease
+from metrics import Metrics, HandlerTimer, MetricsServer
+from reminders import ReminderQueue, DEFAULT_REMIND_AT, due_times, parse_remind_at, parse_timezone
 load_dotenv()
 API_TOKEN = os.getenv("API_TOKEN")
 ADMIN_IDS = list(map(int, os.getenv("ADMIN_IDS", "").split(",")))
-
-logging.basicConfig(level=logging.INFO)
-bot = Bot(token=API_TOKEN)
-storage = MemoryStorage()
-dp = Dispatcher(storage=storage)
-
-conn = sqlite3.connect('bot_database.db', check_same_thread=False)
-cur = conn.cursor()
-cur.execute('''CREATE TABLE IF NOT EXISTS users (
-    user_id INTEGER PRIMARY KEY,
-    first_name TEXT,
-    last_name TEXT
-)''')
-cur.execute('''CREATE TABLE IF NOT EXISTS weekly_hours (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    user_id INTEGER,
-    year INTEGER,
-    week INTEGER,
-    hours REAL,
-    UNIQUE(user_id, year, week),
-    FOREIGN KEY(user_id) REFERENCES users(user_id)
-)''')
-cur.execute('''CREATE TABLE IF NOT EXISTS monthly_hours (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    user_id INTEGER,
-    year INTEGER,
-    month INTEGER,
-    hours REAL,
-    UNIQUE(user_id, year, month),
-    FOREIGN KEY(user_id) REFERENCES users(user_id)
-)''')
-conn.commit()
+# адрес Bot API, например локальный telegram-bot-api или заглушка из benchmarks/loadtest.py
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+REMINDER_FOLLOWUP_HOURS = float(os.getenv("REMINDER_FOLLOWUP_HOURS", "24"))
+REMINDER_WINDOW_MINUTES = int(os.getenv("REMINDER_WINDOW_MINUTES", "60"))
+REMINDER_CATCHUP_HOURS = float(os.getenv("REMINDER_CATCHUP_HOURS", "48"))
+# BOT_MODE=webhook: обновления приходят на локальный aiohttp-сервер вместо long polling.
+# WEBHOOK_SECRET обязателен: запросы без заголовка с ним отклоняются, без него бот в этом режиме не запустится.
+# Без WEBHOOK_URL вебхук в Telegram не регистрируется — удобно для локальной проверки POST-запросами:
+#   curl -X POST localhost:8080/webhook -H 'X-Telegram-Bot-Api-Secret-Token: <WEBHOOK_SECRET>' -d @update.json
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+# Обновления одного пользователя обрабатываются по очереди, разных — параллельно (см. lanes.py):
+# UPDATE_WORKERS воркеров и до UPDATE_QUEUE_SIZE ожидающих обновлений на лёгкие апдейты,
+# HEAVY_WORKERS / HEAVY_QUEUE_SIZE — на тяжёлые админские команды, UPDATE_PER_USER — на пользователя.
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", "32"))
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", "1000"))
+HEAVY_WORKERS = int(os.getenv("HEAVY_WORKERS", "2"))
+HEAVY_QUEUE_SIZE = int(os.getenv("HEAVY_QUEUE_SIZE", "10"))
+UPDATE_PER_USER = int(os.getenv("UPDATE_PER_USER", "20"))
+POLLING_TIMEOUT = 30
+# Несколько реплик (BOT_MODE=webhook за балансировщиком, общий DB_PATH) выбирают лидера арендой
+# в общем файле LEASE_PATH: напоминания, outbox, архив и резервные копии выполняет только он.
+# Другая реплика перехватывает аренду через LEADER_TTL секунд после падения лидера.
+LEADER_TTL = float(os.getenv("LEADER_TTL", "30"))
+# METRICS_PORT включает HTTP-эндпоинт /metrics в формате Prometheus
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+DEFAULT_TIMEZONE = (parse_timezone(os.getenv("DEFAULT_TIMEZONE")) if os.getenv("DEFAULT_TIMEZONE")
+                    else datetime.now().astimezone().tzinfo)
+
+DB_PATH = os.getenv("DB_PATH", "bot_database.db")
+# Часы за периоды старше ARCHIVE_AFTER_MONTHS месяцев раз в сутки переносятся в ARCHIVE_PATH;
+# /export и /report видят оба файла. ARCHIVE_AFTER_MONTHS=0 отключает перенос.
+ARCHIVE_PATH = os.getenv("ARCHIVE_PATH", os.path.splitext(DB_PATH)[0] + "_archive.db")
+ARCHIVE_AFTER_MONTHS = int(os.getenv("ARCHIVE_AFTER_MONTHS", "12"))
+# Аренда лидера лежит в отдельном файле, чтобы её продление не ждало записей в DB_PATH
+LEASE_PATH = os.getenv("LEASE_PATH", os.path.splitext(DB_PATH)[0] + "_lease.db")
+# Сжатые снимки баз раз в сутки; хранятся BACKUP_KEEP последних. Проверка: python backup.py verify
+BACKUP_DIR = os.getenv("BACKUP_DIR", "backups")
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "7"))
+# Где лежат пользователи и часы: sqlite — в DB_PATH, memory — в памяти процесса (для тестов и замеров,
+# вместе с состояниями FSM; /export, /report и /import в этом режиме недоступны)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sqlite")
+# /weekchange принимает текущую и WEEK_EDIT_WEEKS прошедших недель; более ранние правит админ через /import
+WEEK_EDIT_WEEKS = int(os.getenv("WEEK_EDIT_WEEKS", "4"))
+
+# Импорт модуля ничего не открывает и не подключает: обработчики регистрируются в router,
+# а Bot, Dispatcher, БД и планировщик создаёт create_app(). Зависимости приходят в обработчики
+# через workflow_data диспетчера (repo, registry, export_cache, history_cache, metrics, backups, app).
+# С пользователями и часами хендлеры работают только через repo (repository.Repository).
+router = Router()
 
 class Register(StatesGroup):
     waiting_for_name = State()
@@ -63,12 +107,10 @@ class InputHours(StatesGroup):
     waiting_for_week_hours_edit = State()
 
 
-@dp.message(Command("start"))
-async def cmd_start(message: types.Message, state: FSMContext):
+@router.message(Command("start"))
+async def cmd_start(message: types.Message, state: FSMContext, repo: Repository, registry: UserRegistry):
     user_id = message.from_user.id
-    cur = conn.cursor()
-    cur.execute("SELECT first_name, last_name FROM users WHERE user_id=?", (user_id,))
-    user = cur.fetchone()
+    user = await registry.fetch(repo, user_id)
     if user:
         first_name, last_name = user
         await message.answer(f"Привет, {first_name}! Вы уже зарегистрированы в системе.")
@@ -76,43 +118,64 @@ async def cmd_start(message: types.Message, state: FSMContext):
         await message.answer("Здравствуйте! Пожалуйста, представьтесь – введите ваше имя:")
         await state.set_state(Register.waiting_for_name)
 
-@dp.message(Command("notify"))
-async def manual_notify(message: Message):
+async def reject_unregistered(message: Message, registry: UserRegistry, repo: Repository):
+    # и "зарегистрирован", и "нет" берутся из кэша, пока ответ не старше registry.ttl
+    if await registry.fetch(repo, message.from_user.id):
+        return False
+    await message.answer("❗ Вы ещё не зарегистрированы. Отправьте /start, чтобы представиться.")
+    return True
+
+async def reject_without_sql(message: Message, repo: Repository):
+    # выгрузка, отчёт и импорт — SQL-запросы прямо по файлу базы, другим хранилищам они недоступны
+    if repo.db is not None:
+        return False
+    await message.answer("⛔ Команда работает только с хранилищем SQLite (STORAGE_BACKEND=sqlite).")
+    return True
+
+@router.message(Command("notify"))
+async def manual_notify(message: Message, app: "App"):
     if message.from_user.id not in ADMIN_IDS:
         await message.answer("⛔ У вас нет прав на выполнение этой команды.")
         return
-    await send_weekly_prompt()
-    await send_monthly_prompt()
-    await message.answer("✅ Уведомления отправлены пользователям.")
+    status = await message.answer("📢 Рассылка напоминаний начата...")
+
+    async def report(title, result):
+        await status.edit_text(f"📢 {title}: обработано {result.processed}/{result.total}, "
+                               f"доставлено {result.delivered}, ошибок {result.failed}")
+
+    tag = f"notify{message.message_id}"
+    weekly = await app.send_weekly_prompt(on_progress=lambda result: report("Недельное напоминание", result), tag=tag)
+    monthly = await app.send_monthly_prompt(on_progress=lambda result: report("Месячное напоминание", result), tag=tag)
+    await status.edit_text(
+        "✅ Уведомления отправлены пользователям.\n"
+        f"Неделя: доставлено {weekly.delivered}/{weekly.total}, ошибок {weekly.failed}\n"
+        f"Месяц: доставлено {monthly.delivered}/{monthly.total}, ошибок {monthly.failed}")
 
 
-@dp.message(Command("week"))
-async def manual_week_hours(message: Message, state: FSMContext):
+@router.message(Command("week"))
+async def manual_week_hours(message: Message, state: FSMContext, repo: Repository, registry: UserRegistry,
+                            history_cache: HistoryCache):
+    if await reject_unregistered(message, registry, repo):
+        return
     user_id = message.from_user.id
     now = datetime.now()
     year, week_num, _ = now.isocalendar()
 
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT hours FROM weekly_hours 
-        WHERE user_id = ? AND year = ? AND week = ?
-    """, (user_id, year, week_num))
-    existing_data = cur.fetchone()
+    existing_hours = await repo.get_week_hours(user_id, year, week_num)
 
-    if existing_data:
+    if existing_hours is not None:
         await message.answer(
-            f"⛔ Вы уже ввели {existing_data[0]} часов за эту неделю ({week_num}-я неделя {year} года).")
+            f"⛔ Вы уже ввели {existing_hours} часов за эту неделю ({week_num}-я неделя {year} года).")
         return
 
     parts = message.text.split(maxsplit=1)
 
     if len(parts) == 2 and parts[1].isdigit():
         hours = float(parts[1])
-        cur.execute("""
-            INSERT INTO weekly_hours (user_id, year, week, hours) 
-            VALUES (?, ?, ?, ?)
-        """, (user_id, year, week_num, hours))
-        conn.commit()
+        if not await repo.add_week_hours(user_id, year, week_num, hours):
+            await message.answer(f"⛔ Вы уже ввели часы за эту неделю ({week_num}-я неделя {year} года).")
+            return
+        history_cache.invalidate(user_id)
         await message.answer(f"✅ Записано {hours} часов за текущую неделю ({week_num}-я неделя {year} года).")
         return
 
@@ -121,32 +184,29 @@ async def manual_week_hours(message: Message, state: FSMContext):
     await state.update_data(target_year=year, target_week=week_num)
 
 
-@dp.message(Command("month"))
-async def manual_month_hours(message: Message, state: FSMContext):
+@router.message(Command("month"))
+async def manual_month_hours(message: Message, state: FSMContext, repo: Repository, registry: UserRegistry,
+                             history_cache: HistoryCache):
+    if await reject_unregistered(message, registry, repo):
+        return
     user_id = message.from_user.id
     now = datetime.now()
     year, month = now.year, now.month
 
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT hours FROM monthly_hours 
-        WHERE user_id = ? AND year = ? AND month = ?
-    """, (user_id, year, month))
-    existing_data = cur.fetchone()
+    existing_hours = await repo.get_month_hours(user_id, year, month)
 
-    if existing_data:
-        await message.answer(f"⛔ Вы уже ввели {existing_data[0]} часов за этот месяц ({month:02d}.{year}).")
+    if existing_hours is not None:
+        await message.answer(f"⛔ Вы уже ввели {existing_hours} часов за этот месяц ({month:02d}.{year}).")
         return
 
     parts = message.text.split(maxsplit=1)
 
     if len(parts) == 2 and parts[1].isdigit():
         hours = float(parts[1])
-        cur.execute("""
-            INSERT INTO monthly_hours (user_id, year, month, hours) 
-            VALUES (?, ?, ?, ?)
-        """, (user_id, year, month, hours))
-        conn.commit()
+        if not await repo.add_month_hours(user_id, year, month, hours):
+            await message.answer(f"⛔ Вы уже ввели часы за этот месяц ({month:02d}.{year}).")
+            return
+        history_cache.invalidate(user_id)
         await message.answer(f"✅ Записано {hours} часов за текущий месяц ({month:02d}.{year}).")
         return
 
@@ -154,37 +214,38 @@ async def manual_month_hours(message: Message, state: FSMContext):
     await state.set_state(InputHours.waiting_for_month_hours)
     await state.update_data(target_year=year, target_month=month)
 
-@dp.message(Register.waiting_for_name)
+@router.message(Register.waiting_for_name)
 async def process_name(message: types.Message, state: FSMContext):
     await state.update_data(first_name=message.text.strip())
     await message.answer("Спасибо! Теперь введите вашу фамилию:")
     await state.set_state(Register.waiting_for_surname)
 
-@dp.message(Register.waiting_for_surname)
-async def process_surname(message: types.Message, state: FSMContext):
+@router.message(Register.waiting_for_surname)
+async def process_surname(message: types.Message, state: FSMContext, repo: Repository, registry: UserRegistry):
     data = await state.get_data()
     first_name = data.get("first_name", "").strip()
     last_name = message.text.strip()
     user_id = message.from_user.id
-    cur = conn.cursor()
-    cur.execute("INSERT OR REPLACE INTO users (user_id, first_name, last_name) VALUES (?, ?, ?)",
-                (user_id, first_name, last_name))
-    conn.commit()
+    await repo.save_user(user_id, first_name, last_name)
+    registry.set(user_id, first_name, last_name)
     await state.clear()
     await message.answer(f"Спасибо, {first_name}! Вы зарегистрированы. "
                          f"Бот будет напоминать вам вводить рабочие часы каждую неделю и месяц."
                          f"Для того чтобы узнать больше, введи /help")
 
 
-@dp.message(Command("help"))
+@router.message(Command("help"))
 async def cmd_help(message: Message):
     help_text = (
         "🤖 *Этот бот помогает собирать данные о ваших рабочих часах.*\n\n"
         "📌 /start – регистрация в системе\n"
         "📌 /help – показать справку по командам\n"
         "📌 /week – ввести рабочие часы за неделю (если ещё не введены)\n"
-        "📌 /weekchange – изменить рабочие часы за текущую неделю\n"
+        "📌 /weekchange [неделя] – изменить рабочие часы за текущую или недавнюю неделю (например, 2025-W12)\n"
         "📌 /month – ввести запланированные часы на месяц (если ещё не введены)\n"
+        "📌 /history – ваши введённые недели и месяцы, итоги по сравнению с планом\n"
+        "📌 /timezone <зона> – ваш часовой пояс для напоминаний (например, Europe/Moscow)\n"
+        "📌 /remindtime <ЧЧ:ММ> – время, в которое приходят напоминания\n"
     )
 
     if message.from_user.id in ADMIN_IDS:
@@ -192,10 +253,15 @@ async def cmd_help(message: Message):
             "\n*🔧 Админ-команды:*\n"
             "📊 /users – список всех пользователей\n"
             "📊 /export – экспорт всех данных в Excel\n"
+            "📊 /export months=2025-01..2025-03 users=1,2 format=csv – выгрузка за период (xlsx, csv, jsonl)\n"
+            "📈 /report months=2025-01..2025-03 – отклонения от плана, переработки и несданные недели\n"
+            "💾 /backup [now] – последняя резервная копия базы (now — сделать новую)\n"
+            "📥 /import – загрузить часы и пользователей из файла в формате /export (подпись к файлу)\n"
             "🔧 /editname <user_id> <новое_имя> – изменить имя пользователя\n"
             "🔧 /editusername <user_id> <новая_фамилия> – изменить фамилию пользователя\n"
             "🔧 /remove_user <user_id> – удалить пользователя\n"
             "📢 /notify – отправить напоминание пользователям о вводе рабочих часов\n"
+            "📈 /stats – задержки обработчиков, запросов к БД и счётчики рассылок\n"
         )
 
     await message.answer(help_text, parse_mode="Markdown")
@@ -204,81 +270,179 @@ async def cmd_help(message: Message):
 
 
 #АДМИНКА
-@dp.message(Command("users"))
-async def cmd_users(message: types.Message):
-    if message.from_user.id not in ADMIN_IDS:
-        return
-    cur = conn.cursor()
-    cur.execute("SELECT user_id, first_name, last_name FROM users")
-    users_list = cur.fetchall()
-    if not users_list:
-        await message.answer("Пока нет ни одного зарегистрированного пользователя.")
-        return
+USERS_PAGE_SIZE = 20
+
+def render_users_page(rows, direction, has_more, cursor, prefix):
     text_lines = ["📋 *Список пользователей:*"]
-    for user_id, first_name, last_name in users_list:
-        cur.execute("SELECT year, month, hours FROM monthly_hours WHERE user_id=? ORDER BY year DESC, month DESC LIMIT 1", (user_id,))
-        mon_data = cur.fetchone()
-        if mon_data:
-            mon_year, mon_month, mon_hours = mon_data
+    for user_id, first_name, last_name, mon_year, mon_month, mon_hours, week_year, week_num, week_hours in rows:
+        if mon_year is not None:
             mon_info = f"{mon_hours} ч. (план {mon_month:02d}.{mon_year})"
         else:
             mon_info = "нет данных"
-        cur.execute("SELECT year, week, hours FROM weekly_hours WHERE user_id=? ORDER BY year DESC, week DESC LIMIT 1", (user_id,))
-        week_data = cur.fetchone()
-        if week_data:
-            week_year, week_num, week_hours = week_data
+        if week_year is not None:
             week_info = f"{week_hours} ч. (нед. {week_num} {week_year}г.)"
         else:
             week_info = "нет данных"
         text_lines.append(f"{user_id}: *{first_name} {last_name}* — Месяц: {mon_info}, Неделя: {week_info}")
-    await message.answer("\n".join(text_lines), parse_mode="Markdown")
 
-@dp.message(Command("export"))
-async def cmd_export(message: Message):
+    # при листании вперёд "ещё" означает следующую страницу, назад — предыдущую;
+    # противоположная сторона существует, если мы пришли не с самого края
+    has_prev = has_more if direction == "prev" else cursor > 0
+    has_next = has_more if direction == "next" else True
+    buttons = []
+    if has_prev:
+        buttons.append(InlineKeyboardButton(text="⬅️ Назад", callback_data=f"users:prev:{rows[0][0]}:{prefix}"))
+    if has_next:
+        buttons.append(InlineKeyboardButton(text="Вперёд ➡️", callback_data=f"users:next:{rows[-1][0]}:{prefix}"))
+    markup = InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
+    return "\n".join(text_lines), markup
+
+@router.message(Command("users"))
+async def cmd_users(message: types.Message, repo: Repository):
     if message.from_user.id not in ADMIN_IDS:
         return
+    parts = message.text.split(maxsplit=1)
+    prefix = parts[1].strip() if len(parts) == 2 else ""
+    # префикс едет в callback_data (не больше 64 байт), поэтому ограничиваем его сразу
+    prefix = prefix.encode()[:32].decode("utf-8", "ignore")
+    rows, has_more = await repo.users_page("next", 0, prefix, USERS_PAGE_SIZE)
+    if not rows:
+        if prefix:
+            await message.answer(f"Нет пользователей, имя или фамилия которых начинается с «{prefix}».")
+        else:
+            await message.answer("Пока нет ни одного зарегистрированного пользователя.")
+        return
+    text, markup = render_users_page(rows, "next", has_more, 0, prefix)
+    await message.answer(text, parse_mode="Markdown", reply_markup=markup)
+
+@router.callback_query(F.data.startswith("users:"))
+async def users_page(callback: CallbackQuery, repo: Repository):
+    if callback.from_user.id not in ADMIN_IDS:
+        await callback.answer()
+        return
+    _, direction, cursor, prefix = callback.data.split(":", 3)
+    rows, has_more = await repo.users_page(direction, int(cursor), prefix, USERS_PAGE_SIZE)
+    if not rows:
+        await callback.answer("Больше пользователей нет.")
+        return
+    text, markup = render_users_page(rows, direction, has_more, int(cursor), prefix)
+    await callback.message.edit_text(text, parse_mode="Markdown", reply_markup=markup)
+    await callback.answer()
+
+@router.message(Command("export"))
+async def cmd_export(message: Message, repo: Repository, export_cache: ExportCache):
+    if message.from_user.id not in ADMIN_IDS or await reject_without_sql(message, repo):
+        return
+
+    try:
+        query = parse_export_args(message.text.split()[1:])
+    except ValueError:
+        await message.answer(EXPORT_USAGE, parse_mode="Markdown")
+        return
+
+    data = await export_cache.get(repo.db, query)
+    file = BufferedInputFile(data, filename=f"work_hours.{query.fmt}")
+    await message.answer_document(file, caption="📊 Отчет по рабочим часам")
 
-    df_users = pd.read_sql_query("SELECT * FROM users", conn)
-    df_weekly = pd.read_sql_query("SELECT * FROM weekly_hours", conn)
-    df_monthly = pd.read_sql_query("SELECT * FROM monthly_hours", conn)
-
-    excel_file = "work_hours.xlsx"
-
-    with pd.ExcelWriter(excel_file, engine="openpyxl") as writer:
-        sheet_count = 0
-
-        if not df_weekly.empty:
-            df_weekly = df_weekly.merge(df_users, on='user_id', how='left')
-            df_weekly = df_weekly[['first_name', 'last_name', 'year', 'week', 'hours']]
-            df_weekly.rename(columns={
-                'first_name': 'First Name', 'last_name': 'Last Name',
-                'year': 'Year', 'week': 'Week', 'hours': 'Hours'
-            }, inplace=True)
-            df_weekly.to_excel(writer, sheet_name="WeeklyHours", index=False)
-            sheet_count += 1
-
-        if not df_monthly.empty:
-            df_monthly = df_monthly.merge(df_users, on='user_id', how='left')
-            df_monthly = df_monthly[['first_name', 'last_name', 'year', 'month', 'hours']]
-            df_monthly.rename(columns={
-                'first_name': 'First Name', 'last_name': 'Last Name',
-                'year': 'Year', 'month': 'Month', 'hours': 'Hours'
-            }, inplace=True)
-            df_monthly.to_excel(writer, sheet_name="MonthlyHours", index=False)
-            sheet_count += 1
-        if sheet_count == 0:
-            df_empty = pd.DataFrame({"Сообщение": ["Нет данных для экспорта"]})
-            df_empty.to_excel(writer, sheet_name="Empty", index=False)
 
+@router.message(Command("report"))
+async def cmd_report(message: Message, repo: Repository, registry: UserRegistry):
+    if message.from_user.id not in ADMIN_IDS or await reject_without_sql(message, repo):
+        return
     try:
-        file = FSInputFile(excel_file)
-        await message.answer_document(file, caption="📊 Отчет по рабочим часам")
-    finally:
-        os.remove(excel_file) #
+        months = parse_report_args(message.text.split()[1:])
+    except ValueError:
+        await message.answer(REPORT_USAGE, parse_mode="Markdown")
+        return
+    await registry.refresh(repo)
+    report = await repo.db.run_read(build_report, months, registry.user_ids())
+    await message.answer(render_report(report, dict(registry.items())))
+
+
+@router.message(Command("backup"))
+async def cmd_backup(message: Message, backups: Backups):
+    if message.from_user.id not in ADMIN_IDS:
+        return
+    snapshots = backups.latest()
+    if message.text.split()[1:2] == ["now"] or not snapshots:
+        status = await message.answer("💾 Создаю резервную копию...")
+        try:
+            snapshots = await backups.run()
+        except Exception as e:
+            await status.edit_text(f"❌ Резервная копия не создана: {e}")
+            return
+        await status.delete()
+    for path in snapshots:
+        if os.path.getsize(path) > MAX_DOCUMENT_BYTES:
+            await message.answer(f"⚠️ {os.path.basename(path)} больше 50 МБ, заберите его с сервера: {path}")
+        else:
+            await message.answer_document(FSInputFile(path), caption=f"💾 {os.path.basename(path)}")
+
 
+@router.message(Command("import"))
+async def cmd_import(message: Message, bot: Bot, repo: Repository, registry: UserRegistry,
+                     history_cache: HistoryCache):
+    if message.from_user.id not in ADMIN_IDS or await reject_without_sql(message, repo):
+        return
+    document = message.document or (message.reply_to_message and message.reply_to_message.document)
+    fmt = import_format(document.file_name) if document else None
+    if fmt is None:
+        await message.answer(IMPORT_USAGE, parse_mode="Markdown")
+        return
 
-@dp.message(Command("editusername"))
-async def cmd_edit_surname(message: Message):
+    status = await message.answer("📥 Файл получен, проверяю строки...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, f"import.{fmt}")
+        await bot.download(document, destination=path)
+        try:
+            # разбор и проверка — в отдельном процессе, запись — одной транзакцией в потоке-писателе
+            await registry.refresh(repo)
+            parsed = await parse_upload(path, fmt, registry.items())
+        except ValueError as e:
+            await status.edit_text(f"❌ Импорт не выполнен: {e}")
+            return
+    result = await repo.db.run_write(apply_import, parsed)
+    history_cache.invalidate()
+    if parsed.users:
+        await registry.load(repo)
+    await status.edit_text(render_import(result))
+
+
+def render_stats(metrics):
+    uptime = int(time.time() - metrics.started)
+    lines = [f"📈 Статистика за {uptime // 3600} ч {uptime % 3600 // 60} мин работы", "",
+             "Обработчики (вызовов, p50 / p95 мс):"]
+    # команды отдельно, ответы в состояниях FSM — по состоянию
+    handlers = metrics.grouped("bot_handler_seconds",
+                               lambda labels: labels["command"] or labels["state"] or labels["handler"])
+    for name, histogram in sorted(handlers.items(), key=lambda item: -item[1].count)[:15]:
+        lines.append(f"  {name}: {histogram.count}, "
+                     f"{histogram.quantile(0.5) * 1000:.1f} / {histogram.quantile(0.95) * 1000:.1f}")
+    errors = sum(h.count for labels, h in metrics.snapshot("bot_handler_seconds") if labels["status"] == "error")
+    if errors:
+        lines.append(f"  с ошибкой: {errors}")
+
+    lines += ["", f"БД: commit {metrics.counter('db_commits_total')}, "
+                  f"строк {metrics.counter('db_committed_rows_total')}",
+              "Самые затратные запросы (всего мс, вызовов, p95 мс):"]
+    statements = metrics.grouped("db_statement_seconds", lambda labels: labels["statement"])
+    for statement, histogram in sorted(statements.items(), key=lambda item: -item[1].sum)[:5]:
+        lines.append(f"  {histogram.sum * 1000:.0f}, {histogram.count}, "
+                     f"{histogram.quantile(0.95) * 1000:.1f} — {statement}")
+
+    lines += ["", "Рассылки: отправлено {}, ошибок {}, RetryAfter {}".format(
+        *(metrics.counter("broadcast_messages_total", result=r) for r in ("sent", "failed", "throttled")))]
+    return "\n".join(lines)
+
+@router.message(Command("stats"))
+async def cmd_stats(message: Message, metrics: Metrics):
+    if message.from_user.id not in ADMIN_IDS:
+        return
+    await message.answer(render_stats(metrics))
+
+
+@router.message(Command("editusername"))
+async def cmd_edit_surname(message: Message, repo: Repository, registry: UserRegistry):
     if message.from_user.id not in ADMIN_IDS:
         await message.answer("⛔ У вас нет прав на выполнение этой команды.")
         return
@@ -296,18 +460,15 @@ async def cmd_edit_surname(message: Message):
 
     user_id = int(user_id_str)
 
-    cur = conn.cursor()
-    cur.execute("UPDATE users SET last_name=? WHERE user_id=?", (new_surname.strip(), user_id))
-
-    if cur.rowcount == 0:
+    if not await repo.rename_user(user_id, last_name=new_surname.strip()):
         await message.answer(f"❌ Пользователь с ID `{user_id}` не найден.", parse_mode="Markdown")
     else:
-        conn.commit()
+        registry.update(user_id, last_name=new_surname.strip())
         await message.answer(f"✅ Фамилия пользователя `{user_id}` изменена на `{new_surname}`.", parse_mode="Markdown")
 
 
-@dp.message(Command("editname"))
-async def cmd_edit_name(message: Message):
+@router.message(Command("editname"))
+async def cmd_edit_name(message: Message, repo: Repository, registry: UserRegistry):
     if message.from_user.id not in ADMIN_IDS:
         await message.answer("⛔ У вас нет прав на выполнение этой команды.")
         return
@@ -325,18 +486,16 @@ async def cmd_edit_name(message: Message):
 
     user_id = int(user_id_str)
 
-    cur = conn.cursor()
-    cur.execute("UPDATE users SET first_name=? WHERE user_id=?", (new_name.strip(), user_id))
-
-    if cur.rowcount == 0:
+    if not await repo.rename_user(user_id, first_name=new_name.strip()):
         await message.answer(f"❌ Пользователь с ID `{user_id}` не найден.", parse_mode="Markdown")
     else:
-        conn.commit()
+        registry.update(user_id, first_name=new_name.strip())
         await message.answer(f"✅ Имя пользователя `{user_id}` изменено на `{new_name}`.", parse_mode="Markdown")
 
 
-@dp.message(Command("removeuser"))
-async def cmd_remove_user(message: Message):
+@router.message(Command("removeuser"))
+async def cmd_remove_user(message: Message, repo: Repository, registry: UserRegistry,
+                          history_cache: HistoryCache):
     if message.from_user.id not in ADMIN_IDS:
         await message.answer("⛔ У вас нет прав на выполнение этой команды.")
         return
@@ -353,23 +512,20 @@ async def cmd_remove_user(message: Message):
 
     user_id = int(user_id_str)
 
-    cur = conn.cursor()
-
-    cur.execute("SELECT first_name, last_name FROM users WHERE user_id=?", (user_id,))
-    user = cur.fetchone()
+    # кэш мог устареть, если пользователя добавили или удалили через другую реплику
+    user = await registry.fetch(repo, user_id, cached=False)
     if not user:
         await message.answer(f"❌ Пользователь с ID `{user_id}` не найден.", parse_mode="Markdown")
         return
 
-    cur.execute("DELETE FROM weekly_hours WHERE user_id=?", (user_id,))
-    cur.execute("DELETE FROM monthly_hours WHERE user_id=?", (user_id,))
-    cur.execute("DELETE FROM users WHERE user_id=?", (user_id,))
-    conn.commit()
+    await repo.delete_user(user_id)
+    registry.remove(user_id)
+    history_cache.invalidate(user_id)
 
     await message.answer(f"✅ Пользователь `{user_id}` ({user[0]} {user[1]}) и все его данные удалены.", parse_mode="Markdown")
 
-@dp.message(Command("edit_name"))
-async def cmd_edit_name(message: types.Message):
+@router.message(Command("edit_name"))
+async def cmd_edit_name(message: types.Message, repo: Repository, registry: UserRegistry):
     if message.from_user.id not in ADMIN_IDS:
         return
     parts = message.text.split(maxsplit=2)
@@ -381,16 +537,14 @@ async def cmd_edit_name(message: types.Message):
         await message.reply("Ошибка: user_id должен быть числом.")
         return
     user_id = int(uid_str)
-    cur = conn.cursor()
-    cur.execute("UPDATE users SET first_name=? WHERE user_id=?", (new_name.strip(), user_id))
-    if cur.rowcount == 0:
+    if not await repo.rename_user(user_id, first_name=new_name.strip()):
         await message.reply("Пользователь с ID {} не найден.".format(user_id))
     else:
-        conn.commit()
+        registry.update(user_id, first_name=new_name.strip())
         await message.reply("Имя пользователя обновлено успешно.")
 
-@dp.message(Command("edit_surname"))
-async def cmd_edit_surname(message: types.Message):
+@router.message(Command("edit_surname"))
+async def cmd_edit_surname(message: types.Message, repo: Repository, registry: UserRegistry):
     if message.from_user.id not in ADMIN_IDS:
         return
     parts = message.text.split(maxsplit=2)
@@ -402,16 +556,15 @@ async def cmd_edit_surname(message: types.Message):
         await message.reply("Ошибка: user_id должен быть числом.")
         return
     user_id = int(uid_str)
-    cur = conn.cursor()
-    cur.execute("UPDATE users SET last_name=? WHERE user_id=?", (new_surname.strip(), user_id))
-    if cur.rowcount == 0:
+    if not await repo.rename_user(user_id, last_name=new_surname.strip()):
         await message.reply(f"Пользователь с ID {user_id} не найден.")
     else:
-        conn.commit()
+        registry.update(user_id, last_name=new_surname.strip())
         await message.reply("Фамилия пользователя обновлена успешно.")
 
-@dp.message(Command("remove_user"))
-async def cmd_remove_user(message: types.Message):
+@router.message(Command("remove_user"))
+async def cmd_remove_user(message: types.Message, repo: Repository, registry: UserRegistry,
+                          history_cache: HistoryCache):
     if message.from_user.id not in ADMIN_IDS:
         return
     parts = message.text.split(maxsplit=1)
@@ -423,36 +576,117 @@ async def cmd_remove_user(message: types.Message):
         await message.reply("Ошибка: user_id должен быть числом.")
         return
     user_id = int(uid_str)
-    cur = conn.cursor()
-    cur.execute("DELETE FROM weekly_hours WHERE user_id=?", (user_id,))
-    cur.execute("DELETE FROM monthly_hours WHERE user_id=?", (user_id,))
-    cur.execute("DELETE FROM users WHERE user_id=?", (user_id,))
-    if cur.rowcount == 0:
+    deleted = await repo.delete_user(user_id)
+    registry.remove(user_id)
+    history_cache.invalidate(user_id)
+    if not deleted:
         await message.reply(f"Пользователь с ID {user_id} не найден.")
     else:
-        conn.commit()
         await message.reply(f"Пользователь {user_id} и все его данные удалены.")
 
 
-@dp.message(Command("weekchange"))
-async def change_week_hours(message: Message, state: FSMContext):
+@router.message(Command("weekchange"))
+async def change_week_hours(message: Message, state: FSMContext, repo: Repository, registry: UserRegistry):
+    if await reject_unregistered(message, registry, repo):
+        return
     user_id = message.from_user.id
-    now = datetime.now()
-    year, week_num, _ = now.isocalendar()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT hours FROM weekly_hours 
-        WHERE user_id = ? AND year = ? AND week = ?
-    """, (user_id, year, week_num))
-    existing_data = cur.fetchone()
-
-    if not existing_data:
-        await message.answer(f"❌ У вас еще не записаны часы за эту неделю ({week_num}-я неделя {year}). Используйте /weekh для добавления.")
+    today = datetime.now().date()
+    parts = message.text.split(maxsplit=1)
+    try:
+        year, week_num = parse_week(parts[1], today) if len(parts) == 2 else today.isocalendar()[:2]
+    except ValueError:
+        await message.answer(WEEKCHANGE_USAGE, parse_mode="Markdown")
+        return
+    ago = weeks_ago(today, year, week_num)
+    if ago < 0:
+        await message.answer(f"❌ {week_num}-я неделя {year} года ещё не началась.")
+        return
+    if ago > WEEK_EDIT_WEEKS:
+        await message.answer(f"⛔ Изменять часы можно не позже чем через {WEEK_EDIT_WEEKS} нед. после недели. "
+                             f"Чтобы исправить более ранние, обратитесь к администратору.")
+        return
+    if await repo.get_week_hours(user_id, year, week_num) is None:
+        if ago == 0:
+            await message.answer(f"❌ У вас еще не записаны часы за эту неделю ({week_num}-я неделя {year}). Используйте /week для добавления.")
+        else:
+            await message.answer(f"❌ За {week_num}-ю неделю {year} года часы не записаны. Посмотреть, что введено: /history")
         return
     await state.set_state(InputHours.waiting_for_week_hours_edit)
     await state.update_data(target_year=year, target_week=week_num)
 
-    await message.answer(f"📝 Введите новое количество часов за текущую неделю ({week_num}-я неделя {year} года):")
+    label = "текущую неделю" if ago == 0 else "неделю"
+    await message.answer(f"📝 Введите новое количество часов за {label} ({week_num}-я неделя {year} года):")
+
+
+async def history_page(repo, history_cache, user_id, kind, cursor):
+    key = (kind, cursor)
+    page = history_cache.get(user_id, key)
+    if page is None:
+        if kind == "w":
+            rows = await repo.week_history(user_id, cursor or NEWEST, HISTORY_WEEKS + 1)
+            page = render_week_page(rows[:HISTORY_WEEKS], len(rows) > HISTORY_WEEKS, cursor,
+                                    datetime.now().date(), WEEK_EDIT_WEEKS)
+        else:
+            rows = await repo.month_history(user_id, cursor or NEWEST, HISTORY_MONTHS + 1)
+            page = render_month_page(rows[:HISTORY_MONTHS], len(rows) > HISTORY_MONTHS, cursor)
+        history_cache.put(user_id, key, page)
+    return page
+
+@router.message(Command("history"))
+async def cmd_history(message: Message, repo: Repository, registry: UserRegistry, history_cache: HistoryCache):
+    if await reject_unregistered(message, registry, repo):
+        return
+    text, markup = await history_page(repo, history_cache, message.from_user.id, "w", None)
+    await message.answer(text, parse_mode="Markdown", reply_markup=markup)
+
+@router.callback_query(F.data.startswith("history:"))
+async def history_callback(callback: CallbackQuery, repo: Repository, history_cache: HistoryCache):
+    # страницы строятся по keyset-курсору (год, период) последней показанной строки, а не по номеру страницы
+    _, kind, cursor = callback.data.split(":", 2)
+    try:
+        cursor = parse_cursor(cursor)
+    except ValueError:
+        await callback.answer()
+        return
+    text, markup = await history_page(repo, history_cache, callback.from_user.id, kind, cursor)
+    await callback.message.edit_text(text, parse_mode="Markdown", reply_markup=markup)
+    await callback.answer()
+
+@router.message(Command("timezone"))
+async def cmd_timezone(message: Message, repo: Repository, registry: UserRegistry):
+    if await reject_unregistered(message, registry, repo):
+        return
+    parts = message.text.split(maxsplit=1)
+    if len(parts) < 2:
+        await message.answer("❗ Использование: `/timezone <зона>`, например `/timezone Europe/Moscow`",
+                             parse_mode="Markdown")
+        return
+    tz_name = parts[1].strip()
+    try:
+        parse_timezone(tz_name)
+    except ValueError:
+        await message.answer(f"❗ Неизвестный часовой пояс `{tz_name}`. Пример: `Europe/Moscow`, `Asia/Almaty`.",
+                             parse_mode="Markdown")
+        return
+    await repo.set_timezone(message.from_user.id, tz_name)
+    await message.answer(f"✅ Часовой пояс для напоминаний: {tz_name}.")
+
+@router.message(Command("remindtime"))
+async def cmd_remind_time(message: Message, repo: Repository, registry: UserRegistry):
+    if await reject_unregistered(message, registry, repo):
+        return
+    parts = message.text.split(maxsplit=1)
+    try:
+        remind_at = parse_remind_at(parts[1].strip()) if len(parts) == 2 else None
+    except ValueError:
+        remind_at = None
+    if remind_at is None:
+        await message.answer("❗ Использование: `/remindtime <ЧЧ:ММ>`, например `/remindtime 10:30`",
+                             parse_mode="Markdown")
+        return
+    await repo.set_remind_at(message.from_user.id, remind_at.strftime("%H:%M"))
+    await message.answer(f"✅ Напоминания будут приходить около {remind_at.strftime('%H:%M')} по вашему времени.")
+
 
 async def set_bot_commands(bot: Bot):
     commands = [
@@ -461,12 +695,15 @@ async def set_bot_commands(bot: Bot):
         BotCommand(command="week", description="Ввести рабочие часы за неделю"),
         BotCommand(command="weekchange", description="Изменить рабочие часы за неделю"),
         BotCommand(command="month", description="Ввести рабочие часы за месяц"),
+        BotCommand(command="history", description="История введённых часов"),
+        BotCommand(command="timezone", description="Часовой пояс для напоминаний"),
+        BotCommand(command="remindtime", description="Время напоминаний"),
     ]
     await bot.set_my_commands(commands)
 
 
-@dp.message(InputHours.waiting_for_week_hours)
-async def process_week_hours(message: Message, state: FSMContext):
+@router.message(InputHours.waiting_for_week_hours)
+async def process_week_hours(message: Message, state: FSMContext, repo: Repository, history_cache: HistoryCache):
     text = message.text.strip().replace(',', '.')
 
     try:
@@ -480,19 +717,19 @@ async def process_week_hours(message: Message, state: FSMContext):
     week_num = data.get("target_week")
     user_id = message.from_user.id
 
-    cur = conn.cursor()
-    cur.execute("""
-        INSERT INTO weekly_hours (user_id, year, week, hours) 
-        VALUES (?, ?, ?, ?)
-    """, (user_id, year, week_num, hours))
-    conn.commit()
+    inserted = await repo.add_week_hours(user_id, year, week_num, hours)
+    history_cache.invalidate(user_id)
 
     await state.clear()
+    if not inserted:
+        await message.reply(f"⛔ Вы уже ввели часы за эту неделю ({week_num}-я неделя {year} года). "
+                            f"Для изменения используйте /weekchange.")
+        return
     await message.reply(f"✅ Записано {hours} часов за текущую неделю ({week_num}-я неделя {year} года).")
 
 
-@dp.message(InputHours.waiting_for_month_hours)
-async def process_month_hours(message: Message, state: FSMContext):
+@router.message(InputHours.waiting_for_month_hours)
+async def process_month_hours(message: Message, state: FSMContext, repo: Repository, history_cache: HistoryCache):
     text = message.text.strip().replace(',', '.')
 
     try:
@@ -506,18 +743,18 @@ async def process_month_hours(message: Message, state: FSMContext):
     month = data.get("target_month")
     user_id = message.from_user.id
 
-    cur = conn.cursor()
-    cur.execute("""
-        INSERT INTO monthly_hours (user_id, year, month, hours) 
-        VALUES (?, ?, ?, ?)
-    """, (user_id, year, month, hours))
-    conn.commit()
+    inserted = await repo.add_month_hours(user_id, year, month, hours)
+    history_cache.invalidate(user_id)
 
     await state.clear()
+    if not inserted:
+        await message.reply(f"⛔ Вы уже ввели часы за этот месяц ({month:02d}.{year}).")
+        return
     await message.reply(f"✅ Записано {hours} часов за текущий месяц ({month:02d}.{year}).")
 
-@dp.message(InputHours.waiting_for_week_hours_edit)
-async def process_week_hours_edit(message: Message, state: FSMContext):
+@router.message(InputHours.waiting_for_week_hours_edit)
+async def process_week_hours_edit(message: Message, state: FSMContext, repo: Repository,
+                                  history_cache: HistoryCache):
     text = message.text.strip().replace(',', '.')
 
     try:
@@ -535,66 +772,273 @@ async def process_week_hours_edit(message: Message, state: FSMContext):
         await message.reply("⚠ Ошибка: Не удалось определить неделю. Попробуйте снова.")
         return
 
-    cur = conn.cursor()
-    cur.execute("""
-        UPDATE weekly_hours 
-        SET hours = ? 
-        WHERE user_id = ? AND year = ? AND week = ?
-    """, (hours, user_id, year, week_num))
-    conn.commit()
+    await repo.set_week_hours(user_id, year, week_num, hours)
+    history_cache.invalidate(user_id)
 
     await state.clear()
-    await message.reply(f"✅ Обновлено: {hours} часов за текущую неделю ({week_num}-я неделя {year}).")
+    label = "текущую неделю" if weeks_ago(datetime.now().date(), year, week_num) == 0 else "неделю"
+    await message.reply(f"✅ Обновлено: {hours} часов за {label} ({week_num}-я неделя {year}).")
 
 #еженедельные и ежемесячные напоминания
-async def send_weekly_prompt():
+def reminder_week():
     now = datetime.now()
     monday_this_week = now - timedelta(days=now.weekday())
     last_week_monday = monday_this_week - timedelta(days=7)
     year, week_num, _ = last_week_monday.isocalendar()
-    cur = conn.cursor()
-    cur.execute("SELECT user_id FROM users")
-    users = cur.fetchall()
-    for (uid,) in users:
-        try:
-            await bot.send_message(uid, "⏱ Пожалуйста, введите часы работы за текущую неделю.")
-            state = dp.current_state(chat=uid, user=uid)
-            await state.set_state(InputHours.waiting_for_week_hours.state)
-            await state.update_data(target_year=year, target_week=week_num)
-        except Exception as e:
-            logging.error(f"Ошибка отправки еженедельного напоминания для {uid}: {e}")
+    return year, week_num
 
-async def send_monthly_prompt():
+def reminder_month():
     now = datetime.now()
-    year = now.year
-    month = now.month
-    cur = conn.cursor()
-    cur.execute("SELECT user_id FROM users")
-    users = cur.fetchall()
-    for (uid,) in users:
+    return now.year, now.month
+
+SET_SCHEDULER_STATE_SQL = """
+    INSERT INTO scheduler_state (name, value) VALUES (?, ?)
+    ON CONFLICT(name) DO UPDATE SET value = excluded.value
+"""
+
+
+class App:
+    # Собирает бота целиком: Bot, Dispatcher с router, БД, рассылки и напоминания.
+    # Конструктор только создаёт объекты — соединения с БД и сетью открываются в start()/run().
+
+    def __init__(self, token=None, db_path=None, api_url=None, archive_path=None, storage=None):
+        api_url = api_url or TELEGRAM_API_URL
+        self.metrics = Metrics()
+        self.bot = Bot(token=token or API_TOKEN,
+                       session=AiohttpSession(api=TelegramAPIServer.from_base(api_url)) if api_url else None)
+        self.db = Database(db_path or DB_PATH, metrics=self.metrics,
+                           archive_path=archive_path or (os.path.splitext(db_path)[0] + "_archive.db"
+                                                         if db_path else ARCHIVE_PATH))
+        # db остаётся и с хранилищем в памяти: в нём outbox и состояние расписания
+        if (storage or STORAGE_BACKEND) == "memory":
+            self.repo = MemoryRepository()
+            self.storage = MemoryStorage()
+        else:
+            self.repo = SQLiteRepository(self.db)
+            self.storage = SQLiteStorage(self.db)
+        self.dp = Dispatcher(storage=self.storage)
+        handler_timer = HandlerTimer(self.metrics)
+        self.dp.message.middleware(handler_timer)
+        self.dp.callback_query.middleware(handler_timer)
+        self.dp.include_router(router)
+        self.broadcaster = Broadcaster(self.bot, metrics=self.metrics)
+        self.export_cache = ExportCache()
+        self.history_cache = HistoryCache()
+        self.registry = UserRegistry()
+        self.outbox = Outbox(self.db, self.broadcaster, on_delivered=self.apply_prompt_state)
+        self.reminder_queue = ReminderQueue()
+        self.archiver = Archiver(self.db, ARCHIVE_AFTER_MONTHS, metrics=self.metrics)
+        self.backups = Backups(self.db, BACKUP_DIR, BACKUP_KEEP, metrics=self.metrics)
+        lease_path = os.path.splitext(db_path)[0] + "_lease.db" if db_path else LEASE_PATH
+        self.leader = LeaderElection(SQLiteLease(lease_path, "scheduler"), LEADER_TTL,
+                                     on_elected=self.start_jobs, on_demoted=self.stop_jobs)
+        self.lanes = UpdateLanes(self.dp, self.bot, {"light": (UPDATE_WORKERS, UPDATE_QUEUE_SIZE),
+                                                     "heavy": (HEAVY_WORKERS, HEAVY_QUEUE_SIZE)},
+                                 UPDATE_PER_USER, metrics=self.metrics)
+        self.scheduler = None
+        self.dp.workflow_data.update(app=self, bot=self.bot, repo=self.repo, registry=self.registry,
+                                     export_cache=self.export_cache, history_cache=self.history_cache,
+                                     metrics=self.metrics, backups=self.backups)
+        self.dp.startup.register(self.on_startup)
+
+    async def start(self):
+        await self.db.connect()
+        await self.registry.load(self.repo)
+
+    async def stop(self):
+        await self.leader.stop()
+        await self.stop_jobs()
+        await self.storage.close()
+        await self.db.close()
+
+    def user_state(self, uid):
+        return FSMContext(storage=self.storage, key=StorageKey(bot_id=self.bot.id, chat_id=uid, user_id=uid))
+
+    async def apply_prompt_state(self, uid, payload):
+        # не перехватываем пользователя, который сейчас в другом диалоге с ботом
+        state = self.user_state(uid)
+        if payload and await state.get_state() is None:
+            await state.set_state(payload["state"])
+            await state.update_data(**payload["data"])
+
+    async def prompt_missing(self, missing, period, text, waiting_state, data, dedup, on_progress=None,
+                             user_ids=None):
+        # missing — repo.missing_week или repo.missing_month: только те, кто ещё не ввёл часы за период
+        recipients = await missing(*period, user_ids=user_ids)
+        payload = {"state": waiting_state.state, "data": data}
+        # сообщения сначала попадают в outbox: недоставленные повторит фоновый воркер,
+        # а повторный запуск того же напоминания не создаст дублей (dedup_key)
+        ids = await self.outbox.enqueue((f"{dedup}:{uid}", uid, text, payload) for uid in recipients)
+        return await self.outbox.deliver(ids, on_progress)
+
+    async def send_weekly_prompt(self, on_progress=None, period=None, followup=False, user_ids=None, tag=None):
+        year, week_num = period or reminder_week()
+        text = ("⏰ Напоминаем: вы ещё не ввели часы работы за неделю." if followup
+                else "⏱ Пожалуйста, введите часы работы за текущую неделю.")
+        dedup = f"week:{year}-{week_num}:{tag or ('followup' if followup else 'first')}"
+        return await self.prompt_missing(self.repo.missing_week, (year, week_num), text,
+                                         InputHours.waiting_for_week_hours,
+                                         {"target_year": year, "target_week": week_num}, dedup, on_progress, user_ids)
+
+    async def send_monthly_prompt(self, on_progress=None, period=None, followup=False, user_ids=None, tag=None):
+        year, month = period or reminder_month()
+        text = ("⏰ Напоминаем: вы ещё не ввели запланированные часы на месяц." if followup
+                else "📅 Пожалуйста, введите запланированные часы на текущий месяц.")
+        dedup = f"month:{year}-{month}:{tag or ('followup' if followup else 'first')}"
+        return await self.prompt_missing(self.repo.missing_month, (year, month), text,
+                                         InputHours.waiting_for_month_hours,
+                                         {"target_year": year, "target_month": month}, dedup, on_progress, user_ids)
+
+    # Напоминания по расписанию раскладываются по минутным корзинам: каждый пользователь получает их
+    # в своё местное время (remind_at, по умолчанию 09:00) плюс личный сдвиг внутри REMINDER_WINDOW_MINUTES,
+    # так что отправки и ответы идут ровным потоком, а не всплеском в 09:00 по серверу.
+    async def plan_reminders(self, start=None):
+        now = datetime.now(timezone.utc)
+        hour = now.replace(minute=0, second=0, microsecond=0)
+        start = start or hour
+        end = hour + timedelta(hours=1)
+        if start >= end:
+            return
+        for user_id, tz_name, remind_at in await self.repo.reminder_settings():
+            tz = parse_timezone(tz_name) if tz_name else DEFAULT_TIMEZONE
+            at = parse_remind_at(remind_at) if remind_at else DEFAULT_REMIND_AT
+            for kind in ("week", "month"):
+                for when, followup, period in due_times(kind, user_id, tz, at, start, end,
+                                                        REMINDER_WINDOW_MINUTES, REMINDER_FOLLOWUP_HOURS):
+                    self.reminder_queue.push(when, (kind, period, followup, user_id))
+
+    async def send_due_reminders(self):
+        now = datetime.now(timezone.utc)
+        groups = {}
+        for kind, period, followup, user_id in self.reminder_queue.pop_due(now):
+            groups.setdefault((kind, period, followup), []).append(user_id)
+        for (kind, period, followup), user_ids in groups.items():
+            send = self.send_weekly_prompt if kind == "week" else self.send_monthly_prompt
+            await send(period=period, followup=followup, user_ids=user_ids)
+        # отметка, до какого момента напоминания уже разосланы: с неё продолжаем после перезапуска
+        await self.db.submit(SET_SCHEDULER_STATE_SQL, ("reminders_sent_until", now.isoformat()))
+
+    async def catch_up_reminders(self):
+        # всё, что должно было уйти, пока бот был выключен (не старше REMINDER_CATCHUP_HOURS),
+        # планируется в прошлое и сразу отправляется; уже отправленное отсекает dedup_key в outbox
+        now = datetime.now(timezone.utc)
+        row = await self.db.fetchone("SELECT value FROM scheduler_state WHERE name = 'reminders_sent_until'")
+        start = now
+        if row:
+            start = max(datetime.fromisoformat(row[0]), now - timedelta(hours=REMINDER_CATCHUP_HOURS))
+        await self.plan_reminders(start=start)
+        await self.send_due_reminders()
+
+    def build_scheduler(self):
+        # apscheduler тянет за собой pkg_resources, поэтому импортируется только при запуске бота
+        from apscheduler.schedulers.asyncio import AsyncIOScheduler
+        from apscheduler.triggers.cron import CronTrigger
+
+        scheduler = AsyncIOScheduler(job_defaults={"coalesce": True})
+        scheduler.add_job(self.plan_reminders, CronTrigger(minute=0))
+        scheduler.add_job(self.send_due_reminders, CronTrigger(second=0))
+        scheduler.add_job(self.backups.run, CronTrigger(hour=3, minute=0))
+        scheduler.add_job(self.archiver.run, CronTrigger(hour=3, minute=30))
+        return scheduler
+
+    async def on_startup(self):
+        # расписание запускает только реплика-лидер (start_jobs), остальные лишь обрабатывают обновления
+        self.leader.start()
+        logging.info("Bot is up and running.")
+
+    async def start_jobs(self):
+        # outbox и расписание запускаются до догоняющих напоминаний: их сбой не должен оставить
+        # кластер без рассылок и архивации до перезапуска лидера
+        self.outbox.start()
+        self.scheduler = self.build_scheduler()
+        self.scheduler.start()
+        logging.info("Scheduler started.")
         try:
-            await bot.send_message(uid, "📅 Пожалуйста, введите запланированные часы на текущий месяц.")
-            state = dp.current_state(chat=uid, user=uid)
-            await state.set_state(InputHours.waiting_for_month_hours.state)
-            await state.update_data(target_year=year, target_month=month)
-        except Exception as e:
-            logging.error(f"Ошибка отправки ежемесячного напоминания для {uid}: {e}")
-
+            await self.catch_up_reminders()
+        except Exception:
+            logging.exception("Не удалось отправить пропущенные напоминания")
+
+    async def stop_jobs(self):
+        if self.scheduler is not None and self.scheduler.running:
+            self.scheduler.shutdown(wait=False)
+        self.scheduler = None
+        await self.outbox.stop()
+
+    async def run_webhook(self):
+        bot, dp = self.bot, self.dp
+        server = WebhookServer(self.lanes, bot, WEBHOOK_PATH, WEBHOOK_SECRET)
+        await dp.emit_startup(bot=bot, bots=[bot], dispatcher=dp)
+        self.lanes.start()
+        await server.start(WEBHOOK_HOST, WEBHOOK_PORT)
+        if WEBHOOK_URL:
+            # накопившиеся обновления не сбрасываем: Telegram доставит их на новый адрес
+            await bot.set_webhook(WEBHOOK_URL + WEBHOOK_PATH, secret_token=WEBHOOK_SECRET,
+                                  drop_pending_updates=False, allowed_updates=dp.resolve_used_update_types())
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await server.stop()
+            await self.lanes.stop()
+            await dp.emit_shutdown(bot=bot, bots=[bot], dispatcher=dp)
+            await bot.session.close()
+
+    async def run_polling(self):
+        # Свой цикл getUpdates вместо dp.start_polling: обновления идут через self.lanes, а пока
+        # очередь лёгких апдейтов заполнена, новые не забираются — Telegram подержит их у себя.
+        bot, dp = self.bot, self.dp
+        await bot.delete_webhook(drop_pending_updates=False)
+        await dp.emit_startup(bot=bot, bots=[bot], dispatcher=dp)
+        self.lanes.start()
+        backoff = Backoff(config=BackoffConfig(min_delay=1.0, max_delay=5.0, factor=1.3, jitter=0.1))
+        allowed_updates = dp.resolve_used_update_types()
+        request_timeout = int(bot.session.timeout + POLLING_TIMEOUT)
+        # пачка не больше очереди: иначе при маленьком UPDATE_QUEUE_SIZE часть обновлений не поместилась бы
+        limit = max(1, min(POLLING_BATCH, UPDATE_QUEUE_SIZE))
+        offset = None
+        try:
+            while True:
+                await self.lanes.wait_for_room(count=limit)
+                try:
+                    updates = await bot.get_updates(offset=offset, limit=limit, timeout=POLLING_TIMEOUT,
+                                                    allowed_updates=allowed_updates, request_timeout=request_timeout)
+                except Exception as e:
+                    logging.error(f"Не удалось получить обновления: {type(e).__name__}: {e}")
+                    await backoff.asleep()
+                    continue
+                backoff.reset()
+                for update in updates:
+                    self.lanes.submit(update)
+                    offset = update.update_id + 1
+        finally:
+            await self.lanes.stop()
+            await dp.emit_shutdown(bot=bot, bots=[bot], dispatcher=dp)
+            await bot.session.close()
+
+    async def run(self):
+        if BOT_MODE == "webhook" and not WEBHOOK_SECRET:
+            raise SystemExit("BOT_MODE=webhook: задайте WEBHOOK_SECRET — "
+                             "без него обновления может прислать кто угодно")
+        await self.start()
+        await set_bot_commands(self.bot)
+        metrics_server = MetricsServer(self.metrics)
+        if METRICS_PORT:
+            await metrics_server.start(METRICS_HOST, METRICS_PORT)
+        try:
+            if BOT_MODE == "webhook":
+                await self.run_webhook()
+            else:
+                await self.run_polling()
+        finally:
+            await metrics_server.stop()
+            await self.stop()
 
-scheduler = AsyncIOScheduler()
-scheduler.add_job(send_weekly_prompt, CronTrigger(day_of_week='mon', hour=9, minute=0))
-scheduler.add_job(send_monthly_prompt, CronTrigger(day='1', hour=9, minute=0))
 
-async def on_startup(dp):
-    scheduler.start()
-    logging.info("Scheduler started. Bot is up and running.")
+def create_app(**kwargs):
+    return App(**kwargs)
 
 async def main():
-    await bot.delete_webhook(drop_pending_updates=True)
-    await set_bot_commands(bot)
-    dp["bot"] = bot
-    await dp.start_polling(bot)
+    logging.basicConfig(level=logging.INFO)
+    await create_app().run()
 
 if __name__ == "__main__":
     asyncio.run(main())
-
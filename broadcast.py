@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import random
+import time
+from dataclasses import dataclass, field
+
+from aiogram.exceptions import TelegramAPIError, TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+
+# Лимиты Telegram: около 30 сообщений в секунду на бота и не чаще 1 сообщения в секунду в один чат
+GLOBAL_RATE = 30
+PER_CHAT_INTERVAL = 1.0
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds):
+        # RetryAfter действует на весь бот, поэтому останавливаем всех отправителей
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+@dataclass
+class BroadcastResult:
+    total: int = 0
+    delivered: int = 0
+    failed: int = 0
+    throttled: int = 0
+    errors: dict = field(default_factory=dict)
+
+    @property
+    def processed(self):
+        return self.delivered + self.failed
+
+
+class Broadcaster:
+    # Один экземпляр на бота: все рассылки (по расписанию и /notify) делят общий token bucket.
+
+    def __init__(self, bot, rate=GLOBAL_RATE, per_chat_interval=PER_CHAT_INTERVAL,
+                 concurrency=20, max_retries=5, backoff=0.5, metrics=None):
+        self.bot = bot
+        self.metrics = metrics
+        self.bucket = TokenBucket(rate)
+        self.per_chat_interval = per_chat_interval
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._last_sent = {}
+
+    async def _wait_chat(self, chat_id):
+        last = self._last_sent.get(chat_id)
+        if last is not None:
+            delay = last + self.per_chat_interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        self._last_sent[chat_id] = time.monotonic()
+
+    def _count(self, result):
+        # broadcast_messages_total{result="sent|failed|throttled"}
+        if self.metrics is not None:
+            self.metrics.inc("broadcast_messages_total", result=result)
+
+    def _forget_idle_chats(self):
+        border = time.monotonic() - self.per_chat_interval
+        self._last_sent = {chat_id: ts for chat_id, ts in self._last_sent.items() if ts > border}
+
+    async def send(self, chat_id, text, result, **kwargs):
+        # None при успехе, иначе последняя ошибка
+        attempt = 0
+        while True:
+            await self._wait_chat(chat_id)
+            await self.bucket.acquire()
+            try:
+                await self.bot.send_message(chat_id, text, **kwargs)
+                return None
+            except TelegramRetryAfter as e:
+                result.throttled += 1
+                self._count("throttled")
+                self.bucket.pause(e.retry_after)
+                error = e
+            except (TelegramNetworkError, TelegramServerError) as e:
+                await asyncio.sleep(self.backoff * 2 ** attempt + random.uniform(0, self.backoff))
+                error = e
+            except TelegramAPIError as e:
+                # заблокировавший бота пользователь, удалённый чат и т.п. — повтор не поможет
+                logging.warning(f"Сообщение для {chat_id} не доставлено: {e}")
+                return e
+            attempt += 1
+            if attempt > self.max_retries:
+                logging.error(f"Сообщение для {chat_id} не доставлено после {attempt} попыток: {error}")
+                return error
+
+    async def broadcast(self, chat_ids, text, on_delivered=None, on_progress=None, progress_interval=5.0,
+                        **kwargs):
+        return await self.deliver(((chat_id, chat_id, text) for chat_id in chat_ids),
+                                  on_delivered, on_progress, progress_interval, **kwargs)
+
+    async def deliver(self, messages, on_delivered=None, on_progress=None, progress_interval=5.0, **kwargs):
+        # messages: (ключ, chat_id, текст); on_delivered получает ключ, ошибки копятся в result.errors[ключ]
+        messages = list(messages)
+        result = BroadcastResult(total=len(messages))
+        self._forget_idle_chats()
+        pending = iter(messages)
+
+        async def worker():
+            for key, chat_id, text in pending:
+                error = await self.send(chat_id, text, result, **kwargs)
+                if error is None:
+                    result.delivered += 1
+                    self._count("sent")
+                    if on_delivered is not None:
+                        try:
+                            await on_delivered(key)
+                        except Exception as e:
+                            logging.error(f"Ошибка обработки доставки для {chat_id}: {e}")
+                else:
+                    result.failed += 1
+                    result.errors[key] = error
+                    self._count("failed")
+
+        async def reporter():
+            while True:
+                await asyncio.sleep(progress_interval)
+                try:
+                    await on_progress(result)
+                except Exception as e:
+                    logging.warning(f"Не удалось отправить прогресс рассылки: {e}")
+
+        progress = asyncio.create_task(reporter()) if on_progress is not None else None
+        try:
+            await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(messages)))))
+        finally:
+            if progress is not None:
+                progress.cancel()
+        logging.info(f"Рассылка завершена: доставлено {result.delivered}/{result.total}, "
+                     f"ошибок {result.failed}, RetryAfter {result.throttled}")
+        return result
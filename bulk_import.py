@@ -0,0 +1,373 @@
+import asyncio
+import csv
+import io
+import json
+import multiprocessing
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date
+from itertools import islice
+from xml.etree import ElementTree
+
+from archive import import_archived
+from export import SHEETS
+
+BATCH_ROWS = 5000
+MAX_ERRORS_SHOWN = 10
+IMPORT_FORMATS = ("xlsx", "csv", "jsonl")
+
+# Допустимые значения часов: не больше, чем часов в неделе / в самом длинном месяце
+MAX_HOURS = {"week": 7 * 24, "month": 31 * 24}
+
+IMPORT_USAGE = (
+    "❗ Пришлите файл xlsx, csv или jsonl в формате /export с подписью `/import` "
+    "или ответьте `/import` на сообщение с файлом.\n"
+    "Столбцы: User ID (необязательно), First Name, Last Name, Year, Week или Month, Hours. "
+    "Без User ID строки сопоставляются с пользователями по имени и фамилии."
+)
+
+# UPSERT меняет строку, только если значение действительно другое: rowcount = вставленные + изменённые
+IMPORT_USER_SQL = """
+    INSERT INTO users (user_id, first_name, last_name) VALUES (?, ?, ?)
+    ON CONFLICT(user_id) DO UPDATE SET first_name = excluded.first_name, last_name = excluded.last_name
+    WHERE users.first_name IS NOT excluded.first_name OR users.last_name IS NOT excluded.last_name
+"""
+IMPORT_WEEK_SQL = """
+    INSERT INTO weekly_hours (user_id, year, week, hours) VALUES (?, ?, ?, ?)
+    ON CONFLICT(user_id, year, week) DO UPDATE SET hours = excluded.hours
+    WHERE weekly_hours.hours IS NOT excluded.hours
+"""
+IMPORT_MONTH_SQL = """
+    INSERT INTO monthly_hours (user_id, year, month, hours) VALUES (?, ?, ?, ?)
+    ON CONFLICT(user_id, year, month) DO UPDATE SET hours = excluded.hours
+    WHERE monthly_hours.hours IS NOT excluded.hours
+"""
+
+SHEET_PERIODS = {title.lower(): period for title, _, period, _ in SHEETS}
+HEADERS = {
+    "sheet": "sheet", "user id": "user_id", "user_id": "user_id", "first name": "first_name",
+    "first_name": "first_name", "last name": "last_name", "last_name": "last_name",
+    "year": "year", "week": "week", "month": "month", "hours": "hours",
+}
+
+
+@dataclass
+class ParsedImport:
+    users: dict = field(default_factory=dict)
+    weeks: dict = field(default_factory=dict)
+    months: dict = field(default_factory=dict)
+    rows: int = 0
+    duplicates: int = 0
+    rejected: int = 0
+    errors: list = field(default_factory=list)
+
+    def reject(self, where, reason):
+        self.rejected += 1
+        if len(self.errors) < MAX_ERRORS_SHOWN:
+            self.errors.append(f"{where}: {reason}")
+
+
+@dataclass
+class ImportResult:
+    parsed: ParsedImport
+    users_inserted: int = 0
+    users_updated: int = 0
+    inserted: int = 0
+    updated: int = 0
+
+
+def import_format(filename):
+    ext = (filename or "").rsplit(".", 1)[-1].lower()
+    return ext if ext in IMPORT_FORMATS else None
+
+
+def _header(values):
+    return [HEADERS.get(str(value or "").strip().lower()) for value in values]
+
+
+def iter_csv(f):
+    text = io.TextIOWrapper(f, encoding="utf-8-sig", newline="")
+    reader = csv.reader(text)
+    header = _header(next(reader, []))
+    for line, values in enumerate(reader, start=2):
+        if any(values):
+            yield f"строка {line}", None, dict(zip(header, values))
+
+
+XLSX_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+PKG_REL_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+
+_columns = {}
+
+
+def _xlsx_column(ref):
+    # "AB12" -> 27; буквенная часть повторяется в каждой строке, поэтому кэшируется
+    letters = ref.rstrip("0123456789")
+    index = _columns.get(letters)
+    if index is None:
+        index = 0
+        for ch in letters:
+            index = index * 26 + ord(ch.upper()) - 64
+        index = _columns[letters] = index - 1
+    return index
+
+
+def _xlsx_text(element):
+    return "".join(t.text or "" for t in element.iter(f"{XLSX_NS}t"))
+
+
+def iter_xlsx(f):
+    # Лист читается iterparse прямо из zip: строки разбираются по одной и сразу освобождаются.
+    # Это в разы быстрее openpyxl в read_only-режиме и тоже не держит лист в памяти.
+    with zipfile.ZipFile(f) as archive:
+        names = set(archive.namelist())
+        shared = []
+        if "xl/sharedStrings.xml" in names:
+            with archive.open("xl/sharedStrings.xml") as xml:
+                for _, element in ElementTree.iterparse(xml):
+                    if element.tag == f"{XLSX_NS}si":
+                        shared.append(_xlsx_text(element))
+                        element.clear()
+        with archive.open("xl/_rels/workbook.xml.rels") as xml:
+            targets = {rel.get("Id"): rel.get("Target") for rel in ElementTree.parse(xml).getroot()
+                       if rel.tag == f"{PKG_REL_NS}Relationship"}
+        with archive.open("xl/workbook.xml") as xml:
+            sheets = [(sheet.get("name"), targets.get(sheet.get(f"{REL_NS}id")))
+                      for sheet in ElementTree.parse(xml).getroot().iter(f"{XLSX_NS}sheet")]
+        for title, target in sheets:
+            path = target.lstrip("/") if target.startswith("/") else "xl/" + target
+            if path not in names:
+                continue
+            header = None
+            with archive.open(path) as xml:
+                for _, element in ElementTree.iterparse(xml):
+                    if element.tag != f"{XLSX_NS}row":
+                        continue
+                    values = {}
+                    for position, cell in enumerate(element.iter(f"{XLSX_NS}c")):
+                        ref = cell.get("r")
+                        column = _xlsx_column(ref) if ref else position
+                        kind = cell.get("t")
+                        v = cell.find(f"{XLSX_NS}v")
+                        if kind == "inlineStr":
+                            values[column] = _xlsx_text(cell)
+                        elif v is None or v.text is None:
+                            continue
+                        elif kind == "s":
+                            values[column] = shared[int(v.text)]
+                        elif kind in ("str", "e"):
+                            values[column] = v.text
+                        else:
+                            values[column] = float(v.text)
+                    line = int(element.get("r") or 0)
+                    element.clear()
+                    if header is None:
+                        header = {column: name for column, name in zip(values, _header(values.values()))}
+                    elif values:
+                        yield (f"{title}, строка {line}", title,
+                               {header[column]: value for column, value in values.items() if column in header})
+
+
+def iter_jsonl(f):
+    for line, raw in enumerate(io.TextIOWrapper(f, encoding="utf-8"), start=1):
+        if raw.strip():
+            try:
+                record = json.loads(raw)
+            except ValueError:
+                record = {}
+            yield f"строка {line}", None, record if isinstance(record, dict) else {}
+
+
+READERS = {"xlsx": iter_xlsx, "csv": iter_csv, "jsonl": iter_jsonl}
+
+
+def _text(value):
+    return str(value).strip() if value is not None else ""
+
+
+def _int(value):
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, int):
+        return value
+    text = _text(value)
+    return int(text) if text.isdigit() else None
+
+
+def _hours(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(_text(value).replace(",", "."))
+    except ValueError:
+        return None
+
+
+class Validator:
+    # Проверка и сопоставление пользователей; users — снимок реестра [(user_id, (имя, фамилия))].
+
+    def __init__(self, users):
+        self.users = dict(users)
+        self.names = {}
+        for user_id, (first_name, last_name) in self.users.items():
+            self._index(user_id, first_name, last_name)
+
+    def _index(self, user_id, first_name, last_name):
+        key = (_text(first_name).lower(), _text(last_name).lower())
+        self.names.setdefault(key, set()).add(user_id)
+
+    def resolve(self, record, parsed):
+        # user_id или текст ошибки
+        first_name, last_name = _text(record.get("first_name")), _text(record.get("last_name"))
+        raw_id = record.get("user_id")
+        if _text(raw_id):
+            user_id = _int(raw_id)
+            if not user_id:
+                return None, f"некорректный User ID «{raw_id}»"
+            known = self.users.get(user_id)
+            if first_name and last_name and known != (first_name, last_name):
+                if known is not None:
+                    self.names.get((_text(known[0]).lower(), _text(known[1]).lower()), set()).discard(user_id)
+                self.users[user_id] = (first_name, last_name)
+                self._index(user_id, first_name, last_name)
+                parsed.users[user_id] = (user_id, first_name, last_name)
+            elif known is None:
+                return None, f"пользователь {user_id} не найден, а имя и фамилия не указаны"
+            return user_id, None
+        if not first_name or not last_name:
+            return None, "нет ни User ID, ни имени и фамилии"
+        candidates = self.names.get((first_name.lower(), last_name.lower()), ())
+        if len(candidates) == 1:
+            return next(iter(candidates)), None
+        if not candidates:
+            return None, f"пользователь «{first_name} {last_name}» не найден"
+        return None, f"несколько пользователей «{first_name} {last_name}», укажите User ID"
+
+    def validate(self, batch, parsed):
+        for where, sheet, record in batch:
+            parsed.rows += 1
+            period = SHEET_PERIODS.get(_text(sheet or record.get("sheet")).lower())
+            if period is None:
+                period = "week" if _text(record.get("week")) else "month" if _text(record.get("month")) else None
+            if period is None:
+                parsed.reject(where, "не указан лист (WeeklyHours/MonthlyHours) или столбец Week/Month")
+                continue
+            year, value, hours = _int(record.get("year")), _int(record.get(period)), _hours(record.get("hours"))
+            if year is None or not 2000 <= year <= 2100:
+                parsed.reject(where, f"некорректный год «{record.get('year')}»")
+                continue
+            if value is None or not _valid_period(period, year, value):
+                parsed.reject(where, f"некорректный {'номер недели' if period == 'week' else 'месяц'} "
+                                     f"«{record.get(period)}»")
+                continue
+            if hours is None or not 0 <= hours <= MAX_HOURS[period]:
+                parsed.reject(where, f"некорректное число часов «{record.get('hours')}»")
+                continue
+            user_id, error = self.resolve(record, parsed)
+            if error:
+                parsed.reject(where, error)
+                continue
+            target = parsed.weeks if period == "week" else parsed.months
+            key = (user_id, year, value)
+            if key in target:
+                parsed.duplicates += 1
+            target[key] = hours
+
+
+def _valid_period(period, year, value):
+    if period == "month":
+        return 1 <= value <= 12
+    try:
+        date.fromisocalendar(year, value, 1)
+        return True
+    except ValueError:
+        return False
+
+
+def read_import(f, fmt, users, batch_rows=BATCH_ROWS):
+    # Файл читается потоково и проверяется пачками по batch_rows,
+    # в памяти остаются только проверенные значения (повтор одного периода — побеждает последняя строка).
+    parsed = ParsedImport()
+    validator = Validator(users)
+    rows = READERS[fmt](f)
+    try:
+        while True:
+            batch = list(islice(rows, batch_rows))
+            if not batch:
+                break
+            validator.validate(batch, parsed)
+    except Exception as e:
+        # битый архив xlsx, не та кодировка и т.п.: то, что успели прочитать, не применяем
+        raise ValueError(f"не удалось прочитать файл: {e}") from e
+    return parsed
+
+
+def read_import_file(path, fmt, users, batch_rows=BATCH_ROWS):
+    with open(path, "rb") as f:
+        return read_import(f, fmt, users, batch_rows)
+
+
+async def parse_upload(path, fmt, users):
+    # Разбор — почти чистый Python: в потоке он отнимал бы GIL у event loop и тормозил ответы
+    # остальным пользователям, поэтому файл разбирается в отдельном процессе.
+    loop = asyncio.get_running_loop()
+    pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        return await loop.run_in_executor(pool, read_import_file, path, fmt, users)
+    finally:
+        pool.shutdown(wait=False)
+
+
+def apply_import(conn, parsed):
+    # Выполняется в потоке-писателе одной транзакцией (Database.run_write): либо всё, либо ничего.
+    result = ImportResult(parsed)
+    result.users_inserted, result.users_updated = _upsert(conn, "users", ("user_id",), IMPORT_USER_SQL,
+                                                          list(parsed.users.values()))
+    for table, period, sql, values in (("weekly_hours", "week", IMPORT_WEEK_SQL, parsed.weeks),
+                                       ("monthly_hours", "month", IMPORT_MONTH_SQL, parsed.months)):
+        archived, archived_updated = import_archived(conn, table, period, values)
+        inserted, updated = _upsert(conn, table, ("user_id", "year", period), sql,
+                                    [key + (hours,) for key, hours in values.items() if key not in archived])
+        result.inserted += inserted
+        result.updated += updated + archived_updated
+    return result
+
+
+def _upsert(conn, table, key, sql, rows):
+    # rows начинаются с ключа key (столбцы уникального индекса table). Новые строки — ключи, которых
+    # в таблице ещё нет: считаются поиском по индексу для каждой строки файла, а не count(*) по всей
+    # таблице до и после, который держал бы писателя на размере базы.
+    columns = ", ".join(key)
+    conn.execute(f"CREATE TEMP TABLE IF NOT EXISTS import_{table} ({columns}, PRIMARY KEY ({columns})) WITHOUT ROWID")
+    conn.execute(f"DELETE FROM import_{table}")
+    conn.executemany(f"INSERT INTO import_{table} VALUES ({', '.join('?' * len(key))})",
+                     (row[:len(key)] for row in rows))
+    match = " AND ".join(f"t.{column} = k.{column}" for column in key)
+    inserted = conn.execute(f"SELECT count(*) FROM import_{table} k "
+                            f"WHERE NOT EXISTS (SELECT 1 FROM main.{table} t WHERE {match})").fetchone()[0]
+    changed = conn.executemany(sql, rows).rowcount
+    return inserted, max(changed, 0) - inserted
+
+
+def render_import(result):
+    parsed = result.parsed
+    lines = [
+        "📥 Импорт завершён.",
+        f"Строк в файле: {parsed.rows}",
+        f"Добавлено записей часов: {result.inserted}",
+        f"Обновлено: {result.updated}",
+        f"Без изменений: {len(parsed.weeks) + len(parsed.months) - result.inserted - result.updated}",
+        f"Отклонено: {parsed.rejected}",
+    ]
+    if parsed.duplicates:
+        lines.append(f"Повторов периода в файле (взята последняя строка): {parsed.duplicates}")
+    if result.users_inserted or result.users_updated:
+        lines.append(f"Пользователи: добавлено {result.users_inserted}, обновлено {result.users_updated}")
+    if parsed.errors:
+        lines.append("")
+        lines.append("Первые ошибки:")
+        lines += [f"• {error}" for error in parsed.errors]
+    return "\n".join(lines)
@@ -0,0 +1,546 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from metrics import TimedConnection
+
+DB_PATH = 'bot_database.db'
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    first_name TEXT,
+    last_name TEXT
+)''',
+    '''CREATE TABLE IF NOT EXISTS weekly_hours (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER,
+    year INTEGER,
+    week INTEGER,
+    hours REAL,
+    UNIQUE(user_id, year, week),
+    FOREIGN KEY(user_id) REFERENCES users(user_id)
+)''',
+    '''CREATE TABLE IF NOT EXISTS monthly_hours (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER,
+    year INTEGER,
+    month INTEGER,
+    hours REAL,
+    UNIQUE(user_id, year, month),
+    FOREIGN KEY(user_id) REFERENCES users(user_id)
+)''',
+    '''CREATE INDEX IF NOT EXISTS idx_weekly_hours_period ON weekly_hours(year, week)''',
+    '''CREATE INDEX IF NOT EXISTS idx_monthly_hours_period ON monthly_hours(year, month)''',
+    '''CREATE TABLE IF NOT EXISTS fsm_states (
+    key TEXT PRIMARY KEY,
+    state TEXT,
+    data TEXT,
+    updated_at REAL
+)''',
+    '''CREATE INDEX IF NOT EXISTS idx_fsm_states_updated_at ON fsm_states(updated_at)''',
+    '''CREATE TABLE IF NOT EXISTS data_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL
+)''',
+    '''INSERT OR IGNORE INTO data_version (id, version) VALUES (1, 0)''',
+    '''CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    dedup_key TEXT UNIQUE,
+    chat_id INTEGER,
+    text TEXT,
+    payload TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL,
+    last_error TEXT,
+    created_at REAL,
+    sent_at REAL
+)''',
+    '''CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(status, next_attempt_at)''',
+    '''CREATE TABLE IF NOT EXISTS scheduler_state (
+    name TEXT PRIMARY KEY,
+    value TEXT
+)''',
+]
+
+# Таблицы часов и их столбец периода
+HOURS_TABLES = {"weekly_hours": "week", "monthly_hours": "month"}
+
+# Архив (холодный уровень) — отдельный файл, подключённый к каждому соединению как схема archive.
+# Строки переносятся туда с теми же id, поэтому уникальные ключи и порядок выгрузки сохраняются.
+ARCHIVE_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS archive.weekly_hours (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER,
+    year INTEGER,
+    week INTEGER,
+    hours REAL,
+    UNIQUE(user_id, year, week)
+)''',
+    '''CREATE TABLE IF NOT EXISTS archive.monthly_hours (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER,
+    year INTEGER,
+    month INTEGER,
+    hours REAL,
+    UNIQUE(user_id, year, month)
+)''',
+    '''CREATE INDEX IF NOT EXISTS archive.idx_weekly_hours_period ON weekly_hours(year, week)''',
+    '''CREATE INDEX IF NOT EXISTS archive.idx_monthly_hours_period ON monthly_hours(year, month)''',
+]
+
+# Столбцы, добавленные после первой версии схемы: (таблица, столбец, определение)
+COLUMNS = [
+    ("users", "timezone", "TEXT"),
+    ("users", "remind_at", "TEXT"),
+]
+
+# Любое изменение users/weekly_hours/monthly_hours увеличивает data_version.version,
+# по нему кэшируются отчёты
+for _table in ("users", "weekly_hours", "monthly_hours"):
+    for _event in ("INSERT", "UPDATE", "DELETE"):
+        SCHEMA.append(f'''CREATE TRIGGER IF NOT EXISTS bump_version_{_table}_{_event.lower()}
+    AFTER {_event} ON {_table}
+BEGIN
+    UPDATE data_version SET version = version + 1 WHERE id = 1;
+END''')
+
+# Сводки, которые триггеры поддерживают в актуальном состоянии при каждой записи часов:
+# user_month_rollup — по пользователю и календарному месяцу сумма недельных часов (неделя относится
+# к месяцу своего четверга, как в ISO 8601) и план из monthly_hours; period_rollup — итоги команды
+# по каждой неделе и месяцу. Отчёты читают только их и не пересчитывают сырые таблицы.
+ROLLUP_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS user_month_rollup (
+    user_id INTEGER,
+    year INTEGER,
+    month INTEGER,
+    week_hours REAL NOT NULL DEFAULT 0,
+    weeks INTEGER NOT NULL DEFAULT 0,
+    plan_hours REAL,
+    PRIMARY KEY (user_id, year, month)
+) WITHOUT ROWID''',
+    '''CREATE INDEX IF NOT EXISTS idx_user_month_rollup_period ON user_month_rollup(year, month)''',
+    # ISO-неделя -> месяц её четверга; заполнен на годы 2000–2100 (тот же диапазон проверяет /import)
+    '''CREATE TABLE IF NOT EXISTS iso_week_month (
+    year INTEGER,
+    week INTEGER,
+    month_year INTEGER,
+    month INTEGER,
+    PRIMARY KEY (year, week)
+) WITHOUT ROWID''',
+    '''CREATE TABLE IF NOT EXISTS period_rollup (
+    kind TEXT,
+    year INTEGER,
+    period INTEGER,
+    hours REAL NOT NULL DEFAULT 0,
+    entries INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (kind, year, period)
+) WITHOUT ROWID''',
+]
+
+
+def _week_month(row):
+    # (год, месяц) четверга ISO-недели row.year/row.week: 4 января всегда попадает в первую неделю
+    jan4 = f"printf('%04d-01-04', {row}.year)"
+    thursday = (f"date({jan4}, printf('%+d days', 7 * ({row}.week - 1) + 3 "
+                f"- (CAST(strftime('%w', {jan4}) AS INTEGER) + 6) % 7))")
+    return f"CAST(strftime('%Y', {thursday}) AS INTEGER)", f"CAST(strftime('%m', {thursday}) AS INTEGER)"
+
+
+FILL_ISO_WEEK_MONTH = f'''
+    WITH RECURSIVE t(year, week) AS (
+        SELECT 2000, 1
+        UNION ALL
+        SELECT CASE WHEN week = 53 THEN year + 1 ELSE year END, CASE WHEN week = 53 THEN 1 ELSE week + 1 END
+        FROM t WHERE year < 2100 OR week < 53
+    )
+    INSERT OR IGNORE INTO iso_week_month (year, week, month_year, month)
+    SELECT year, week, {_week_month("t")[0]}, {_week_month("t")[1]} FROM t
+    -- 53-я неделя есть не в каждом году: у "лишней" четверг уже в следующем ISO-году
+    WHERE week < 53 OR {_week_month("t")[0]} = year
+'''
+
+
+def _week_month_lookup(row):
+    # по таблице быстрее, чем считать дату в каждом триггере
+    key = f"year = {row}.year AND week = {row}.week"
+    return (f"(SELECT month_year FROM iso_week_month WHERE {key})",
+            f"(SELECT month FROM iso_week_month WHERE {key})")
+
+
+def _rollup_add(table, row):
+    if table == "weekly_hours":
+        year, month = _week_month_lookup(row)
+        return f'''
+    INSERT INTO user_month_rollup (user_id, year, month, week_hours, weeks)
+    VALUES ({row}.user_id, {year}, {month}, {row}.hours, 1)
+    ON CONFLICT(user_id, year, month) DO UPDATE SET
+        week_hours = week_hours + excluded.week_hours, weeks = weeks + 1;
+    INSERT INTO period_rollup (kind, year, period, hours, entries) VALUES ('week', {row}.year, {row}.week, {row}.hours, 1)
+    ON CONFLICT(kind, year, period) DO UPDATE SET hours = hours + excluded.hours, entries = entries + 1;'''
+    return f'''
+    INSERT INTO user_month_rollup (user_id, year, month, plan_hours) VALUES ({row}.user_id, {row}.year, {row}.month, {row}.hours)
+    ON CONFLICT(user_id, year, month) DO UPDATE SET plan_hours = excluded.plan_hours;
+    INSERT INTO period_rollup (kind, year, period, hours, entries) VALUES ('month', {row}.year, {row}.month, {row}.hours, 1)
+    ON CONFLICT(kind, year, period) DO UPDATE SET hours = hours + excluded.hours, entries = entries + 1;'''
+
+
+def _rollup_remove(table, row):
+    if table == "weekly_hours":
+        year, month = _week_month_lookup(row)
+        user = f"user_id = {row}.user_id AND year = {year} AND month = {month}"
+        period = f"kind = 'week' AND year = {row}.year AND period = {row}.week"
+        change = f"week_hours = week_hours - {row}.hours, weeks = weeks - 1"
+    else:
+        user = f"user_id = {row}.user_id AND year = {row}.year AND month = {row}.month"
+        period = f"kind = 'month' AND year = {row}.year AND period = {row}.month"
+        change = "plan_hours = NULL"
+    return f'''
+    UPDATE user_month_rollup SET {change} WHERE {user};
+    DELETE FROM user_month_rollup WHERE {user} AND weeks = 0 AND plan_hours IS NULL;
+    UPDATE period_rollup SET hours = hours - {row}.hours, entries = entries - 1 WHERE {period};
+    DELETE FROM period_rollup WHERE {period} AND entries = 0;'''
+
+
+for _table in ("weekly_hours", "monthly_hours"):
+    for _event, _body in (("INSERT", _rollup_add(_table, "NEW")),
+                          ("DELETE", _rollup_remove(_table, "OLD")),
+                          ("UPDATE", _rollup_remove(_table, "OLD") + _rollup_add(_table, "NEW"))):
+        ROLLUP_SCHEMA.append(f'''CREATE TRIGGER IF NOT EXISTS rollup_{_table}_{_event.lower()}
+    AFTER {_event} ON {_table}
+BEGIN{_body}
+END''')
+
+REBUILD_ROLLUPS = [
+    "DELETE FROM user_month_rollup",
+    "DELETE FROM period_rollup",
+    '''INSERT INTO user_month_rollup (user_id, year, month, week_hours, weeks)
+    SELECT w.user_id, m.month_year, m.month, sum(w.hours), count(*)
+    FROM weekly_hours_all w JOIN iso_week_month m ON m.year = w.year AND m.week = w.week
+    GROUP BY 1, 2, 3''',
+    '''INSERT INTO user_month_rollup (user_id, year, month, plan_hours)
+    SELECT user_id, year, month, hours FROM monthly_hours_all WHERE true
+    ON CONFLICT(user_id, year, month) DO UPDATE SET plan_hours = excluded.plan_hours''',
+    '''INSERT INTO period_rollup (kind, year, period, hours, entries)
+    SELECT 'week', year, week, sum(hours), count(*) FROM weekly_hours_all GROUP BY year, week''',
+    '''INSERT INTO period_rollup (kind, year, period, hours, entries)
+    SELECT 'month', year, month, sum(hours), count(*) FROM monthly_hours_all GROUP BY year, month''',
+]
+
+# Частичный пересчёт за периоды из temp.stale_weeks / temp.stale_months. Источники ({weeks} и т.п.)
+# подставляются отдельно для каждого уровня: соединение с представлением *_all sqlite материализует целиком.
+STALE_PERIODS = [
+    "CREATE TEMP TABLE IF NOT EXISTS stale_weeks (year INTEGER, week INTEGER, PRIMARY KEY (year, week)) WITHOUT ROWID",
+    "CREATE TEMP TABLE IF NOT EXISTS stale_months (year INTEGER, month INTEGER, PRIMARY KEY (year, month)) WITHOUT ROWID",
+    "DELETE FROM stale_weeks",
+    "DELETE FROM stale_months",
+]
+REFRESH_SOURCES = {
+    "weeks": '''SELECT t.year, t.week, t.hours FROM stale_weeks s
+        JOIN {tier}.weekly_hours t ON t.year = s.year AND t.week = s.week''',
+    "month_weeks": '''SELECT t.user_id, m.month_year, m.month, t.hours FROM stale_months s
+        JOIN iso_week_month m ON m.month_year = s.year AND m.month = s.month
+        JOIN {tier}.weekly_hours t ON t.year = m.year AND t.week = m.week''',
+    "plans": '''SELECT t.user_id, t.year, t.month, t.hours FROM stale_months s
+        JOIN {tier}.monthly_hours t ON t.year = s.year AND t.month = s.month''',
+}
+REFRESH_ROLLUPS = [
+    # месяц пересчитывается и тогда, когда изменилась только одна из его недель
+    '''INSERT OR IGNORE INTO stale_months (year, month)
+    SELECT m.month_year, m.month FROM stale_weeks s JOIN iso_week_month m ON m.year = s.year AND m.week = s.week''',
+    "DELETE FROM user_month_rollup WHERE (year, month) IN (SELECT year, month FROM stale_months)",
+    "DELETE FROM period_rollup WHERE kind = 'week' AND (year, period) IN (SELECT year, week FROM stale_weeks)",
+    "DELETE FROM period_rollup WHERE kind = 'month' AND (year, period) IN (SELECT year, month FROM stale_months)",
+    '''INSERT INTO user_month_rollup (user_id, year, month, week_hours, weeks)
+    SELECT user_id, month_year, month, sum(hours), count(*) FROM ({month_weeks}) GROUP BY 1, 2, 3''',
+    '''INSERT INTO user_month_rollup (user_id, year, month, plan_hours)
+    SELECT user_id, year, month, hours FROM ({plans}) WHERE true
+    ON CONFLICT(user_id, year, month) DO UPDATE SET plan_hours = excluded.plan_hours''',
+    '''INSERT INTO period_rollup (kind, year, period, hours, entries)
+    SELECT 'week', year, week, sum(hours), count(*) FROM ({weeks}) GROUP BY year, week''',
+    '''INSERT INTO period_rollup (kind, year, period, hours, entries)
+    SELECT 'month', year, month, sum(hours), count(*) FROM ({plans}) GROUP BY year, month''',
+]
+
+
+def attach_archive(conn, path, readonly=False):
+    # Подключает архив и создаёт временные представления weekly_hours_all / monthly_hours_all
+    # поверх обоих уровней: через них читается вся история. Без архива это просто основные таблицы.
+    if path and (not readonly or os.path.exists(path)):
+        target = Path(path).resolve().as_uri() + "?mode=ro" if readonly else path
+        conn.execute("ATTACH DATABASE ? AS archive", (target,))
+        if not readonly:
+            conn.execute("PRAGMA archive.journal_mode=WAL")
+            conn.execute("PRAGMA archive.synchronous=FULL")
+    archived = archive_attached(conn)
+    for table, period in HOURS_TABLES.items():
+        select = f"SELECT id, user_id, year, {period}, hours FROM main.{table}"
+        if archived:
+            select = f"SELECT id, user_id, year, {period}, hours FROM archive.{table} UNION ALL {select}"
+        conn.execute(f"CREATE TEMP VIEW IF NOT EXISTS {table}_all AS {select}")
+
+
+def archive_attached(conn):
+    return any(name == "archive" for _, name, _ in conn.execute("PRAGMA database_list"))
+
+
+def rebuild_rollups(conn):
+    for sql in REBUILD_ROLLUPS:
+        conn.execute(sql)
+
+
+def refresh_rollups(conn, weeks, months):
+    # Пересчёт сводок только за периоды weeks [(год, неделя)] и months [(год, месяц)] по обоим уровням.
+    # Нужен, когда строки меняются в архиве или переезжают между уровнями: триггеры видят только main.
+    for sql in STALE_PERIODS:
+        conn.execute(sql)
+    conn.executemany("INSERT OR IGNORE INTO stale_weeks (year, week) VALUES (?, ?)", weeks)
+    conn.executemany("INSERT OR IGNORE INTO stale_months (year, month) VALUES (?, ?)", months)
+    tiers = ("main", "archive") if archive_attached(conn) else ("main",)
+    sources = {name: " UNION ALL ".join(sql.format(tier=tier) for tier in tiers)
+               for name, sql in REFRESH_SOURCES.items()}
+    for sql in REFRESH_ROLLUPS:
+        conn.execute(sql.format(**sources))
+    # триггеры data_version есть только на основных таблицах, а правки архива тоже меняют выгрузки
+    conn.execute("UPDATE data_version SET version = version + 1 WHERE id = 1")
+
+
+# Вставка только если за период ещё ничего нет: rowcount == 0 означает "уже введено"
+INSERT_WEEK_HOURS = """
+    INSERT INTO weekly_hours (user_id, year, week, hours) VALUES (?, ?, ?, ?)
+    ON CONFLICT(user_id, year, week) DO NOTHING
+"""
+UPSERT_WEEK_HOURS = """
+    INSERT INTO weekly_hours (user_id, year, week, hours) VALUES (?, ?, ?, ?)
+    ON CONFLICT(user_id, year, week) DO UPDATE SET hours = excluded.hours
+"""
+INSERT_MONTH_HOURS = """
+    INSERT INTO monthly_hours (user_id, year, month, hours) VALUES (?, ?, ?, ?)
+    ON CONFLICT(user_id, year, month) DO NOTHING
+"""
+
+
+class Database:
+    # Все обращения к sqlite выполняются вне event loop:
+    # один поток-писатель (запись и commit строго по очереди) и небольшой пул читателей.
+    # У каждого потока своё соединение; WAL позволяет читать параллельно с записью,
+    # а кэш подготовленных выражений sqlite3 переиспользует скомпилированные запросы.
+    #
+    # submit() — групповая запись: одиночные INSERT/UPDATE из разных хендлеров копятся
+    # до batch_delay секунд или batch_rows строк и фиксируются одним commit (одним fsync).
+    #
+    # С archive_path к каждому соединению подключается архив старых часов (см. attach_archive).
+    #
+    # С metrics каждое выражение замеряется (db_statement_seconds), а вызовы run_read/run_write —
+    # целиком вместе с fetch и commit (db_call_seconds).
+
+    def __init__(self, path=DB_PATH, readers=2, statement_cache=256, batch_rows=200, batch_delay=0.005,
+                 metrics=None, archive_path=None):
+        self.path = path
+        self.archive_path = archive_path
+        self.metrics = metrics
+        self.readers = readers
+        self.statement_cache = statement_cache
+        self.batch_rows = batch_rows
+        self.batch_delay = batch_delay
+        self.commits = 0
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._writer = None
+        self._reader_pool = None
+        self._queue = None
+        self._flusher = None
+
+    def _connect(self, writer=False):
+        if self.metrics is not None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=self.statement_cache,
+                                   factory=TimedConnection)
+            conn.metrics = self.metrics
+        else:
+            conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=self.statement_cache)
+        # действует только для нового файла (до WAL и первой таблицы); старые базы переводит Archiver.vacuum.
+        # Только у писателя: на существующей базе прагма берёт блокировку записи, и читатель, открытый
+        # посреди транзакции писателя, ронял её с "database is locked"
+        if writer:
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=FULL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        attach_archive(conn, self.archive_path)
+        self._local.conn = conn
+        with self._lock:
+            self._connections.append(conn)
+
+    def _conn(self):
+        return self._local.conn
+
+    async def connect(self):
+        if self._writer is not None:
+            return
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer",
+                                          initializer=self._connect, initargs=(True,))
+        # схему создаём до запуска читателей, чтобы WAL уже был включён
+        await self.run_write(self._create_schema)
+        self._reader_pool = ThreadPoolExecutor(max_workers=self.readers, thread_name_prefix="db-reader",
+                                               initializer=self._connect)
+        self._queue = asyncio.Queue()
+        self._flusher = asyncio.create_task(self._flush_loop())
+
+    def _create_schema(self, conn):
+        has_rollups = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user_month_rollup'").fetchone()
+        for ddl in SCHEMA + ROLLUP_SCHEMA + (ARCHIVE_SCHEMA if self.archive_path else []):
+            conn.execute(ddl)
+        if not conn.execute("SELECT 1 FROM iso_week_month LIMIT 1").fetchone():
+            conn.execute(FILL_ISO_WEEK_MONTH)
+        for table, column, definition in COLUMNS:
+            existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+            if column not in existing:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        if not has_rollups:
+            # сводки появились в уже заполненной базе — считаем их один раз по сырым таблицам
+            rebuild_rollups(conn)
+
+    async def close(self):
+        if self._flusher is not None:
+            # дописываем всё, что уже стоит в очереди, и только потом останавливаемся
+            await self._queue.join()
+            self._flusher.cancel()
+            self._flusher = None
+        pools = [p for p in (self._reader_pool, self._writer) if p is not None]
+        self._writer = self._reader_pool = None
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._shutdown, pools)
+
+    def _shutdown(self, pools):
+        for pool in pools:
+            pool.shutdown(wait=True)
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+
+    def _observe(self, kind, fn, started):
+        if self.metrics is not None:
+            self.metrics.observe("db_call_seconds", time.perf_counter() - started,
+                                 kind=kind, fn=getattr(fn, "__name__", "unknown"))
+
+    def _committed(self, rows):
+        self.commits += 1
+        if self.metrics is not None:
+            self.metrics.inc("db_commits_total")
+            self.metrics.inc("db_committed_rows_total", rows)
+
+    def _transaction(self, fn, args):
+        conn = self._conn()
+        started = time.perf_counter()
+        try:
+            result = fn(conn, *args)
+            conn.commit()
+            self._committed(1)
+            return result
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            self._observe("write", fn, started)
+
+    def _write_batch(self, batch):
+        # каждая строка в своём savepoint: ошибка в одной не откатывает остальные
+        conn = self._conn()
+        started = time.perf_counter()
+        results = []
+        conn.execute("BEGIN")
+        try:
+            for sql, params, _ in batch:
+                conn.execute("SAVEPOINT row")
+                try:
+                    results.append(conn.execute(sql, params).rowcount)
+                except sqlite3.Error as e:
+                    conn.execute("ROLLBACK TO row")
+                    results.append(e)
+                conn.execute("RELEASE row")
+            conn.commit()
+            self._committed(len(batch))
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            self._observe("batch", self._write_batch, started)
+        return results
+
+    async def _flush_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            if self._queue.qsize() < self.batch_rows - 1:
+                await asyncio.sleep(self.batch_delay)
+            while len(batch) < self.batch_rows and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                results = await loop.run_in_executor(self._writer, self._write_batch, batch)
+            except Exception as e:
+                results = [e] * len(batch)
+            for (_, _, future), result in zip(batch, results):
+                if not future.done():
+                    if isinstance(result, Exception):
+                        future.set_exception(result)
+                    else:
+                        future.set_result(result)
+                self._queue.task_done()
+
+    async def submit(self, sql, params=()):
+        # возвращает rowcount уже после commit, поэтому отвечать пользователю можно сразу
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((sql, params, future))
+        return await future
+
+    def _read(self, fn, args):
+        started = time.perf_counter()
+        try:
+            return fn(self._conn(), *args)
+        finally:
+            self._observe("read", fn, started)
+
+    async def run_write(self, fn, *args):
+        # fn(conn, *args) выполняется в потоке-писателе одной транзакцией
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._writer, self._transaction, fn, args)
+
+    async def run_read(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._reader_pool, self._read, fn, args)
+
+    async def execute(self, sql, params=()):
+        return await self.run_write(_execute, sql, params)
+
+    async def executemany(self, sql, seq_of_params):
+        return await self.run_write(_executemany, sql, list(seq_of_params))
+
+    async def fetchone(self, sql, params=()):
+        return await self.run_read(_fetchone, sql, params)
+
+    async def fetchall(self, sql, params=()):
+        return await self.run_read(_fetchall, sql, params)
+
+
+def _execute(conn, sql, params):
+    return conn.execute(sql, params).rowcount
+
+
+def _executemany(conn, sql, seq_of_params):
+    return conn.executemany(sql, seq_of_params).rowcount
+
+
+def _fetchone(conn, sql, params):
+    return conn.execute(sql, params).fetchone()
+
+
+def _fetchall(conn, sql, params):
+    return conn.execute(sql, params).fetchall()
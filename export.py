@@ -0,0 +1,219 @@
+import asyncio
+import csv
+import io
+import json
+import re
+import sqlite3
+from calendar import monthrange
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date
+from pathlib import Path
+
+from db import attach_archive
+
+CHUNK_SIZE = 1000
+FORMATS = ("xlsx", "csv", "jsonl")
+
+# (лист, таблица, столбец периода, заголовок столбца периода)
+SHEETS = [
+    ("WeeklyHours", "weekly_hours", "week", "Week"),
+    ("MonthlyHours", "monthly_hours", "month", "Month"),
+]
+
+# Соединение и фильтры выполняются в SQL (диапазон периода идёт по индексу (year, week|month)),
+# строки читаются порциями по CHUNK_SIZE и сразу пишутся в файл, так что в памяти не держится вся таблица.
+# {table}_all — основная таблица вместе с архивом: выгрузка всегда охватывает всю историю.
+SHEET_SQL = """
+    SELECT t.user_id, u.first_name, u.last_name, t.year, t.{period}, t.hours
+    FROM {table}_all t LEFT JOIN users u ON u.user_id = t.user_id
+    WHERE {where}
+    ORDER BY t.id
+"""
+
+
+@dataclass(frozen=True)
+class ExportQuery:
+    weeks: tuple = None
+    months: tuple = None
+    user_ids: tuple = ()
+    fmt: str = "xlsx"
+
+    def span(self, period):
+        return self.weeks if period == "week" else self.months
+
+
+EXPORT_USAGE = (
+    "❗ Использование: `/export [months=2025-01..2025-03] [weeks=2025-W01..2025-W10] "
+    "[users=1,2,3] [format=xlsx|csv|jsonl]`"
+)
+
+
+def parse_span(value, pattern, limit):
+    bounds = []
+    for part in value.split(".."):
+        m = re.fullmatch(pattern, part.strip())
+        if not m or not 1 <= int(m.group(2)) <= limit:
+            raise ValueError(part)
+        bounds.append((int(m.group(1)), int(m.group(2))))
+    if len(bounds) == 1:
+        bounds.append(bounds[0])
+    if len(bounds) != 2 or bounds[0] > bounds[1]:
+        raise ValueError(value)
+    return tuple(bounds)
+
+
+def parse_export_args(args):
+    weeks = months = None
+    user_ids = ()
+    fmt = "xlsx"
+    for arg in args:
+        name, _, value = arg.partition("=")
+        name = name.lower()
+        if not value and name in FORMATS:
+            fmt = name
+        elif name == "format" and value.lower() in FORMATS:
+            fmt = value.lower()
+        elif name == "months":
+            months = parse_span(value, r"(\d{4})-(\d{1,2})", 12)
+        elif name == "weeks":
+            weeks = parse_span(value, r"(\d{4})-W?(\d{1,2})", 53)
+        elif name == "users" and all(uid.strip().isdigit() for uid in value.split(",")):
+            user_ids = tuple(sorted({int(uid) for uid in value.split(",")}))
+        else:
+            raise ValueError(arg)
+
+    # если задан только один диапазон, второй выводится из тех же дат
+    if months and not weeks:
+        (y1, m1), (y2, m2) = months
+        first, last = date(y1, m1, 1), date(y2, m2, monthrange(y2, m2)[1])
+        weeks = (first.isocalendar()[:2], last.isocalendar()[:2])
+    elif weeks and not months:
+        (y1, w1), (y2, w2) = weeks
+        first, last = date.fromisocalendar(y1, w1, 1), date.fromisocalendar(y2, w2, 7)
+        months = ((first.year, first.month), (last.year, last.month))
+    return ExportQuery(weeks=weeks, months=months, user_ids=user_ids, fmt=fmt)
+
+
+def iter_sheet(conn, table, period, query):
+    where, params = [], []
+    span = query.span(period)
+    if span:
+        where.append(f"(t.year, t.{period}) BETWEEN (?, ?) AND (?, ?)")
+        params += [*span[0], *span[1]]
+    if query.user_ids:
+        where.append(f"t.user_id IN ({', '.join('?' * len(query.user_ids))})")
+        params += query.user_ids
+    sql = SHEET_SQL.format(period=period, table=table, where=" AND ".join(where) or "1")
+    cursor = conn.execute(sql, params)
+    rows = cursor.fetchmany(CHUNK_SIZE)
+    while rows:
+        yield rows
+        rows = cursor.fetchmany(CHUNK_SIZE)
+
+
+def write_xlsx(conn, out, query):
+    # openpyxl нужен только для xlsx-выгрузки, поэтому не грузится при старте бота
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    sheet_count = 0
+    for title, table, period, period_title in SHEETS:
+        ws = None
+        for rows in iter_sheet(conn, table, period, query):
+            if ws is None:
+                ws = wb.create_sheet(title)
+                ws.append(["User ID", "First Name", "Last Name", "Year", period_title, "Hours"])
+                sheet_count += 1
+            for row in rows:
+                ws.append(row)
+    if sheet_count == 0:
+        ws = wb.create_sheet("Empty")
+        ws.append(["Сообщение"])
+        ws.append(["Нет данных для экспорта"])
+    wb.save(out)
+
+
+def write_csv(conn, out, query):
+    text = io.TextIOWrapper(out, encoding="utf-8-sig", newline="")
+    writer = csv.writer(text)
+    writer.writerow(["Sheet", "User ID", "First Name", "Last Name", "Year", "Week", "Month", "Hours"])
+    for title, table, period, _ in SHEETS:
+        for rows in iter_sheet(conn, table, period, query):
+            for user_id, first_name, last_name, year, value, hours in rows:
+                week, month = (value, "") if period == "week" else ("", value)
+                writer.writerow([title, user_id, first_name, last_name, year, week, month, hours])
+    text.detach()
+
+
+def write_jsonl(conn, out, query):
+    text = io.TextIOWrapper(out, encoding="utf-8", newline="\n")
+    for title, table, period, _ in SHEETS:
+        for rows in iter_sheet(conn, table, period, query):
+            for user_id, first_name, last_name, year, value, hours in rows:
+                text.write(json.dumps({"sheet": title, "user_id": user_id,
+                                       "first_name": first_name, "last_name": last_name,
+                                       "year": year, period: value, "hours": hours}, ensure_ascii=False))
+                text.write("\n")
+    text.detach()
+
+
+WRITERS = {"xlsx": write_xlsx, "csv": write_csv, "jsonl": write_jsonl}
+
+
+def build_export(db_path, query=ExportQuery(), archive_path=None):
+    conn = sqlite3.connect(Path(db_path).resolve().as_uri() + "?mode=ro", uri=True)
+    try:
+        attach_archive(conn, archive_path, readonly=True)
+        # версия и данные читаются в одной транзакции, чтобы файл точно соответствовал версии
+        conn.execute("BEGIN")
+        version = conn.execute("SELECT version FROM data_version").fetchone()[0]
+        out = io.BytesIO()
+        WRITERS[query.fmt](conn, out, query)
+        return version, out.getvalue()
+    finally:
+        conn.close()
+
+
+class ExportCache:
+    # Готовые файлы хранятся по ключу (версия данных, параметры выгрузки).
+    # Пока данные не менялись, /export отдаёт файл из кэша; если несколько админов
+    # запросили одну и ту же новую выгрузку, она строится один раз.
+
+    def __init__(self, max_bytes=50 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._size = 0
+        self._building = {}
+
+    async def get(self, db, *params):
+        version = (await db.fetchone("SELECT version FROM data_version"))[0]
+        key = (version, params)
+        data = self._items.get(key)
+        if data is not None:
+            self._items.move_to_end(key)
+            return data
+        task = self._building.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._build(db, params))
+            self._building[key] = task
+            task.add_done_callback(lambda _: self._building.pop(key, None))
+        # shield: если один из ожидающих отменится, выгрузка для остальных продолжится
+        return await asyncio.shield(task)
+
+    async def _build(self, db, params):
+        # отдельный поток со своим read-only соединением: не занимает пул читателей бота
+        version, data = await asyncio.to_thread(build_export, db.path, *params, archive_path=db.archive_path)
+        self._put((version, params), data)
+        return data
+
+    def _put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        if key in self._items:
+            self._size -= len(self._items.pop(key))
+        self._items[key] = data
+        self._size += len(data)
+        while self._size > self.max_bytes:
+            _, evicted = self._items.popitem(last=False)
+            self._size -= len(evicted)
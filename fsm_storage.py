@@ -0,0 +1,126 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage
+
+UPSERT_FSM = """
+    INSERT INTO fsm_states (key, state, data, updated_at) VALUES (?, ?, ?, ?)
+    ON CONFLICT(key) DO UPDATE SET state = excluded.state, data = excluded.data, updated_at = excluded.updated_at
+"""
+
+
+class SQLiteStorage(BaseStorage):
+    # FSM-хранилище в той же базе, что и часы: состояния переживают перезапуск бота.
+    # Чтение идёт из LRU-кэша, изменения копятся в dirty и пачкой пишутся раз в flush_interval.
+    # Состояния, не менявшиеся дольше ttl, считаются устаревшими и удаляются сборщиком.
+    # Запись в кэше верна не дольше cache_ttl секунд, потом состояние перечитывается из базы:
+    # при нескольких репликах ответ пользователя может прийти не на ту, что задала вопрос, и
+    # изменение другой реплики становится видно через flush_interval + cache_ttl.
+
+    def __init__(self, db, cache_size=10000, flush_interval=1.0, ttl=7 * 24 * 3600, gc_interval=3600,
+                 cache_ttl=1.0):
+        self.db = db
+        self.cache_size = cache_size
+        self.flush_interval = flush_interval
+        self.cache_ttl = cache_ttl
+        self.ttl = ttl
+        self.gc_interval = gc_interval
+        self._cache = OrderedDict()
+        self._dirty = {}
+        # изменения, которые сейчас пишутся в базу: до конца записи база их ещё не отдаёт
+        self._flushing = {}
+        self._flusher = None
+        self._last_gc = time.time()
+
+    @staticmethod
+    def _key(key):
+        return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:{key.destiny}"
+
+    def _remember(self, key, entry, checked):
+        self._cache[key] = (entry, checked)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def _load(self, key):
+        # свои незаписанные изменения новее базы; остальное — из кэша, пока он не старше cache_ttl
+        entry = self._dirty.get(key) or self._flushing.get(key)
+        cached = self._cache.get(key)
+        if entry is not None:
+            checked = cached[1] if cached is not None else time.monotonic()
+        elif cached is not None and time.monotonic() - cached[1] <= self.cache_ttl:
+            entry, checked = cached
+        else:
+            checked = time.monotonic()
+            row = await self.db.fetchone("SELECT state, data, updated_at FROM fsm_states WHERE key=?", (key,))
+            entry = (row[0], json.loads(row[1]) if row[1] else {}, row[2]) if row else (None, {}, 0.0)
+            # пока шёл запрос, этот ключ могли изменить здесь же
+            entry = self._dirty.get(key) or self._flushing.get(key) or entry
+        if entry[2] and entry[2] < time.time() - self.ttl:
+            entry = (None, {}, 0.0)
+        self._remember(key, entry, checked)
+        return entry
+
+    def _store(self, key, state, data):
+        entry = (state, data, time.time())
+        self._remember(key, entry, time.monotonic())
+        self._dirty[key] = entry
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_later())
+
+    async def set_state(self, key, state=None):
+        key = self._key(key)
+        _, data, _ = await self._load(key)
+        self._store(key, state.state if isinstance(state, State) else state, data)
+
+    async def get_state(self, key):
+        state, _, _ = await self._load(self._key(key))
+        return state
+
+    async def set_data(self, key, data):
+        key = self._key(key)
+        state, _, _ = await self._load(key)
+        self._store(key, state, data.copy())
+
+    async def get_data(self, key):
+        _, data, _ = await self._load(self._key(key))
+        return data.copy()
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        try:
+            await self.flush()
+        except Exception as e:
+            logging.error(f"Ошибка записи FSM-состояний: {e}")
+
+    async def flush(self):
+        dirty, self._dirty = self._dirty, {}
+        if dirty or time.time() - self._last_gc >= self.gc_interval:
+            self._flushing = dirty
+            try:
+                await self.db.run_write(self._write, list(dirty.items()), time.time() - self.ttl)
+            except BaseException:
+                # не теряем изменения: более свежие записи из self._dirty имеют приоритет
+                self._dirty = {**dirty, **self._dirty}
+                raise
+            finally:
+                self._flushing = {}
+
+    def _write(self, conn, items, expired_before):
+        upserts = [(key, state, json.dumps(data, ensure_ascii=False), updated_at)
+                   for key, (state, data, updated_at) in items if state is not None or data]
+        deletes = [(key,) for key, (state, data, _) in items if state is None and not data]
+        conn.executemany(UPSERT_FSM, upserts)
+        conn.executemany("DELETE FROM fsm_states WHERE key=?", deletes)
+        if time.time() - self._last_gc >= self.gc_interval:
+            conn.execute("DELETE FROM fsm_states WHERE updated_at < ?", (expired_before,))
+            self._last_gc = time.time()
+
+    async def close(self):
+        if self._flusher is not None and not self._flusher.done():
+            self._flusher.cancel()
+        await self.flush()
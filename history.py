@@ -0,0 +1,151 @@
+import re
+import time
+from collections import OrderedDict
+from datetime import date
+
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+HISTORY_WEEKS = 8
+HISTORY_MONTHS = 6
+# курсор первой страницы: больше любого (год, период)
+NEWEST = (9999, 99)
+
+WEEKCHANGE_USAGE = ("❗ Использование: `/weekchange` — текущая неделя, `/weekchange 12` или "
+                    "`/weekchange 2025-W12` — прошедшая")
+
+WEEK_RE = re.compile(r"^(?:(\d{4})-?)?[Ww]?(\d{1,2})$")
+
+
+def parse_week(text, today):
+    # "12", "W12", "2025-W12", "2025W12" -> (год, неделя) по ISO; без года — последняя неделя
+    # с этим номером, которая уже началась
+    match = WEEK_RE.match(text.strip())
+    if not match:
+        raise ValueError(text)
+    week = int(match.group(2))
+    if match.group(1):
+        year = int(match.group(1))
+    else:
+        year, current, _ = today.isocalendar()
+        if week > current:
+            year -= 1
+    try:
+        date.fromisocalendar(year, week, 1)
+    except ValueError:
+        raise ValueError(text) from None
+    return year, week
+
+
+def weeks_ago(today, year, week):
+    # 0 — текущая неделя, 1 — прошлая и т.д.; будущие недели отрицательные
+    this_monday = date.fromisocalendar(*today.isocalendar()[:2], 1)
+    return (this_monday - date.fromisocalendar(year, week, 1)).days // 7
+
+
+def parse_cursor(value):
+    # "2025-12" -> (2025, 12); пусто — первая страница
+    if not value:
+        return None
+    year, period = value.split("-")
+    return int(year), int(period)
+
+
+def week_span(year, week):
+    monday, sunday = date.fromisocalendar(year, week, 1), date.fromisocalendar(year, week, 7)
+    return f"{monday:%d.%m}–{sunday:%d.%m.%Y}"
+
+
+def _hours(value):
+    return f"{value:g}"
+
+
+def render_week_page(rows, has_more, cursor, today, edit_weeks):
+    # rows — [(год, неделя, часы)] от новых к старым
+    lines = ["🗓 *История: недели*"]
+    if not rows:
+        lines.append("Записей пока нет." if cursor is None else "Более ранних записей нет.")
+    editable = None
+    for year, week, hours in rows:
+        mark = ""
+        if 0 <= weeks_ago(today, year, week) <= edit_weeks:
+            mark = " ✏️"
+            editable = editable or (year, week)
+        lines.append(f"Нед. {week} ({week_span(year, week)}) — {_hours(hours)} ч.{mark}")
+    if rows:
+        lines.append(f"\nИтого за {len(rows)} нед.: {_hours(sum(hours for _, _, hours in rows))} ч.")
+    if editable:
+        lines.append(f"✏️ — можно изменить, например `/weekchange {editable[0]}-W{editable[1]:02d}`")
+    return "\n".join(lines), _markup("w", rows, has_more, cursor)
+
+
+def render_month_page(rows, has_more, cursor):
+    # rows — [(год, месяц, план или None, введено за недели, недель)] от новых к старым;
+    # неделя относится к месяцу своего четверга, как в /report
+    lines = ["📅 *История: месяцы* (план и введённые недели)"]
+    if not rows:
+        lines.append("Записей пока нет." if cursor is None else "Более ранних записей нет.")
+    plan_total = entered_total = 0.0
+    for year, month, plan, entered, weeks in rows:
+        entered_total += entered
+        if plan is None:
+            lines.append(f"{month:02d}.{year} — план не введён, недели: {_hours(entered)} ч. ({weeks} нед.)")
+            continue
+        plan_total += plan
+        lines.append(f"{month:02d}.{year} — план {_hours(plan)} ч., недели: {_hours(entered)} ч. "
+                     f"({weeks} нед.), {entered - plan:+g}")
+    if rows:
+        lines.append(f"\nИтого: план {_hours(plan_total)} ч., недели {_hours(entered_total)} ч.")
+    return "\n".join(lines), _markup("m", rows, has_more, cursor)
+
+
+def _markup(kind, rows, has_more, cursor):
+    buttons = []
+    if has_more:
+        year, period = rows[-1][:2]
+        buttons.append(InlineKeyboardButton(text="⬅️ Раньше", callback_data=f"history:{kind}:{year}-{period}"))
+    if cursor is not None:
+        buttons.append(InlineKeyboardButton(text="⏮ Сначала", callback_data=f"history:{kind}:"))
+    other = "m" if kind == "w" else "w"
+    buttons.append(InlineKeyboardButton(text="📅 Месяцы" if other == "m" else "🗓 Недели",
+                                        callback_data=f"history:{other}:"))
+    return InlineKeyboardMarkup(inline_keyboard=[buttons])
+
+
+class HistoryCache:
+    # Отрисованные страницы /history: user_id -> {(вид, курсор): (текст, кнопки)}. Листание туда-обратно
+    # не ходит в хранилище. Страницы хранятся для max_users последних пользователей, не больше max_pages
+    # на каждого; любая запись часов пользователя сбрасывает его страницы (invalidate), а ttl
+    # ограничивает устаревание, если часы изменила другая реплика.
+
+    def __init__(self, max_users=1000, max_pages=10, ttl=300):
+        self.max_users = max_users
+        self.max_pages = max_pages
+        self.ttl = ttl
+        self._users = OrderedDict()
+
+    def get(self, user_id, key):
+        pages = self._users.get(user_id)
+        entry = pages.get(key) if pages is not None else None
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            return None
+        self._users.move_to_end(user_id)
+        return entry[1]
+
+    def put(self, user_id, key, page):
+        pages = self._users.get(user_id)
+        if pages is None:
+            pages = self._users[user_id] = OrderedDict()
+            if len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        self._users.move_to_end(user_id)
+        pages[key] = (time.monotonic(), page)
+        pages.move_to_end(key)
+        if len(pages) > self.max_pages:
+            pages.popitem(last=False)
+
+    def invalidate(self, user_id=None):
+        # без user_id — все пользователи (например, после /import)
+        if user_id is None:
+            self._users.clear()
+        else:
+            self._users.pop(user_id, None)
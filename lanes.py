@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+from aiogram.types.update import UpdateTypeLookupError
+
+# Тяжёлые админские команды: выгрузки, отчёты, импорт, резервные копии и ручная рассылка
+HEAVY_COMMANDS = {"export", "import", "report", "backup", "notify"}
+BUSY_TEXT = "⏳ Бот занят тяжёлыми задачами, повторите команду через минуту."
+# getUpdates возвращает не больше 100 обновлений за раз
+POLLING_BATCH = 100
+
+
+def update_lane(update):
+    message = update.message
+    if message is not None:
+        text = message.text or message.caption or ""
+        if text.startswith("/"):
+            command = text.split(maxsplit=1)[0][1:].split("@", 1)[0].lower()
+            if command in HEAVY_COMMANDS:
+                return "heavy"
+    return "light"
+
+
+def update_user(update):
+    # у обновления незнакомого aiogram типа нет event: оно идёт в лёгкую полосу отдельной очередью,
+    # а диспетчер его пропустит
+    try:
+        event = update.event
+    except UpdateTypeLookupError:
+        return None
+    user = getattr(event, "from_user", None)
+    return user.id if user is not None else None
+
+
+class UpdateLanes:
+    # Стадия между приёмом обновлений (polling или webhook) и dp.feed_update.
+    # Обновления одного пользователя обрабатываются строго по очереди, в порядке поступления, — двойной
+    # ответ на напоминание больше не гоняется за состояние FSM. Разные пользователи идут параллельно
+    # на ограниченном числе воркеров, а воркеры разделены на полосы: лёгкие апдейты и тяжёлые
+    # админские команды (HEAVY_COMMANDS), так что /export не занимает воркеры остальных.
+    #
+    # Очереди ограничены. submit() возвращает False, только если переполнена полоса лёгких апдейтов —
+    # вебхук отвечает 503, и Telegram повторит позже; polling до этого не доходит (wait_for_room).
+    # Лишние тяжёлые команды получают ответ BUSY_TEXT, а сверх per_user обновлений от одного
+    # пользователя отбрасываются молча.
+
+    def __init__(self, dp, bot, lanes, per_user=20, metrics=None):
+        # lanes: {"light": (воркеров, max_pending), "heavy": (воркеров, max_pending)}
+        self.dp = dp
+        self.bot = bot
+        self.lanes = lanes
+        self.per_user = per_user
+        self.metrics = metrics
+        self.pending = {name: 0 for name in lanes}
+        self._ready = {name: asyncio.Queue() for name in lanes}
+        self._users = {}
+        self._room = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._tasks = []
+        self._replies = set()
+        if metrics is not None:
+            metrics.describe("update_queue_seconds", "Ожидание обновления в очереди до начала обработки")
+            metrics.describe("updates_shed_total", "Отброшенные при перегрузке обновления")
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker(name))
+                           for name, (workers, _) in self.lanes.items() for _ in range(workers)]
+
+    async def stop(self, timeout=10):
+        # даём дообработать уже принятые обновления
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"Не дообработано обновлений: {sum(self.pending.values())}")
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    def submit(self, update):
+        lane = update_lane(update)
+        key = update_user(update)
+        if key is None:
+            key = ("update", update.update_id)
+        queue = self._users.get(key)
+        if queue is not None and len(queue) >= self.per_user:
+            self._shed(lane, "user")
+            return True
+        if self.pending[lane] >= self.lanes[lane][1]:
+            self._shed(lane, "lane")
+            if lane == "light":
+                return False
+            if update.message is not None:
+                task = asyncio.create_task(self._answer_busy(update.message))
+                self._replies.add(task)
+                task.add_done_callback(self._replies.discard)
+            return True
+        if queue is None:
+            queue = self._users[key] = deque()
+        queue.append((lane, update, time.perf_counter()))
+        self.pending[lane] += 1
+        self._idle.clear()
+        # в очереди готовых пользователь стоит не больше одного раза: следующее его обновление
+        # попадёт туда только после того, как обработано текущее
+        if len(queue) == 1:
+            self._ready[lane].put_nowait(key)
+        return True
+
+    async def wait_for_room(self, lane="light", count=POLLING_BATCH):
+        # очередь меньше пачки getUpdates: ждём, пока она опустеет целиком, иначе ждали бы вечно
+        count = min(count, self.lanes[lane][1])
+        while self.pending[lane] + count > self.lanes[lane][1]:
+            self._room.clear()
+            await self._room.wait()
+
+    async def _worker(self, lane):
+        while True:
+            key = await self._ready[lane].get()
+            queue = self._users[key]
+            _, update, queued_at = queue[0]
+            if self.metrics is not None:
+                self.metrics.observe("update_queue_seconds", time.perf_counter() - queued_at, lane=lane)
+            try:
+                await self.dp.feed_update(self.bot, update)
+            except Exception:
+                logging.exception(f"Ошибка обработки обновления {update.update_id}")
+            finally:
+                queue.popleft()
+                self.pending[lane] -= 1
+                if queue:
+                    self._ready[queue[0][0]].put_nowait(key)
+                else:
+                    del self._users[key]
+                self._room.set()
+                if not any(self.pending.values()):
+                    self._idle.set()
+
+    async def _answer_busy(self, message):
+        try:
+            await self.bot.send_message(message.chat.id, BUSY_TEXT)
+        except Exception:
+            logging.exception("Не удалось ответить о перегрузке")
+
+    def _shed(self, lane, reason):
+        if self.metrics is not None:
+            self.metrics.inc("updates_shed_total", lane=lane, reason=reason)
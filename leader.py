@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import os
+import socket
+import sqlite3
+import time
+import uuid
+
+CREATE_LEASES_SQL = """
+    CREATE TABLE IF NOT EXISTS leases (
+        name TEXT PRIMARY KEY,
+        owner TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    )
+"""
+# Продлить аренду может только владелец, перехватить — кто угодно, когда она истекла
+ACQUIRE_LEASE_SQL = """
+    INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?)
+    ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+    WHERE leases.owner = excluded.owner OR leases.expires_at < ?
+"""
+
+
+class SQLiteLease:
+    # Аренда в отдельном файле SQLite рядом с базой бота: строка leases(name) принадлежит owner
+    # до expires_at. У аренды своё короткое соединение на каждый вызов, а не очередь писателя
+    # Database, поэтому долгая запись в базу (/import, архивация) не мешает лидеру её продлить.
+    # Другой бэкенд (Redis, etcd, файл с flock) подключается так же — нужны acquire(owner, ttl) -> bool
+    # и release(owner).
+
+    def __init__(self, path, name, timeout=5):
+        self.path = path
+        self.name = name
+        self.timeout = timeout
+
+    def _execute(self, sql, params):
+        conn = sqlite3.connect(self.path, timeout=self.timeout)
+        try:
+            with conn:
+                conn.execute(CREATE_LEASES_SQL)
+                return conn.execute(sql, params).rowcount
+        finally:
+            conn.close()
+
+    async def acquire(self, owner, ttl):
+        now = time.time()
+        return await asyncio.to_thread(self._execute, ACQUIRE_LEASE_SQL, (self.name, owner, now + ttl, now)) == 1
+
+    async def release(self, owner):
+        await asyncio.to_thread(self._execute, "DELETE FROM leases WHERE name = ? AND owner = ?",
+                                (self.name, owner))
+
+
+class LeaderElection:
+    # Из нескольких реплик задачи по расписанию выполняет одна — владелец аренды; остальные только
+    # обрабатывают обновления. Аренда продлевается каждые ttl/3 секунд; если лидер умер, через ttl
+    # её забирает другая реплика. Лидер, который не смог продлить аренду дольше ttl/2, слагает
+    # полномочия сам — раньше, чем аренду может перехватить кто-то ещё. on_elected работает отдельной
+    # задачей, чтобы долгий запуск (догоняющие напоминания) не задерживал продление; при потере
+    # аренды эта задача отменяется до вызова on_demoted. Если on_elected упал, реплика слагает
+    # полномочия и отдаёт аренду: её заберёт другая реплика (или эта же) и повторит запуск.
+
+    def __init__(self, lease, ttl=30, owner=None, on_elected=None, on_demoted=None):
+        self.lease = lease
+        self.ttl = ttl
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.is_leader = False
+        self._renewed = 0.0
+        self._task = None
+        self._elected = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.is_leader:
+            await self._resign()
+
+    async def _resign(self):
+        await self._switch(False)
+        # отдаём аренду сразу, не дожидаясь истечения
+        try:
+            await self.lease.release(self.owner)
+        except Exception as e:
+            logging.error(f"Не удалось освободить аренду лидера: {e}")
+
+    async def _run(self):
+        while True:
+            try:
+                held = await self.lease.acquire(self.owner, self.ttl)
+            except Exception as e:
+                logging.error(f"Не удалось продлить аренду лидера: {e}")
+                held = None
+            if held:
+                self._renewed = time.monotonic()
+                if not self.is_leader:
+                    await self._switch(True)
+            elif self.is_leader and (held is False or time.monotonic() - self._renewed > self.ttl / 2):
+                await self._switch(False)
+            await asyncio.sleep(self.ttl / 3)
+
+    async def _switch(self, leader):
+        self.is_leader = leader
+        logging.info(f"Реплика {self.owner}: {'лидер' if leader else 'больше не лидер'}")
+        if leader:
+            if self.on_elected is not None:
+                self._elected = asyncio.create_task(self._elect())
+            return
+        if self._elected is not None:
+            self._elected.cancel()
+            await asyncio.gather(self._elected, return_exceptions=True)
+            self._elected = None
+        if self.on_demoted is not None:
+            await self._callback(self.on_demoted)
+
+    async def _elect(self):
+        try:
+            await self.on_elected()
+        except Exception:
+            logging.exception("Не удалось запустить задачи лидера, аренда отдаётся")
+            # себя не отменяем: _switch(False) отменил бы и эту задачу
+            self._elected = None
+            await self._resign()
+
+    async def _callback(self, callback):
+        try:
+            await callback()
+        except Exception:
+            logging.exception("Ошибка при смене лидера")
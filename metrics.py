@@ -0,0 +1,234 @@
+import bisect
+import sqlite3
+import threading
+import time
+
+from aiogram import BaseMiddleware
+from aiogram.filters import Command
+from aiohttp import web
+
+# Границы корзин гистограмм в секундах: от быстрых ответов из кэша до тяжёлых выгрузок
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def merge(self, other):
+        for i, n in enumerate(other.counts):
+            self.counts[i] += n
+        self.count += other.count
+        self.sum += other.sum
+
+    def quantile(self, q):
+        # оценка по корзинам, как histogram_quantile в Prometheus
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if seen + n >= rank and n:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+
+class Metrics:
+    # Счётчики и гистограммы в памяти процесса; наблюдения приходят и из потоков БД, поэтому под замком.
+
+    def __init__(self):
+        self.started = time.time()
+        self.histograms = {}
+        self.counters = {}
+        self.help = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name, text):
+        self.help[name] = text
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def snapshot(self, name):
+        # [(labels, Histogram | число)] для /stats
+        with self._lock:
+            items = [(dict(labels), h) for (n, labels), h in self.histograms.items() if n == name]
+            items += [(dict(labels), v) for (n, labels), v in self.counters.items() if n == name]
+        return items
+
+    def grouped(self, name, key):
+        # гистограммы name, слитые по key(labels) — например, по команде без учёта состояния
+        groups = {}
+        for labels, histogram in self.snapshot(name):
+            if isinstance(histogram, Histogram):
+                groups.setdefault(key(labels), Histogram(histogram.buckets)).merge(histogram)
+        return groups
+
+    def counter(self, name, **labels):
+        with self._lock:
+            return self.counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def render(self):
+        # текстовый формат Prometheus (text/plain; version=0.0.4)
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items(), key=lambda item: item[0])
+            typed = set()
+            for (name, labels), value in counters:
+                if name not in typed:
+                    typed.add(name)
+                    if name in self.help:
+                        lines.append(f"# HELP {name} {self.help[name]}")
+                    lines.append(f"# TYPE {name} counter")
+                lines.append(f"{name}{_labels(labels)} {value}")
+            for (name, labels), histogram in histograms:
+                if name not in typed:
+                    typed.add(name)
+                    if name in self.help:
+                        lines.append(f"# HELP {name} {self.help[name]}")
+                    lines.append(f"# TYPE {name} histogram")
+                cumulative = 0
+                for bound, n in zip((*histogram.buckets, "+Inf"), histogram.counts):
+                    cumulative += n
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', str(bound)),))} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+        lines.append("# TYPE process_uptime_seconds gauge")
+        lines.append(f"process_uptime_seconds {time.time() - self.started:.0f}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+class HandlerTimer(BaseMiddleware):
+    # Внутренний middleware: к этому моменту aiogram уже выбрал обработчик и прочитал состояние FSM,
+    # поэтому метки ограничены зарегистрированными обработчиками, командами и состояниями.
+
+    def __init__(self, metrics, name="bot_handler_seconds"):
+        self.metrics = metrics
+        self.name = name
+        self._commands = {}
+        metrics.describe(name, "Время обработки апдейта по обработчику, команде и состоянию FSM")
+
+    def _command(self, handler):
+        command = self._commands.get(id(handler))
+        if command is None:
+            command = ""
+            for flt in handler.filters or ():
+                if isinstance(flt.callback, Command):
+                    command = "/" + str(flt.callback.commands[0])
+                    break
+            self._commands[id(handler)] = command
+        return command
+
+    async def __call__(self, handler, event, data):
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            return await handler(event, data)
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            handler_object = data.get("handler")
+            callback = getattr(handler_object, "callback", None)
+            self.metrics.observe(
+                self.name, time.perf_counter() - started,
+                handler=getattr(callback, "__name__", "unknown"),
+                command=self._command(handler_object) if handler_object is not None else "",
+                state=data.get("raw_state") or "",
+                status=status,
+            )
+
+
+class TimedConnection(sqlite3.Connection):
+    # Соединение, которое замеряет каждое выражение (подключается через sqlite3.connect(factory=...)).
+    # Для SELECT это время до первой строки; полное время вызова пишет Database (db_call_seconds).
+    metrics = None
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._observe(sql, started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._observe(sql, started)
+
+    def _observe(self, sql, started):
+        if self.metrics is not None:
+            self.metrics.observe("db_statement_seconds", time.perf_counter() - started,
+                                 statement=statement_label(sql))
+
+
+_statement_labels = {}
+
+
+def statement_label(sql):
+    # запросы в коде — константы, поэтому подпись считается один раз на текст запроса
+    label = _statement_labels.get(sql)
+    if label is None:
+        label = " ".join(sql.split())
+        if len(label) > 80:
+            label = label[:77] + "..."
+        if len(_statement_labels) < 10000:
+            _statement_labels[sql] = label
+    return label
+
+
+class MetricsServer:
+    def __init__(self, metrics, path="/metrics"):
+        self.metrics = metrics
+        self.path = path
+        self._runner = None
+
+    async def handle(self, request):
+        return web.Response(text=self.metrics.render(),
+                            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+    async def start(self, host, port):
+        app = web.Application()
+        app.router.add_get(self.path, self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,157 @@
+import asyncio
+import json
+import logging
+import time
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramNotFound
+
+# Ошибки, после которых повторять бессмысленно: бот заблокирован, чат удалён и т.п.
+PERMANENT_ERRORS = (TelegramForbiddenError, TelegramNotFound, TelegramBadRequest)
+
+ENQUEUE_SQL = """
+    INSERT INTO outbox (dedup_key, chat_id, text, payload, next_attempt_at, created_at)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(dedup_key) DO NOTHING
+"""
+# Строки забираются на отправку атомарно: next_attempt_at сдвигается на claim_seconds вперёд, поэтому
+# /notify на одной реплике и фоновый воркер лидера не отправят одно сообщение дважды. Пока волна идёт,
+# забор недоставленных строк продлевается (EXTEND_CLAIM_SQL), так что длинная рассылка не теряет его
+# на середине. Если процесс упал посреди отправки, строка снова станет доступна через claim_seconds.
+CLAIM_SQL = """
+    UPDATE outbox SET next_attempt_at = ?
+    WHERE status = 'pending' AND next_attempt_at <= ? AND id IN ({ids})
+    RETURNING id, chat_id, text, payload, attempts
+"""
+EXTEND_CLAIM_SQL = """
+    UPDATE outbox SET next_attempt_at = ?
+    WHERE status = 'pending' AND id IN (SELECT value FROM json_each(?))
+"""
+MARK_SENT_SQL = "UPDATE outbox SET status = 'sent', attempts = attempts + 1, sent_at = ? WHERE id = ?"
+
+
+class Outbox:
+    # Надёжная доставка сообщений: сначала запись в таблицу outbox, затем отправка.
+    # Неудачные отправки повторяются фоновым воркером с экспоненциальной задержкой,
+    # после max_attempts (или при постоянной ошибке) сообщение уходит в статус 'dead'.
+    # dedup_key не даёт отправить одно и то же напоминание дважды, в том числе при догоняющем запуске.
+
+    def __init__(self, db, broadcaster, on_delivered=None, max_attempts=8, backoff=60, batch_size=500,
+                 keep_sent=7 * 24 * 3600, claim_seconds=300):
+        self.db = db
+        self.broadcaster = broadcaster
+        self.on_delivered = on_delivered
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.batch_size = batch_size
+        self.keep_sent = keep_sent
+        self.claim_seconds = claim_seconds
+        self._worker = None
+        self._lock = asyncio.Lock()
+
+    async def enqueue(self, messages):
+        # messages: (dedup_key, chat_id, text, payload); возвращает id ожидающих отправки записей
+        messages = list(messages)
+        if not messages:
+            return []
+        now = time.time()
+        keys = [key for key, _, _, _ in messages]
+        await self.db.executemany(ENQUEUE_SQL, [
+            (key, chat_id, text, json.dumps(payload, ensure_ascii=False) if payload is not None else None, now, now)
+            for key, chat_id, text, payload in messages])
+        rows = await self.db.fetchall(
+            "SELECT id FROM outbox WHERE status = 'pending' AND dedup_key IN (SELECT value FROM json_each(?))",
+            (json.dumps(keys, ensure_ascii=False),))
+        return [row_id for (row_id,) in rows]
+
+    async def deliver(self, ids, on_progress=None):
+        # забор и отправка — под одним замком: пока идёт волна, фоновый воркер ждёт и после неё
+        # видит строки уже в статусе 'sent'
+        async with self._lock:
+            rows = await self.db.run_write(self._claim, "SELECT value FROM json_each(?)", (json.dumps(list(ids)),))
+            return await self._send(rows, on_progress)
+
+    async def drain_due(self):
+        async with self._lock:
+            rows = await self.db.run_write(
+                self._claim, "SELECT id FROM outbox WHERE status = 'pending' AND next_attempt_at <= ? "
+                             "ORDER BY next_attempt_at LIMIT ?", (time.time(), self.batch_size))
+            if rows:
+                await self._send(rows)
+        return len(rows)
+
+    def _claim(self, conn, ids_sql, params):
+        now = time.time()
+        return conn.execute(CLAIM_SQL.format(ids=ids_sql), (now + self.claim_seconds, now, *params)).fetchall()
+
+    async def _send(self, rows, on_progress=None):
+        # вызывается под self._lock
+        payloads = {row_id: (chat_id, payload) for row_id, chat_id, _, payload, _ in rows}
+        unsent = set(payloads)
+
+        async def on_delivered(row_id):
+            # строка отмечается отправленной сразу, а не в конце волны: повторный забор (другим
+            # вызовом или после сбоя посреди волны) уже доставленное не отправит
+            await self.db.submit(MARK_SENT_SQL, (time.time(), row_id))
+            unsent.discard(row_id)
+            if self.on_delivered is not None:
+                chat_id, payload = payloads[row_id]
+                await self.on_delivered(chat_id, json.loads(payload) if payload else None)
+
+        holder = asyncio.create_task(self._hold_claim(unsent))
+        try:
+            result = await self.broadcaster.deliver(
+                ((row_id, chat_id, text) for row_id, chat_id, text, _, _ in rows),
+                on_delivered=on_delivered, on_progress=on_progress)
+        finally:
+            holder.cancel()
+        now = time.time()
+        retry, dead = [], []
+        for row_id, chat_id, _, _, attempts in rows:
+            error = result.errors.get(row_id)
+            if error is None:
+                continue
+            if isinstance(error, PERMANENT_ERRORS) or attempts + 1 >= self.max_attempts:
+                dead.append((str(error), row_id))
+            else:
+                retry.append((now + self.backoff * 2 ** attempts, str(error), row_id))
+        await self.db.run_write(self._record, retry, dead)
+        if dead:
+            logging.warning(f"Outbox: {len(dead)} сообщений не доставлено окончательно (dead)")
+        return result
+
+    async def _hold_claim(self, unsent):
+        # продлеваем забор втрое чаще, чем он истекает
+        while True:
+            await asyncio.sleep(self.claim_seconds / 3)
+            try:
+                await self.db.execute(EXTEND_CLAIM_SQL, (time.time() + self.claim_seconds,
+                                                         json.dumps(list(unsent))))
+            except Exception as e:
+                logging.error(f"Outbox: не удалось продлить забор сообщений: {e}")
+
+    def _record(self, conn, retry, dead):
+        conn.executemany("UPDATE outbox SET attempts = attempts + 1, next_attempt_at = ?, last_error = ? "
+                         "WHERE id = ?", retry)
+        conn.executemany("UPDATE outbox SET status = 'dead', attempts = attempts + 1, last_error = ? "
+                         "WHERE id = ?", dead)
+
+    async def _run(self, interval):
+        while True:
+            try:
+                # пока есть просроченные сообщения, разбираем их без паузы
+                while await self.drain_due() == self.batch_size:
+                    pass
+                await self.db.execute("DELETE FROM outbox WHERE status = 'sent' AND sent_at < ?",
+                                      (time.time() - self.keep_sent,))
+            except Exception as e:
+                logging.error(f"Ошибка обработки outbox: {e}")
+            await asyncio.sleep(interval)
+
+    def start(self, interval=30):
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run(interval))
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
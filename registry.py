@@ -0,0 +1,86 @@
+import time
+from collections import OrderedDict
+
+
+class UserRegistry:
+    # Кэш пользователей хранилища в памяти процесса: user_id -> (имя, фамилия).
+    # Заполняется при старте и обновляется теми же хендлерами, что пишут в users,
+    # поэтому проверка регистрации и выборка получателей рассылки не ходят в базу.
+    # Изменения, сделанные другой репликой, этот кэш сам не видит: запись старше ttl секунд
+    # is_registered и get не отдают, её перечитывает из хранилища fetch, а полный список
+    # (user_ids, items) — refresh. Так удаление или переименование на другой реплике
+    # доходит сюда не позже чем через ttl секунд.
+    # Отрицательные ответы тоже кэшируются на ttl (не больше max_missing последних user_id), чтобы
+    # сообщения незарегистрированных не ходили в хранилище каждый раз.
+
+    def __init__(self, ttl=300, max_missing=10000):
+        self.ttl = ttl
+        self.max_missing = max_missing
+        self._users = {}
+        self._checked = {}
+        self._missing = OrderedDict()
+        self._loaded = 0.0
+
+    async def load(self, repo):
+        rows = await repo.list_users()
+        now = time.monotonic()
+        self._users = {user_id: (first_name, last_name) for user_id, first_name, last_name in rows}
+        self._checked = dict.fromkeys(self._users, now)
+        self._missing.clear()
+        self._loaded = now
+
+    async def refresh(self, repo):
+        # полный список перечитывается, только если он старше ttl
+        if time.monotonic() - self._loaded > self.ttl:
+            await self.load(repo)
+
+    async def fetch(self, repo, user_id, cached=True):
+        # Проверка по хранилищу: при нескольких репликах пользователь мог зарегистрироваться
+        # или быть удалён через другую. Найденный попадает в кэш, пропавший — убирается.
+        # С cached свежий ответ кэша, в том числе "такого нет", отдаётся без хранилища.
+        if cached and (self._fresh(user_id) or self._fresh(user_id, self._missing)):
+            return self._users.get(user_id)
+        user = await repo.get_user(user_id)
+        if user is None:
+            self.remove(user_id)
+            self._missing[user_id] = time.monotonic()
+            self._missing.move_to_end(user_id)
+            if len(self._missing) > self.max_missing:
+                self._missing.popitem(last=False)
+        else:
+            self.set(user_id, *user)
+        return user
+
+    def _fresh(self, user_id, checked=None):
+        checked = self._checked if checked is None else checked
+        return time.monotonic() - checked.get(user_id, float("-inf")) <= self.ttl
+
+    def is_registered(self, user_id):
+        return user_id in self._users and self._fresh(user_id)
+
+    def get(self, user_id):
+        return self._users.get(user_id) if self._fresh(user_id) else None
+
+    def user_ids(self):
+        return list(self._users)
+
+    def items(self):
+        return list(self._users.items())
+
+    def __len__(self):
+        return len(self._users)
+
+    def set(self, user_id, first_name, last_name):
+        self._users[user_id] = (first_name, last_name)
+        self._checked[user_id] = time.monotonic()
+        self._missing.pop(user_id, None)
+
+    def update(self, user_id, first_name=None, last_name=None):
+        current = self._users.get(user_id)
+        if current is not None:
+            self._users[user_id] = (first_name if first_name is not None else current[0],
+                                    last_name if last_name is not None else current[1])
+
+    def remove(self, user_id):
+        self._users.pop(user_id, None)
+        self._checked.pop(user_id, None)
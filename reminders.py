@@ -0,0 +1,78 @@
+from collections import defaultdict
+from datetime import datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+DEFAULT_REMIND_AT = time(9, 0)
+BUCKET = timedelta(minutes=1)
+
+
+def parse_timezone(name):
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(name)
+
+
+def parse_remind_at(value):
+    hours, sep, minutes = value.partition(":")
+    if not sep or not hours.isdigit() or not minutes.isdigit():
+        raise ValueError(value)
+    return time(int(hours), int(minutes))
+
+
+def user_offset(user_id, window_minutes):
+    # детерминированный сдвиг внутри окна, чтобы напоминания не уходили всем в одну минуту
+    if window_minutes <= 0:
+        return timedelta(0)
+    return timedelta(minutes=(user_id * 2654435761 >> 8) % window_minutes)
+
+
+def reminder_period(kind, local_date):
+    if kind == "week":
+        year, week_num, _ = (local_date - timedelta(days=7)).isocalendar()
+        return year, week_num
+    return local_date.year, local_date.month
+
+
+def due_times(kind, user_id, tz, remind_at, start, end, window_minutes, followup_hours):
+    # Все моменты [start, end) по UTC, когда пользователю положено напоминание kind ("week" —
+    # в понедельник, "month" — первого числа) по его местному времени, и повторное через followup_hours.
+    # Возвращает (момент UTC, повторное ли, период).
+    offset = user_offset(user_id, window_minutes)
+    shifts = [(False, timedelta(0))]
+    if followup_hours > 0:
+        shifts.append((True, timedelta(hours=followup_hours)))
+    for followup, shift in shifts:
+        day = (start - shift - offset).astimezone(tz).date()
+        last_day = (end - shift).astimezone(tz).date()
+        while day <= last_day:
+            if (kind == "week" and day.weekday() == 0) or (kind == "month" and day.day == 1):
+                local = datetime.combine(day, remind_at, tzinfo=tz) + offset
+                when = local.astimezone(timezone.utc) + shift
+                if start <= when < end:
+                    yield when, followup, reminder_period(kind, day)
+            day += timedelta(days=1)
+
+
+class ReminderQueue:
+    # Очередь напоминаний, разложенная по минутным корзинам (время UTC).
+
+    def __init__(self, bucket=BUCKET):
+        self.bucket = bucket
+        self._buckets = defaultdict(list)
+
+    def _key(self, when):
+        epoch = datetime(1970, 1, 1, tzinfo=timezone.utc)
+        return epoch + (when - epoch) // self.bucket * self.bucket
+
+    def push(self, when, item):
+        self._buckets[self._key(when)].append(item)
+
+    def pop_due(self, now):
+        items = []
+        for key in sorted(key for key in self._buckets if key <= now):
+            items.extend(self._buckets.pop(key))
+        return items
+
+    def __len__(self):
+        return sum(len(items) for items in self._buckets.values())
@@ -0,0 +1,150 @@
+import math
+from dataclasses import dataclass
+from datetime import date, timedelta
+
+from export import parse_span
+
+REPORT_USAGE = ("❗ Использование: `/report [months=2025-01..2025-03]` "
+                "(по умолчанию — три последних месяца, не больше 12 месяцев)")
+TOP = 5
+MAX_MONTHS = 12
+
+ROLLUP_SQL = """
+    SELECT user_id, year, month, week_hours, weeks, plan_hours FROM user_month_rollup
+    WHERE (year, month) BETWEEN (?, ?) AND (?, ?)
+"""
+PLAN_TOTALS_SQL = """
+    SELECT year, period, hours, entries FROM period_rollup
+    WHERE kind = 'month' AND (year, period) BETWEEN (?, ?) AND (?, ?)
+"""
+# сколько недель месяца уже закончилось (ожидаемые отчёты) и сколько в нём недель всего
+EXPECTED_WEEKS_SQL = """
+    SELECT month_year, month, sum((year, week) <= (?, ?)), count(*) FROM iso_week_month
+    WHERE (month_year, month) BETWEEN (?, ?) AND (?, ?)
+    GROUP BY month_year, month
+"""
+
+
+@dataclass
+class Report:
+    months: list
+    team: object
+    top_overtime: object
+    top_deficit: object
+    top_missing: object
+
+
+def parse_report_args(args, today=None):
+    today = today or date.today()
+    months = None
+    for arg in args:
+        name, _, value = arg.partition("=")
+        if name.lower() != "months":
+            raise ValueError(arg)
+        months = parse_span(value, r"(\d{4})-(\d{1,2})", 12)
+    if months is None:
+        first = today.replace(day=1)
+        for _ in range(2):
+            first = (first - timedelta(days=1)).replace(day=1)
+        months = ((first.year, first.month), (today.year, today.month))
+    (y1, m1), (y2, m2) = months
+    # иначе ответ не поместится в одно сообщение Telegram
+    if (y2 - y1) * 12 + m2 - m1 >= MAX_MONTHS:
+        raise ValueError("слишком длинный период")
+    return months
+
+
+def build_report(conn, months, user_ids, today=None):
+    # Выполняется в потоке-читателе. Из базы берутся только сводки (строк — пользователи × месяцы),
+    # всё остальное считается векторно в pandas. pandas импортируется здесь, а не при старте бота.
+    import numpy as np
+    import pandas as pd
+
+    today = today or date.today()
+    last_week = (today - timedelta(days=7)).isocalendar()[:2]
+    (y1, m1), (y2, m2) = months
+    span = (y1, m1, y2, m2)
+
+    expected = pd.DataFrame(conn.execute(EXPECTED_WEEKS_SQL, (*last_week, *span)).fetchall(),
+                            columns=["year", "month", "expected", "weeks_in_month"]).set_index(["year", "month"])
+    if expected.empty:
+        return None
+    rollups = pd.DataFrame(conn.execute(ROLLUP_SQL, span).fetchall(),
+                           columns=["user_id", "year", "month", "week_hours", "weeks", "plan_hours"])
+    plans = pd.DataFrame(conn.execute(PLAN_TOTALS_SQL, span).fetchall(),
+                         columns=["year", "month", "plan_total", "plans"]).set_index(["year", "month"])
+
+    # каждая пара (пользователь, месяц), включая тех, у кого за месяц нет ни одной записи
+    grid = pd.MultiIndex.from_tuples(
+        [(uid, y, m) for uid in sorted(set(user_ids) | set(rollups["user_id"])) for y, m in expected.index],
+        names=["user_id", "year", "month"])
+    frame = rollups.set_index(["user_id", "year", "month"]).reindex(grid)
+    frame["week_hours"] = frame["week_hours"].fillna(0.0)
+    frame["weeks"] = frame["weeks"].fillna(0).astype(int)
+    frame = frame.join(expected, on=["year", "month"])
+
+    # план сравнивается с уже прошедшей частью месяца
+    share = frame["expected"] / frame["weeks_in_month"]
+    frame["plan_to_date"] = frame["plan_hours"] * share
+    frame["deviation"] = frame["week_hours"] - frame["plan_to_date"]
+    frame["overtime"] = frame["deviation"].clip(lower=0)
+    frame["missing_weeks"] = (frame["expected"] - frame["weeks"]).clip(lower=0)
+    has_plan = frame["plan_hours"].notna()
+
+    flags = pd.DataFrame({
+        "users": 1,
+        "logged": frame["week_hours"],
+        "plan_to_date": frame["plan_to_date"],
+        "overtime_users": frame["overtime"] > 0,
+        "overtime_hours": frame["overtime"],
+        "deficit_users": frame["deviation"] < 0,
+        "no_plan": ~has_plan,
+        "missing_users": frame["missing_weeks"] > 0,
+        "missing_weeks": frame["missing_weeks"],
+    })
+    team = flags.groupby(level=["year", "month"]).sum().join(expected["expected"]).join(plans)
+    team[["plan_total", "plans"]] = team[["plan_total", "plans"]].fillna(0)
+    team["deviation_pct"] = np.where(team["plan_to_date"] > 0,
+                                     (team["logged"] / team["plan_to_date"] - 1) * 100, np.nan)
+
+    per_user = frame.groupby(level="user_id").agg(
+        deviation=("deviation", "sum"), overtime=("overtime", "sum"), missing_weeks=("missing_weeks", "sum"))
+    return Report(
+        months=expected.index.tolist(),
+        team=team,
+        top_overtime=per_user[per_user["overtime"] > 0].nlargest(TOP, "overtime"),
+        top_deficit=per_user[per_user["deviation"] < 0].nsmallest(TOP, "deviation"),
+        top_missing=per_user[per_user["missing_weeks"] > 0].nlargest(TOP, "missing_weeks"),
+    )
+
+
+def render_report(report, names):
+    # names: user_id -> (имя, фамилия)
+    if report is None:
+        return "Нет данных за выбранный период."
+
+    def who(user_id):
+        first_name, last_name = names.get(user_id) or ("?", "")
+        return f"{first_name} {last_name}".strip() + f" ({user_id})"
+
+    (y1, m1), (y2, m2) = report.months[0], report.months[-1]
+    lines = [f"📊 Отчёт за {m1:02d}.{y1}–{m2:02d}.{y2}", ""]
+    for (year, month), row in report.team.iterrows():
+        pct = "" if math.isnan(row["deviation_pct"]) else f" ({row['deviation_pct']:+.1f}%)"
+        lines += [
+            f"{month:02d}.{year}: недель закрыто {int(row['expected'])}, сотрудников {int(row['users'])}",
+            f"  план на месяц {row['plan_total']:.0f} ч ({int(row['plans'])} чел.), "
+            f"к этой дате {row['plan_to_date']:.0f} ч, внесено {row['logged']:.0f} ч{pct}",
+            f"  переработка: {int(row['overtime_users'])} чел., {row['overtime_hours']:.0f} ч; "
+            f"недоработка: {int(row['deficit_users'])} чел.",
+            f"  нет плана: {int(row['no_plan'])}; не сдали недели: {int(row['missing_users'])} чел., "
+            f"{int(row['missing_weeks'])} нед.",
+        ]
+    for title, frame, column, fmt in (
+            ("Больше всего переработки", report.top_overtime, "overtime", "+{:.0f} ч"),
+            ("Больше всего недоработки", report.top_deficit, "deviation", "{:.0f} ч"),
+            ("Больше всего несданных недель", report.top_missing, "missing_weeks", "{:.0f} нед.")):
+        if len(frame):
+            lines += ["", f"{title}:"]
+            lines += [f"  {who(user_id)}: {fmt.format(value)}" for user_id, value in frame[column].items()]
+    return "\n".join(lines)
@@ -0,0 +1,407 @@
+import json
+import string
+from abc import ABC, abstractmethod
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date
+
+from archive import delete_archived
+from db import INSERT_WEEK_HOURS, UPSERT_WEEK_HOURS, INSERT_MONTH_HOURS
+
+# SQLite сравнивает LIKE без учёта регистра только для латиницы — так же ищет и MemoryRepository
+ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+class Repository(ABC):
+    # Хранилище пользователей и их часов, через которое работают хендлеры и напоминания.
+    # Реализации: SQLiteRepository (основная база бота) и MemoryRepository (всё в памяти процесса —
+    # для тестов и нагрузочных замеров без диска). Другой движок подключается так же: нужен наследник,
+    # реализующий все абстрактные методы, App выбирает его по storage (STORAGE_BACKEND).
+    #
+    # db — Database с теми же данными для SQL-инструментов (/export, /report, /import);
+    # у хранилищ без SQLite он None, и эти команды недоступны.
+    db = None
+
+    @abstractmethod
+    async def get_user(self, user_id):
+        # (имя, фамилия) или None
+        raise NotImplementedError
+
+    @abstractmethod
+    async def list_users(self):
+        # [(user_id, имя, фамилия)]
+        raise NotImplementedError
+
+    @abstractmethod
+    async def save_user(self, user_id, first_name, last_name):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def rename_user(self, user_id, first_name=None, last_name=None):
+        # False, если такого пользователя нет
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete_user(self, user_id):
+        # пользователь вместе со всеми часами; False, если его не было
+        raise NotImplementedError
+
+    @abstractmethod
+    async def set_timezone(self, user_id, tz_name):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def set_remind_at(self, user_id, remind_at):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def reminder_settings(self):
+        # [(user_id, часовой пояс или None, "ЧЧ:ММ" или None)]
+        raise NotImplementedError
+
+    @abstractmethod
+    async def users_page(self, direction, cursor, prefix, limit):
+        # Страница /users по user_id после (next) или до (prev) cursor, по возрастанию; prefix — начало
+        # имени или фамилии. Строки: (user_id, имя, фамилия, год, месяц, план, год, неделя, часы)
+        # с последними планом и неделей. Возвращает (строки, есть ли ещё страница в эту сторону).
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_week_hours(self, user_id, year, week):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def add_week_hours(self, user_id, year, week, hours):
+        # False, если за неделю часы уже введены
+        raise NotImplementedError
+
+    @abstractmethod
+    async def set_week_hours(self, user_id, year, week, hours):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_month_hours(self, user_id, year, month):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def add_month_hours(self, user_id, year, month, hours):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def missing_week(self, year, week, user_ids=None):
+        # кто из пользователей (или из user_ids) ещё не ввёл часы за неделю
+        raise NotImplementedError
+
+    @abstractmethod
+    async def missing_month(self, year, month, user_ids=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def week_history(self, user_id, before, limit):
+        # [(год, неделя, часы)] строго раньше before=(год, неделя), от новых к старым, вместе с архивом
+        raise NotImplementedError
+
+    @abstractmethod
+    async def month_history(self, user_id, before, limit):
+        # [(год, месяц, план или None, сумма недель, недель)] строго раньше before=(год, месяц);
+        # неделя относится к месяцу своего четверга (ISO 8601)
+        raise NotImplementedError
+
+
+# Повторная регистрация обновляет имя, но не трогает часовой пояс и время напоминаний
+# (INSERT OR REPLACE удалил бы строку целиком)
+SAVE_USER_SQL = """
+    INSERT INTO users (user_id, first_name, last_name) VALUES (?, ?, ?)
+    ON CONFLICT(user_id) DO UPDATE SET first_name = excluded.first_name, last_name = excluded.last_name
+"""
+
+# последние план на месяц и часы за неделю берутся коррелированными подзапросами по индексам
+# UNIQUE(user_id, year, ...), поэтому стоимость страницы не зависит от числа пользователей
+USERS_PAGE_SQL = """
+    SELECT u.user_id, u.first_name, u.last_name, m.year, m.month, m.hours, w.year, w.week, w.hours
+    FROM users u
+    LEFT JOIN monthly_hours m ON m.id = (
+        SELECT id FROM monthly_hours WHERE user_id = u.user_id ORDER BY year DESC, month DESC LIMIT 1)
+    LEFT JOIN weekly_hours w ON w.id = (
+        SELECT id FROM weekly_hours WHERE user_id = u.user_id ORDER BY year DESC, week DESC LIMIT 1)
+    WHERE {where}
+    ORDER BY u.user_id {order}
+    LIMIT ?
+"""
+
+# Получатели напоминаний — только те, кто ещё не ввёл часы за период (анти-join по уникальному индексу),
+# поэтому число отправок и записей FSM растёт с числом недостающих ответов, а не со штатом.
+MISSING_WEEK_SQL = """
+    SELECT u.user_id FROM users u
+    WHERE NOT EXISTS (SELECT 1 FROM weekly_hours w WHERE w.user_id = u.user_id AND w.year = ? AND w.week = ?)
+"""
+MISSING_MONTH_SQL = """
+    SELECT u.user_id FROM users u
+    WHERE NOT EXISTS (SELECT 1 FROM monthly_hours m WHERE m.user_id = u.user_id AND m.year = ? AND m.month = ?)
+"""
+
+# Keyset-страницы истории: диапазон по UNIQUE(user_id, year, week) в обоих уровнях (слияние двух
+# индексных поисков) и по первичному ключу сводки user_month_rollup — без OFFSET и сортировки
+WEEK_HISTORY_SQL = """
+    SELECT year, week, hours FROM weekly_hours_all
+    WHERE user_id = ? AND (year, week) < (?, ?)
+    ORDER BY year DESC, week DESC LIMIT ?
+"""
+MONTH_HISTORY_SQL = """
+    SELECT year, month, plan_hours, week_hours, weeks FROM user_month_rollup
+    WHERE user_id = ? AND (year, month) < (?, ?)
+    ORDER BY year DESC, month DESC LIMIT ?
+"""
+
+
+def read_users_page(conn, direction, cursor, prefix, limit):
+    where, params = [], []
+    if direction == "next":
+        where.append("u.user_id > ?")
+    else:
+        where.append("u.user_id < ?")
+    params.append(cursor)
+    if prefix:
+        pattern = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        where.append("(u.first_name LIKE ? ESCAPE '\\' OR u.last_name LIKE ? ESCAPE '\\')")
+        params += [pattern, pattern]
+    sql = USERS_PAGE_SQL.format(where=" AND ".join(where), order="ASC" if direction == "next" else "DESC")
+    rows = conn.execute(sql, (*params, limit + 1)).fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if direction == "prev":
+        rows.reverse()
+    return rows, has_more
+
+
+def delete_user(conn, user_id):
+    conn.execute("DELETE FROM weekly_hours WHERE user_id=?", (user_id,))
+    conn.execute("DELETE FROM monthly_hours WHERE user_id=?", (user_id,))
+    delete_archived(conn, user_id)
+    return conn.execute("DELETE FROM users WHERE user_id=?", (user_id,)).rowcount
+
+
+class SQLiteRepository(Repository):
+    # Пользователи и часы в основной базе бота (Database): запись часов идёт через групповой
+    # commit (submit), чтения — через пул читателей.
+
+    def __init__(self, db):
+        self.db = db
+
+    async def get_user(self, user_id):
+        row = await self.db.fetchone("SELECT first_name, last_name FROM users WHERE user_id = ?", (user_id,))
+        return tuple(row) if row is not None else None
+
+    async def list_users(self):
+        return await self.db.fetchall("SELECT user_id, first_name, last_name FROM users")
+
+    async def save_user(self, user_id, first_name, last_name):
+        await self.db.execute(SAVE_USER_SQL, (user_id, first_name, last_name))
+
+    async def rename_user(self, user_id, first_name=None, last_name=None):
+        fields = {"first_name": first_name, "last_name": last_name}
+        fields = {name: value for name, value in fields.items() if value is not None}
+        if not fields:
+            return await self.get_user(user_id) is not None
+        assignments = ", ".join(f"{name}=?" for name in fields)
+        return await self.db.execute(f"UPDATE users SET {assignments} WHERE user_id=?",
+                                     (*fields.values(), user_id)) > 0
+
+    async def delete_user(self, user_id):
+        return await self.db.run_write(delete_user, user_id) > 0
+
+    async def set_timezone(self, user_id, tz_name):
+        await self.db.execute("UPDATE users SET timezone=? WHERE user_id=?", (tz_name, user_id))
+
+    async def set_remind_at(self, user_id, remind_at):
+        await self.db.execute("UPDATE users SET remind_at=? WHERE user_id=?", (remind_at, user_id))
+
+    async def reminder_settings(self):
+        return await self.db.fetchall("SELECT user_id, timezone, remind_at FROM users")
+
+    async def users_page(self, direction, cursor, prefix, limit):
+        return await self.db.run_read(read_users_page, direction, cursor, prefix, limit)
+
+    async def get_week_hours(self, user_id, year, week):
+        row = await self.db.fetchone("SELECT hours FROM weekly_hours WHERE user_id = ? AND year = ? AND week = ?",
+                                     (user_id, year, week))
+        return row[0] if row else None
+
+    async def add_week_hours(self, user_id, year, week, hours):
+        return bool(await self.db.submit(INSERT_WEEK_HOURS, (user_id, year, week, hours)))
+
+    async def set_week_hours(self, user_id, year, week, hours):
+        await self.db.submit(UPSERT_WEEK_HOURS, (user_id, year, week, hours))
+
+    async def get_month_hours(self, user_id, year, month):
+        row = await self.db.fetchone("SELECT hours FROM monthly_hours WHERE user_id = ? AND year = ? AND month = ?",
+                                     (user_id, year, month))
+        return row[0] if row else None
+
+    async def add_month_hours(self, user_id, year, month, hours):
+        return bool(await self.db.submit(INSERT_MONTH_HOURS, (user_id, year, month, hours)))
+
+    async def missing_week(self, year, week, user_ids=None):
+        return await self._missing(MISSING_WEEK_SQL, (year, week), user_ids)
+
+    async def missing_month(self, year, month, user_ids=None):
+        return await self._missing(MISSING_MONTH_SQL, (year, month), user_ids)
+
+    async def week_history(self, user_id, before, limit):
+        return await self.db.fetchall(WEEK_HISTORY_SQL, (user_id, *before, limit))
+
+    async def month_history(self, user_id, before, limit):
+        return await self.db.fetchall(MONTH_HISTORY_SQL, (user_id, *before, limit))
+
+    async def _missing(self, sql, period, user_ids):
+        if user_ids is None:
+            rows = await self.db.fetchall(sql, period)
+        else:
+            rows = await self.db.fetchall(sql + " AND u.user_id IN (SELECT value FROM json_each(?))",
+                                          (*period, json.dumps(user_ids)))
+        return [user_id for (user_id,) in rows]
+
+
+def pack_period(year, period):
+    return year * 100 + period
+
+
+class MemoryRepository(Repository):
+    # Всё в памяти процесса, без диска и потоков: для тестов и нагрузочных замеров, где нужна
+    # стоимость самих хендлеров (benchmarks/loadtest.py --storage memory). После перезапуска пусто.
+    #
+    # Пользователи — словарь user_id -> [имя, фамилия, пояс, время] плюс отсортированный array
+    # их id для страниц /users. Часы — по пользователю словарь {год * 100 + период: часы}: ключ-число
+    # вместо кортежа, а последний период пользователя — max() по его ключам.
+
+    def __init__(self):
+        self._users = {}
+        self._ids = array("q")
+        self._weeks = {}
+        self._months = {}
+
+    async def get_user(self, user_id):
+        user = self._users.get(user_id)
+        return (user[0], user[1]) if user is not None else None
+
+    async def list_users(self):
+        return [(user_id, user[0], user[1]) for user_id, user in self._users.items()]
+
+    async def save_user(self, user_id, first_name, last_name):
+        # повторная регистрация меняет только имя, настройки напоминаний остаются
+        user = self._users.get(user_id)
+        if user is None:
+            self._ids.insert(bisect_left(self._ids, user_id), user_id)
+            self._users[user_id] = [first_name, last_name, None, None]
+        else:
+            user[0], user[1] = first_name, last_name
+
+    async def rename_user(self, user_id, first_name=None, last_name=None):
+        user = self._users.get(user_id)
+        if user is None:
+            return False
+        if first_name is not None:
+            user[0] = first_name
+        if last_name is not None:
+            user[1] = last_name
+        return True
+
+    async def delete_user(self, user_id):
+        self._weeks.pop(user_id, None)
+        self._months.pop(user_id, None)
+        if self._users.pop(user_id, None) is None:
+            return False
+        del self._ids[bisect_left(self._ids, user_id)]
+        return True
+
+    async def set_timezone(self, user_id, tz_name):
+        if user_id in self._users:
+            self._users[user_id][2] = tz_name
+
+    async def set_remind_at(self, user_id, remind_at):
+        if user_id in self._users:
+            self._users[user_id][3] = remind_at
+
+    async def reminder_settings(self):
+        return [(user_id, user[2], user[3]) for user_id, user in self._users.items()]
+
+    async def users_page(self, direction, cursor, prefix, limit):
+        prefix = prefix.translate(ASCII_LOWER)
+        if direction == "next":
+            ids = self._ids[bisect_right(self._ids, cursor):]
+        else:
+            ids = reversed(self._ids[:bisect_left(self._ids, cursor)])
+        rows = []
+        for user_id in ids:
+            first_name, last_name = self._users[user_id][:2]
+            if prefix and not (first_name.translate(ASCII_LOWER).startswith(prefix)
+                               or last_name.translate(ASCII_LOWER).startswith(prefix)):
+                continue
+            rows.append((user_id, first_name, last_name, *self._latest(self._months, user_id),
+                         *self._latest(self._weeks, user_id)))
+            if len(rows) > limit:
+                break
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if direction == "prev":
+            rows.reverse()
+        return rows, has_more
+
+    async def get_week_hours(self, user_id, year, week):
+        return self._weeks.get(user_id, {}).get(pack_period(year, week))
+
+    async def add_week_hours(self, user_id, year, week, hours):
+        return self._add(self._weeks, user_id, year, week, hours)
+
+    async def set_week_hours(self, user_id, year, week, hours):
+        self._weeks.setdefault(user_id, {})[pack_period(year, week)] = float(hours)
+
+    async def get_month_hours(self, user_id, year, month):
+        return self._months.get(user_id, {}).get(pack_period(year, month))
+
+    async def add_month_hours(self, user_id, year, month, hours):
+        return self._add(self._months, user_id, year, month, hours)
+
+    async def missing_week(self, year, week, user_ids=None):
+        return self._missing(self._weeks, pack_period(year, week), user_ids)
+
+    async def missing_month(self, year, month, user_ids=None):
+        return self._missing(self._months, pack_period(year, month), user_ids)
+
+    async def week_history(self, user_id, before, limit):
+        bound = pack_period(*before)
+        weeks = self._weeks.get(user_id, {})
+        keys = sorted((key for key in weeks if key < bound), reverse=True)[:limit]
+        return [(key // 100, key % 100, weeks[key]) for key in keys]
+
+    async def month_history(self, user_id, before, limit):
+        bound = pack_period(*before)
+        months = {key: [plan, 0.0, 0] for key, plan in self._months.get(user_id, {}).items() if key < bound}
+        for key, hours in self._weeks.get(user_id, {}).items():
+            thursday = date.fromisocalendar(key // 100, key % 100, 4)
+            month = pack_period(thursday.year, thursday.month)
+            if month < bound:
+                row = months.setdefault(month, [None, 0.0, 0])
+                row[1] += hours
+                row[2] += 1
+        return [(key // 100, key % 100, *months[key]) for key in sorted(months, reverse=True)[:limit]]
+
+    def _add(self, table, user_id, year, period, hours):
+        periods = table.setdefault(user_id, {})
+        key = pack_period(year, period)
+        if key in periods:
+            return False
+        periods[key] = float(hours)
+        return True
+
+    def _missing(self, table, key, user_ids):
+        candidates = self._users if user_ids is None else (uid for uid in user_ids if uid in self._users)
+        return [user_id for user_id in candidates if key not in table.get(user_id, ())]
+
+    @staticmethod
+    def _latest(table, user_id):
+        periods = table.get(user_id)
+        if not periods:
+            return None, None, None
+        key = max(periods)
+        return key // 100, key % 100, periods[key]
@@ -0,0 +1,33 @@
+import asyncio
+import json
+import os
+from datetime import date
+
+from archive import Archiver
+from bulk_import import ParsedImport, apply_import
+from db import Database, INSERT_WEEK_HOURS
+from export import ExportCache, ExportQuery
+
+
+def test_import_into_archive_refreshes_cached_export(tmp_path):
+    async def scenario():
+        db = Database(os.path.join(tmp_path, "bot.db"), archive_path=os.path.join(tmp_path, "archive.db"))
+        await db.connect()
+        await db.execute("INSERT INTO users (user_id, first_name, last_name) VALUES (1, 'Анна', 'Иванова')")
+        await db.submit(INSERT_WEEK_HOURS, (1, 2024, 10, 40.0))
+        assert await Archiver(db, after_months=12).run(today=date(2026, 1, 15)) == 1
+
+        cache = ExportCache()
+        query = ExportQuery(fmt="jsonl")
+        before = await cache.get(db, query)
+        await db.run_write(apply_import, ParsedImport(weeks={(1, 2024, 10): 10.0}))
+        after = await cache.get(db, query)
+        rows = await db.fetchall("SELECT hours FROM weekly_hours_all")
+        await db.close()
+        return before, after, rows
+
+    before, after, rows = asyncio.run(scenario())
+    assert rows == [(10.0,)]
+    hours = [json.loads(line).get("hours") for line in after.decode().splitlines()]
+    assert 10.0 in hours and 40.0 not in hours
+    assert after != before
@@ -0,0 +1,89 @@
+import asyncio
+import io
+import os
+
+from bulk_import import IMPORT_FORMATS, ParsedImport, apply_import, read_import
+from db import Database, INSERT_MONTH_HOURS, INSERT_WEEK_HOURS
+from export import ExportQuery, build_export
+
+USERS = [(1, ("Анна", "Иванова")), (2, ("Борис", "Петров")), (3, ("Вера", "Смирнова")), (4, ("Вера", "Смирнова"))]
+
+
+def test_apply_counts_inserted_and_updated_rows(tmp_path):
+    async def scenario():
+        db = Database(os.path.join(tmp_path, "bot.db"))
+        await db.connect()
+        await db.executemany("INSERT INTO users (user_id, first_name, last_name) VALUES (?, ?, ?)",
+                             [(1, "Анна", "Иванова"), (2, "Борис", "Петров")])
+        await db.submit(INSERT_WEEK_HOURS, (1, 2025, 10, 40.0))
+        await db.submit(INSERT_WEEK_HOURS, (1, 2025, 11, 40.0))
+        await db.submit(INSERT_MONTH_HOURS, (2, 2025, 3, 160.0))
+        parsed = ParsedImport(
+            users={2: (2, "Борис", "Сидоров"), 3: (3, "Вера", "Смирнова")},
+            # 10 — та же цифра (без изменений), 11 — обновление, 12 — новая неделя
+            weeks={(1, 2025, 10): 40.0, (1, 2025, 11): 38.0, (1, 2025, 12): 20.0, (3, 2025, 12): 8.0},
+            months={(2, 2025, 3): 150.0, (2, 2025, 4): 168.0},
+        )
+        result = await db.run_write(apply_import, parsed)
+        hours = await db.fetchall("SELECT user_id, year, week, hours FROM weekly_hours ORDER BY user_id, week")
+        await db.close()
+        return result, [tuple(row) for row in hours]
+
+    result, hours = asyncio.run(scenario())
+    assert (result.users_inserted, result.users_updated) == (1, 1)
+    assert (result.inserted, result.updated) == (3, 2)
+    assert hours == [(1, 2025, 10, 40.0), (1, 2025, 11, 38.0), (1, 2025, 12, 20.0), (3, 2025, 12, 8.0)]
+
+
+def test_export_files_import_back(tmp_path):
+    async def scenario():
+        db = Database(os.path.join(tmp_path, "bot.db"))
+        await db.connect()
+        await db.executemany("INSERT INTO users (user_id, first_name, last_name) VALUES (?, ?, ?)",
+                             [(user_id, *name) for user_id, name in USERS])
+        await db.executemany(INSERT_WEEK_HOURS, [(1, 2025, 10, 40.0), (2, 2024, 52, 37.5), (3, 2025, 1, 0.0)])
+        await db.executemany(INSERT_MONTH_HOURS, [(1, 2025, 3, 160.0), (4, 2024, 12, 120.5)])
+        await db.close()
+        return db.path
+
+    path = asyncio.run(scenario())
+    for fmt in IMPORT_FORMATS:
+        _, data = build_export(path, ExportQuery(fmt=fmt))
+        parsed = read_import(io.BytesIO(data), fmt, USERS)
+        assert (parsed.rows, parsed.rejected, parsed.users) == (5, 0, {}), fmt
+        assert parsed.weeks == {(1, 2025, 10): 40.0, (2, 2024, 52): 37.5, (3, 2025, 1): 0.0}, fmt
+        assert parsed.months == {(1, 2025, 3): 160.0, (4, 2024, 12): 120.5}, fmt
+
+
+def test_bad_rows_are_rejected_with_reasons():
+    lines = [
+        "User ID,First Name,Last Name,Year,Week,Hours",
+        ",Анна,Иванова,2025,10,40",       # по имени и фамилии
+        "2,,,2025,10,\"37,5\"",          # запятая в часах
+        "2,,,2025,10,38",                 # повтор периода: берётся последняя строка
+        "5,Галина,Орлова,2025,10,8",      # новый пользователь с User ID и именем
+        "1,,,1999,10,40",
+        "1,,,2025,53,40",                 # в 2025 году 52 недели
+        "1,,,2025,11,200",
+        "1,,,2025,12,",
+        "6,,,2025,10,40",
+        ",Вера,Смирнова,2025,10,40",      # двое с таким именем
+        ",Дмитрий,Козлов,2025,10,40",
+        "x,Анна,Иванова,2025,10,40",
+        "1,,,2025,,40",
+    ]
+    parsed = read_import(io.BytesIO("\n".join(lines).encode("utf-8")), "csv", USERS)
+    assert parsed.weeks == {(1, 2025, 10): 40.0, (2, 2025, 10): 38.0, (5, 2025, 10): 8.0}
+    assert parsed.users == {5: (5, "Галина", "Орлова")}
+    assert (parsed.rows, parsed.duplicates, parsed.rejected) == (13, 1, 9)
+    assert parsed.errors == [
+        "строка 6: некорректный год «1999»",
+        "строка 7: некорректный номер недели «53»",
+        "строка 8: некорректное число часов «200»",
+        "строка 9: некорректное число часов «»",
+        "строка 10: пользователь 6 не найден, а имя и фамилия не указаны",
+        "строка 11: несколько пользователей «Вера Смирнова», укажите User ID",
+        "строка 12: пользователь «Дмитрий Козлов» не найден",
+        "строка 13: некорректный User ID «x»",
+        "строка 14: не указан лист (WeeklyHours/MonthlyHours) или столбец Week/Month",
+    ]
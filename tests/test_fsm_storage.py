@@ -0,0 +1,87 @@
+import asyncio
+import os
+import time
+
+from aiogram.fsm.storage.base import StorageKey
+
+from db import Database
+from fsm_storage import SQLiteStorage
+
+KEY = StorageKey(bot_id=1, chat_id=7, user_id=7)
+
+
+def test_replicas_see_each_others_states(tmp_path):
+    async def scenario():
+        path = os.path.join(tmp_path, "bot.db")
+        first_db, second_db = Database(path), Database(path)
+        await first_db.connect()
+        await second_db.connect()
+        first = SQLiteStorage(first_db, cache_ttl=0.05)
+        second = SQLiteStorage(second_db, cache_ttl=0.05)
+        seen = [await second.get_state(KEY)]
+        # вопрос задала первая реплика, ответ пришёл на вторую
+        await first.set_state(KEY, "Form:hours")
+        await first.set_data(KEY, {"week": 12})
+        await first.flush()
+        await asyncio.sleep(0.1)
+        seen.append((await second.get_state(KEY), await second.get_data(KEY)))
+        # вторая обработала ответ и сбросила состояние
+        await second.set_state(KEY, None)
+        await second.set_data(KEY, {})
+        await second.flush()
+        await asyncio.sleep(0.1)
+        seen.append((await first.get_state(KEY), await first.get_data(KEY)))
+        await first.close()
+        await second.close()
+        await first_db.close()
+        await second_db.close()
+        return seen
+
+    assert asyncio.run(scenario()) == [None, ("Form:hours", {"week": 12}), (None, {})]
+
+
+def test_close_flushes_pending_changes(tmp_path):
+    async def scenario():
+        path = os.path.join(tmp_path, "bot.db")
+        db = Database(path)
+        await db.connect()
+        # flush_interval больше теста: в базу изменения попадают только при close
+        storage = SQLiteStorage(db, flush_interval=60)
+        await storage.set_state(KEY, "Form:hours")
+        await storage.set_data(KEY, {"week": 12})
+        before = await db.fetchone("SELECT count(*) FROM fsm_states")
+        await storage.close()
+        await db.close()
+
+        db = Database(path)
+        await db.connect()
+        storage = SQLiteStorage(db)
+        after = await storage.get_state(KEY), await storage.get_data(KEY)
+        await storage.close()
+        await db.close()
+        return before[0], after
+
+    assert asyncio.run(scenario()) == (0, ("Form:hours", {"week": 12}))
+
+
+def test_expired_states_are_dropped(tmp_path):
+    async def scenario():
+        db = Database(os.path.join(tmp_path, "bot.db"))
+        await db.connect()
+        await db.execute("INSERT INTO fsm_states (key, state, data, updated_at) VALUES (?, ?, ?, ?)",
+                         (SQLiteStorage._key(KEY), "Form:hours", '{"week": 12}', time.time() - 3600))
+        fresh = SQLiteStorage(db, ttl=7200)
+        stale = SQLiteStorage(db, ttl=60, gc_interval=0)
+        seen = [await fresh.get_state(KEY), await stale.get_state(KEY), await stale.get_data(KEY)]
+        # сборщик удаляет строки старше ttl при следующей записи
+        await stale.set_state(StorageKey(bot_id=1, chat_id=8, user_id=8), "Form:name")
+        await stale.flush()
+        keys = [row[0] for row in await db.fetchall("SELECT key FROM fsm_states")]
+        await fresh.close()
+        await stale.close()
+        await db.close()
+        return seen, keys
+
+    seen, keys = asyncio.run(scenario())
+    assert seen == ["Form:hours", None, {}]
+    assert keys == [SQLiteStorage._key(StorageKey(bot_id=1, chat_id=8, user_id=8))]
@@ -0,0 +1,75 @@
+import time
+from datetime import date
+
+import pytest
+
+from history import HistoryCache, parse_week, render_month_page, render_week_page, weeks_ago
+
+# среда 12-й ISO-недели 2025 года
+TODAY = date(2025, 3, 19)
+
+
+def buttons(markup):
+    return [button.callback_data for row in markup.inline_keyboard for button in row]
+
+
+def test_parse_week():
+    assert parse_week("12", TODAY) == (2025, 12)
+    assert parse_week("W5", TODAY) == (2025, 5)
+    # неделя с этим номером в этом году ещё не началась — значит, прошлогодняя
+    assert parse_week("13", TODAY) == (2024, 13)
+    assert parse_week("2025-W12", TODAY) == (2025, 12)
+    assert parse_week("2020w53", TODAY) == (2020, 53)
+    for text in ("2021-W53", "0", "W54", "неделя", "2025-12-01"):
+        with pytest.raises(ValueError):
+            parse_week(text, TODAY)
+    assert [weeks_ago(TODAY, *week) for week in ((2025, 12), (2025, 8), (2024, 52), (2025, 13))] == [0, 4, 12, -1]
+
+
+def test_week_page_marks_editable_weeks():
+    rows = [(2025, 12, 40.0), (2025, 8, 37.5), (2025, 7, 30.0)]
+    text, markup = render_week_page(rows, True, None, TODAY, edit_weeks=4)
+    assert text.split("\n") == [
+        "🗓 *История: недели*",
+        "Нед. 12 (17.03–23.03.2025) — 40 ч. ✏️",
+        "Нед. 8 (17.02–23.02.2025) — 37.5 ч. ✏️",
+        "Нед. 7 (10.02–16.02.2025) — 30 ч.",
+        "",
+        "Итого за 3 нед.: 107.5 ч.",
+        "✏️ — можно изменить, например `/weekchange 2025-W12`",
+    ]
+    # есть ещё страница: кнопка ведёт на курсор последней строки; это первая страница — без "Сначала"
+    assert buttons(markup) == ["history:w:2025-7", "history:m:"]
+
+
+def test_last_week_page_and_month_page():
+    text, markup = render_week_page([], False, (2020, 10), TODAY, edit_weeks=4)
+    assert text == "🗓 *История: недели*\nБолее ранних записей нет."
+    assert buttons(markup) == ["history:w:", "history:m:"]
+
+    rows = [(2025, 3, 160.0, 120.0, 3), (2025, 2, None, 80.0, 2)]
+    text, markup = render_month_page(rows, False, None)
+    assert text.split("\n")[1:] == [
+        "03.2025 — план 160 ч., недели: 120 ч. (3 нед.), -40",
+        "02.2025 — план не введён, недели: 80 ч. (2 нед.)",
+        "",
+        "Итого: план 160 ч., недели 200 ч.",
+    ]
+    assert buttons(markup) == ["history:w:"]
+
+
+def test_history_cache_limits_and_invalidation():
+    cache = HistoryCache(max_users=2, max_pages=2, ttl=0.05)
+    for user_id in (1, 2):
+        cache.put(user_id, ("w", None), f"page {user_id}")
+    assert cache.get(1, ("w", None)) == "page 1"
+    # третий пользователь вытесняет давно не читавшегося второго
+    cache.put(3, ("w", None), "page 3")
+    assert [cache.get(user_id, ("w", None)) for user_id in (1, 2, 3)] == ["page 1", None, "page 3"]
+    for cursor in ((2025, 10), (2025, 5)):
+        cache.put(1, ("w", cursor), cursor)
+    assert cache.get(1, ("w", None)) is None
+    cache.invalidate(1)
+    assert cache.get(1, ("w", (2025, 5))) is None
+    time.sleep(0.1)
+    assert cache.get(3, ("w", None)) is None
@@ -0,0 +1,11 @@
+import asyncio
+
+from lanes import UpdateLanes
+
+
+def test_wait_for_room_with_queue_smaller_than_polling_batch():
+    async def scenario():
+        lanes = UpdateLanes(dp=None, bot=None, lanes={"light": (1, 10), "heavy": (1, 1)})
+        await asyncio.wait_for(lanes.wait_for_room(), 1)
+
+    asyncio.run(scenario())
@@ -0,0 +1,76 @@
+import asyncio
+
+from leader import LeaderElection, SQLiteLease
+
+
+def test_slow_on_elected_does_not_stop_lease_renewal(tmp_path):
+    async def scenario():
+        path = str(tmp_path / "lease.db")
+        started = asyncio.Event()
+
+        async def slow_start():
+            # долгий запуск лидера, например догоняющие напоминания
+            started.set()
+            await asyncio.sleep(1)
+
+        first = LeaderElection(SQLiteLease(path, "scheduler"), ttl=0.3, owner="first", on_elected=slow_start)
+        second = LeaderElection(SQLiteLease(path, "scheduler"), ttl=0.3, owner="second")
+        first.start()
+        await started.wait()
+        second.start()
+        await asyncio.sleep(0.8)
+        leaders = first.is_leader, second.is_leader
+        await first.stop()
+        await second.stop()
+        return leaders
+
+    assert asyncio.run(scenario()) == (True, False)
+
+
+def test_demotion_cancels_running_on_elected(tmp_path):
+    async def scenario():
+        events = []
+
+        async def slow_start():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                events.append("cancelled")
+                raise
+
+        async def demoted():
+            events.append("demoted")
+
+        election = LeaderElection(SQLiteLease(str(tmp_path / "lease.db"), "scheduler"), ttl=0.3,
+                                  on_elected=slow_start, on_demoted=demoted)
+        election.start()
+        await asyncio.sleep(0.05)
+        await election.stop()
+        return events
+
+    assert asyncio.run(scenario()) == ["cancelled", "demoted"]
+
+
+def test_failed_on_elected_gives_up_the_lease(tmp_path):
+    async def scenario():
+        path = str(tmp_path / "lease.db")
+        events = []
+
+        async def broken_start():
+            events.append("elected")
+            raise RuntimeError("нет связи с базой")
+
+        async def demoted():
+            events.append("demoted")
+
+        first = LeaderElection(SQLiteLease(path, "scheduler"), ttl=0.3, owner="first",
+                               on_elected=broken_start, on_demoted=demoted)
+        first.start()
+        await asyncio.sleep(0.05)
+        # аренда свободна сразу, а не через ttl: её забирает другая реплика
+        taken = await SQLiteLease(path, "scheduler").acquire("second", 0.3)
+        leader = first.is_leader
+        await first.stop()
+        return events, leader, taken
+
+    assert asyncio.run(scenario()) == (["elected", "demoted"], False, True)
@@ -0,0 +1,85 @@
+import asyncio
+import os
+from collections import Counter
+
+from broadcast import Broadcaster
+from db import Database
+from outbox import Outbox
+
+
+class SlowBot:
+    # отправка занимает delay секунд — волна длиннее интервала воркера
+    def __init__(self, delay):
+        self.delay = delay
+        self.sent = Counter()
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await asyncio.sleep(self.delay)
+        self.sent[chat_id] += 1
+
+
+def make_outbox(db, bot, **kwargs):
+    return Outbox(db, Broadcaster(bot, rate=10000, per_chat_interval=0, concurrency=20), **kwargs)
+
+
+async def enqueue(outbox, count):
+    return await outbox.enqueue((f"test:{chat_id}", chat_id, "привет", None) for chat_id in range(1, count + 1))
+
+
+async def drain_until(outbox, done):
+    while not done.is_set():
+        await outbox.drain_due()
+        await asyncio.sleep(0.01)
+
+
+def test_worker_does_not_resend_rows_of_running_wave(tmp_path):
+    async def scenario():
+        db = Database(os.path.join(tmp_path, "outbox.db"))
+        await db.connect()
+        bot = SlowBot(0.05)
+        # claim истекает задолго до конца волны: защищать должны замок и отметка 'sent' по строкам
+        outbox = make_outbox(db, bot, claim_seconds=0.05)
+        ids = await enqueue(outbox, 200)
+        done = asyncio.Event()
+        worker = asyncio.create_task(drain_until(outbox, done))
+        result = await outbox.deliver(ids)
+        await asyncio.sleep(0.1)
+        done.set()
+        await worker
+        statuses = await db.fetchall("SELECT status, count(*) FROM outbox GROUP BY status")
+        await db.close()
+        return bot, result, statuses
+
+    bot, result, statuses = asyncio.run(scenario())
+    assert result.delivered == 200
+    assert len(bot.sent) == 200
+    assert set(bot.sent.values()) == {1}
+    assert statuses == [("sent", 200)]
+
+
+def test_second_replica_does_not_resend_rows_of_long_wave(tmp_path):
+    async def scenario():
+        path = os.path.join(tmp_path, "outbox.db")
+        first_db, second_db = Database(path), Database(path)
+        await first_db.connect()
+        await second_db.connect()
+        first_bot, second_bot = SlowBot(0.2), SlowBot(0.2)
+        # волна (~2 с) намного длиннее забора: строки держит только продление
+        first = make_outbox(first_db, first_bot, claim_seconds=0.3)
+        second = make_outbox(second_db, second_bot, claim_seconds=0.3)
+        ids = await enqueue(first, 200)
+        wave = asyncio.create_task(first.deliver(ids))
+        # воркер второй реплики включается, когда волна уже забрала строки
+        await asyncio.sleep(0.1)
+        done = asyncio.Event()
+        worker = asyncio.create_task(drain_until(second, done))
+        await wave
+        done.set()
+        await worker
+        await first_db.close()
+        await second_db.close()
+        return first_bot.sent + second_bot.sent
+
+    sent = asyncio.run(scenario())
+    assert len(sent) == 200
+    assert set(sent.values()) == {1}
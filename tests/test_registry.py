@@ -0,0 +1,62 @@
+import asyncio
+
+from registry import UserRegistry
+from repository import MemoryRepository
+
+
+def test_stale_entries_are_rechecked_in_repository():
+    async def scenario():
+        repo = MemoryRepository()
+        await repo.save_user(1, "Анна", "Иванова")
+        registry = UserRegistry(ttl=0.05)
+        await registry.load(repo)
+        # другая реплика удаляет пользователя 1 и регистрирует пользователя 2
+        await repo.delete_user(1)
+        await repo.save_user(2, "Борис", "Петров")
+        fresh = registry.is_registered(1)
+        await asyncio.sleep(0.1)
+        stale = registry.is_registered(1), registry.get(1)
+        fetched = await registry.fetch(repo, 1), await registry.fetch(repo, 2)
+        await asyncio.sleep(0.1)
+        await registry.refresh(repo)
+        return fresh, stale, fetched, registry.items()
+
+    fresh, stale, fetched, items = asyncio.run(scenario())
+    assert fresh is True
+    assert stale == (False, None)
+    assert fetched == (None, ("Борис", "Петров"))
+    assert items == [(2, ("Борис", "Петров"))]
+
+
+class CountingRepository(MemoryRepository):
+    def __init__(self):
+        super().__init__()
+        self.lookups = 0
+
+    async def get_user(self, user_id):
+        self.lookups += 1
+        return await super().get_user(user_id)
+
+
+def test_unregistered_users_are_cached_too():
+    async def scenario():
+        repo = CountingRepository()
+        registry = UserRegistry(ttl=0.05)
+        await registry.load(repo)
+        answers = [await registry.fetch(repo, 5) for _ in range(10)]
+        lookups = repo.lookups
+        # регистрация на этой реплике видна сразу, на другой — через ttl
+        registry.set(5, "Анна", "Иванова")
+        registered = await registry.fetch(repo, 5)
+        await registry.fetch(repo, 6)
+        await repo.save_user(6, "Борис", "Петров")
+        cached = await registry.fetch(repo, 6)
+        forced = await registry.fetch(repo, 6, cached=False)
+        return answers, lookups, registered, cached, forced
+
+    answers, lookups, registered, cached, forced = asyncio.run(scenario())
+    assert answers == [None] * 10
+    assert lookups == 1
+    assert registered == ("Анна", "Иванова")
+    assert cached is None
+    assert forced == ("Борис", "Петров")
@@ -0,0 +1,44 @@
+from datetime import datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from reminders import due_times, user_offset
+
+UTC = timezone.utc
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=UTC)
+
+
+def test_weekly_reminder_follows_local_time_across_dst():
+    # в Берлине переход на летнее время 30.03.2025: 9:00 по местному — сначала 8:00, потом 7:00 UTC
+    due = list(due_times("week", 1, ZoneInfo("Europe/Berlin"), time(9, 0), utc(2025, 3, 20), utc(2025, 4, 3),
+                         window_minutes=0, followup_hours=0))
+    assert due == [(utc(2025, 3, 24, 8), False, (2025, 12)), (utc(2025, 3, 31, 7), False, (2025, 13))]
+
+
+def test_local_monday_is_found_on_utc_sunday():
+    # в Окленде (UTC+13) понедельник 9:00 — это ещё воскресенье по UTC
+    due = list(due_times("week", 1, ZoneInfo("Pacific/Auckland"), time(9, 0), utc(2025, 3, 2), utc(2025, 3, 3),
+                         window_minutes=0, followup_hours=0))
+    assert due == [(utc(2025, 3, 2, 20), False, (2025, 9))]
+
+
+def test_monthly_reminder_and_followup():
+    due = list(due_times("month", 1, ZoneInfo("America/New_York"), time(9, 30), utc(2025, 3, 25),
+                         utc(2025, 4, 10), window_minutes=0, followup_hours=24))
+    assert due == [(utc(2025, 4, 1, 13, 30), False, (2025, 4)), (utc(2025, 4, 2, 13, 30), True, (2025, 4))]
+
+
+def test_reminders_are_spread_over_window():
+    offsets = {user_offset(user_id, 30) for user_id in range(1, 1001)}
+    assert all(timedelta(0) <= offset < timedelta(minutes=30) for offset in offsets)
+    assert len(offsets) == 30
+    due = list(due_times("week", 7, ZoneInfo("UTC"), time(9, 0), utc(2025, 3, 3), utc(2025, 3, 4),
+                         window_minutes=30, followup_hours=0))
+    assert due == [(utc(2025, 3, 3, 9) + user_offset(7, 30), False, (2025, 9))]
+    # окно не выталкивает напоминание за конец интервала: каждый момент выдаётся ровно один раз
+    halves = [list(due_times("week", 7, ZoneInfo("UTC"), time(9, 0), start, end, window_minutes=30,
+                             followup_hours=0))
+              for start, end in ((utc(2025, 3, 3), utc(2025, 3, 3, 9, 10)), (utc(2025, 3, 3, 9, 10), utc(2025, 3, 4)))]
+    assert halves[0] + halves[1] == due
@@ -0,0 +1,131 @@
+import asyncio
+import os
+import random
+from datetime import date
+
+from archive import Archiver
+from db import Database
+from repository import MemoryRepository, Repository, SQLiteRepository
+
+NAMES = ["Анна", "анна", "Boris", "boris", "Вера", "Ivan_", "X%"]
+
+
+def rows(result):
+    # sqlite3.Row и списки — в кортежи, user_id остаются числами
+    return [row if isinstance(row, int) else tuple(row) for row in result]
+
+
+async def same(repos, method, *args, unordered=False, **kwargs):
+    # одна и та же операция на обоих хранилищах должна дать один и тот же ответ
+    results = []
+    for repo in repos:
+        result = await getattr(repo, method)(*args, **kwargs)
+        if method == "users_page":
+            result = rows(result[0]), result[1]
+        elif isinstance(result, list):
+            result = sorted(rows(result)) if unordered else rows(result)
+        results.append(result)
+    assert results[0] == results[1], (method, args, kwargs)
+    return results[0]
+
+
+def test_repository_is_abstract():
+    class Partial(Repository):
+        async def get_user(self, user_id):
+            return None
+
+    for cls in (Repository, Partial):
+        try:
+            cls()
+        except TypeError:
+            continue
+        raise AssertionError(f"{cls.__name__} создаётся без всех методов")
+
+
+def test_memory_repository_matches_sqlite(tmp_path):
+    async def scenario():
+        db = Database(os.path.join(tmp_path, "bot.db"), archive_path=os.path.join(tmp_path, "archive.db"))
+        await db.connect()
+        repos = [SQLiteRepository(db), MemoryRepository()]
+        rnd = random.Random(1)
+        for user_id in rnd.sample(range(1, 500), 120):
+            first_name = rnd.choice(NAMES)
+            for repo in repos:
+                await repo.save_user(user_id, first_name, "Фамилия")
+        for _ in range(600):
+            user_id, year, period, hours = rnd.randrange(1, 500), rnd.choice([2024, 2025]), rnd.randrange(1, 13), \
+                float(rnd.randrange(50))
+            method = rnd.choice(["add_week_hours", "set_week_hours", "add_month_hours"])
+            await same(repos, method, user_id, year, period, hours)
+        for user_id in rnd.sample(range(1, 500), 30):
+            await same(repos, "delete_user", user_id)
+            await same(repos, "rename_user", user_id + 1, first_name="Зоя")
+            await same(repos, "set_timezone", user_id + 2, "Europe/Moscow")
+            await same(repos, "set_remind_at", user_id + 2, "09:30")
+        await same(repos, "list_users", unordered=True)
+        for user_id in range(1, 500, 7):
+            await same(repos, "get_user", user_id)
+            await same(repos, "get_week_hours", user_id, 2024, 3)
+            await same(repos, "get_month_hours", user_id, 2025, 12)
+        for prefix in ["", "ан", "А", "b", "I", "x%", "_"]:
+            for direction in ("next", "prev"):
+                for cursor in (0, 100, 250, 600):
+                    await same(repos, "users_page", direction, cursor, prefix, 20)
+        for year, period in [(2024, 3), (2025, 12)]:
+            await same(repos, "missing_week", year, period, unordered=True)
+            await same(repos, "missing_month", year, period, user_ids=list(range(200)), unordered=True)
+        await same(repos, "reminder_settings", unordered=True)
+        await db.close()
+
+    asyncio.run(scenario())
+
+
+def test_history_pages_match_after_archiving(tmp_path):
+    async def scenario():
+        db = Database(os.path.join(tmp_path, "bot.db"), archive_path=os.path.join(tmp_path, "archive.db"))
+        await db.connect()
+        repos = [SQLiteRepository(db), MemoryRepository()]
+        rnd = random.Random(2)
+        for repo in repos:
+            await repo.save_user(7, "Анна", "Иванова")
+        for year in (2023, 2024, 2025, 2026):
+            for week in range(1, 53):
+                if rnd.random() < 0.7:
+                    hours = float(rnd.randrange(60))
+                    for repo in repos:
+                        await repo.add_week_hours(7, year, week, hours)
+            for month in range(1, 13):
+                if rnd.random() < 0.6:
+                    for repo in repos:
+                        await repo.add_month_hours(7, year, month, 160.0)
+        # часть часов уходит в архив SQLite, MemoryRepository держит всё у себя
+        assert await Archiver(db, after_months=12).run(today=date(2026, 10, 18)) > 0
+        for method in ("week_history", "month_history"):
+            cursor, pages = (9999, 99), 0
+            while True:
+                page = await same(repos, method, 7, cursor, 9)
+                if not page:
+                    break
+                cursor, pages = page[-1][:2], pages + 1
+            assert pages > 1
+        await db.close()
+
+    asyncio.run(scenario())
+
+
+def test_registering_again_keeps_reminder_settings(tmp_path):
+    async def scenario():
+        db = Database(os.path.join(tmp_path, "bot.db"))
+        await db.connect()
+        settings = []
+        for repo in (SQLiteRepository(db), MemoryRepository()):
+            await repo.save_user(1, "Анна", "Иванова")
+            await repo.set_timezone(1, "Asia/Yekaterinburg")
+            await repo.set_remind_at(1, "09:30")
+            await repo.save_user(1, "Анна", "Петрова")
+            settings.append((await repo.get_user(1), rows(await repo.reminder_settings())))
+        await db.close()
+        return settings
+
+    expected = (("Анна", "Петрова"), [(1, "Asia/Yekaterinburg", "09:30")])
+    assert asyncio.run(scenario()) == [expected, expected]
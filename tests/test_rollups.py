@@ -0,0 +1,75 @@
+import asyncio
+import os
+import random
+from datetime import date
+
+from db import Database, rebuild_rollups, refresh_rollups
+
+
+def snapshot(conn):
+    return (conn.execute("SELECT * FROM user_month_rollup ORDER BY 1, 2, 3").fetchall(),
+            conn.execute("SELECT * FROM period_rollup ORDER BY 1, 2, 3").fetchall())
+
+
+def test_iso_week_month_matches_calendar(tmp_path):
+    async def scenario():
+        db = Database(os.path.join(tmp_path, "bot.db"))
+        await db.connect()
+        rows = await db.fetchall("SELECT year, week, month_year, month FROM iso_week_month")
+        await db.close()
+        return rows
+
+    expected = set()
+    for year in range(2000, 2101):
+        for week in range(1, 54):
+            try:
+                thursday = date.fromisocalendar(year, week, 4)
+            except ValueError:
+                continue
+            expected.add((year, week, thursday.year, thursday.month))
+    assert {tuple(row) for row in asyncio.run(scenario())} == expected
+
+
+def test_triggers_keep_rollups_equal_to_rebuild(tmp_path):
+    async def scenario():
+        db = Database(os.path.join(tmp_path, "bot.db"))
+        await db.connect()
+        rnd = random.Random(3)
+        await db.executemany("INSERT INTO users (user_id, first_name, last_name) VALUES (?, 'Имя', 'Фамилия')",
+                             [(user_id,) for user_id in range(1, 21)])
+        # недели на стыках месяцев и годов (2020-W53, 2025-W01 с четвергом в январе) и обычные
+        weeks = [(2020, 53), (2021, 1), (2024, 52), (2025, 1), (2025, 5), (2025, 9), (2025, 14)]
+        for _ in range(400):
+            user_id, action = rnd.randrange(1, 21), rnd.random()
+            year, week = rnd.choice(weeks)
+            hours = float(rnd.randrange(0, 60))
+            if action < 0.5:
+                await db.execute("""INSERT INTO weekly_hours (user_id, year, week, hours) VALUES (?, ?, ?, ?)
+                                    ON CONFLICT(user_id, year, week) DO UPDATE SET hours = excluded.hours""",
+                                 (user_id, year, week, hours))
+            elif action < 0.6:
+                # перенос часов на другую неделю меняет и месяц сводки
+                await db.execute("UPDATE OR IGNORE weekly_hours SET year = ?, week = ? WHERE user_id = ?"
+                                 " AND id = (SELECT min(id) FROM weekly_hours WHERE user_id = ?)",
+                                 (year, week, user_id, user_id))
+            elif action < 0.75:
+                await db.execute("DELETE FROM weekly_hours WHERE user_id = ? AND year = ? AND week = ?",
+                                 (user_id, year, week))
+            elif action < 0.9:
+                await db.execute("""INSERT INTO monthly_hours (user_id, year, month, hours) VALUES (?, ?, ?, ?)
+                                    ON CONFLICT(user_id, year, month) DO UPDATE SET hours = excluded.hours""",
+                                 (user_id, year, rnd.randrange(1, 13), hours * 4))
+            else:
+                await db.execute("DELETE FROM monthly_hours WHERE user_id = ? AND year = ?", (user_id, year))
+        by_triggers = await db.run_read(snapshot)
+        await db.run_write(refresh_rollups, weeks, [(2025, month) for month in range(1, 13)])
+        by_refresh = await db.run_read(snapshot)
+        await db.run_write(rebuild_rollups)
+        by_rebuild = await db.run_read(snapshot)
+        await db.close()
+        return by_triggers, by_refresh, by_rebuild
+
+    by_triggers, by_refresh, by_rebuild = asyncio.run(scenario())
+    assert by_triggers[0] and by_triggers[1]
+    assert by_triggers == by_rebuild
+    assert by_refresh == by_rebuild
@@ -0,0 +1,71 @@
+import asyncio
+import warnings
+
+import pytest
+from aiogram import Bot, Dispatcher
+from aiogram.types import Message
+from aiohttp.test_utils import TestClient, TestServer
+
+from lanes import UpdateLanes
+from webhook import SECRET_HEADER, WebhookServer
+
+
+class Lanes:
+    def __init__(self):
+        self.updates = []
+
+    def submit(self, update):
+        self.updates.append(update)
+        return True
+
+
+def test_server_requires_secret():
+    with pytest.raises(ValueError):
+        WebhookServer(Lanes(), bot=None, secret=None)
+
+
+def test_rejects_requests_without_secret():
+    async def scenario():
+        lanes = Lanes()
+        server = WebhookServer(lanes, bot=None, secret="s3cret")
+        async with TestClient(TestServer(server.app())) as client:
+            update = {"update_id": 1}
+            statuses = [
+                (await client.post("/webhook", json=update)).status,
+                (await client.post("/webhook", json=update, headers={SECRET_HEADER: "wrong"})).status,
+                (await client.post("/webhook", json=update, headers={SECRET_HEADER: "s3cret"})).status,
+            ]
+        return statuses, lanes.updates
+
+    statuses, updates = asyncio.run(scenario())
+    assert statuses == [401, 401, 200]
+    assert [update.update_id for update in updates] == [1]
+
+
+def test_real_lanes_accept_unknown_update_types():
+    async def scenario():
+        seen = []
+        dp = Dispatcher()
+
+        @dp.message()
+        async def on_message(message: Message):
+            seen.append(message.text)
+
+        lanes = UpdateLanes(dp, Bot(token="123:abc"), {"light": (2, 10), "heavy": (1, 1)})
+        lanes.start()
+        server = WebhookServer(lanes, bot=None, secret="s3cret")
+        message = {"update_id": 2, "message": {"message_id": 1, "date": 0, "text": "привет",
+                                               "chat": {"id": 7, "type": "private"},
+                                               "from": {"id": 7, "is_bot": False, "first_name": "Анна"}}}
+        async with TestClient(TestServer(server.app())) as client:
+            statuses = [(await client.post("/webhook", json=update, headers={SECRET_HEADER: "s3cret"})).status
+                        for update in ({"update_id": 1}, message)]
+        await lanes.stop()
+        return statuses, seen
+
+    with warnings.catch_warnings():
+        # диспетчер предупреждает о незнакомом типе обновления и пропускает его
+        warnings.simplefilter("ignore", RuntimeWarning)
+        statuses, seen = asyncio.run(scenario())
+    assert statuses == [200, 200]
+    assert seen == ["привет"]
@@ -0,0 +1,54 @@
+import hmac
+import logging
+
+from aiogram.types import Update
+from aiohttp import web
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    # Приём обновлений от Telegram через локальный aiohttp-сервер.
+    # Запрос только проверяется и передаётся в UpdateLanes, ответ 200 уходит сразу; обработку
+    # выполняют воркеры полос. Если очередь переполнена, отвечаем 503 — Telegram повторит позже.
+    #
+    # Без секрета сервер не создаётся: иначе любой, кто достучался до порта, мог бы прислать
+    # обновление от имени админа.
+
+    def __init__(self, lanes, bot, path="/webhook", secret=None):
+        if not secret:
+            raise ValueError("Для webhook нужен секрет (WEBHOOK_SECRET)")
+        self.lanes = lanes
+        self.bot = bot
+        self.path = path
+        self.secret = secret
+        self._runner = None
+
+    async def handle(self, request):
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret):
+            return web.Response(status=401)
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        # битый JSON или не Update (ValidationError pydantic — тоже ValueError)
+        except ValueError:
+            return web.Response(status=400)
+        if not self.lanes.submit(update):
+            logging.warning("Очередь обновлений переполнена, Telegram повторит запрос позже")
+            return web.Response(status=503, headers={"Retry-After": "1"})
+        return web.Response()
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post(self.path, self.handle)
+        return app
+
+    async def start(self, host, port):
+        self._runner = web.AppRunner(self.app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        logging.info(f"Webhook-сервер слушает http://{host}:{port}{self.path}")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None